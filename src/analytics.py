@@ -0,0 +1,220 @@
+"""
+Analytics module
+
+Circulation statistics: loans per book and per member, issues and returns
+per day, and the average loan duration.
+
+`Library.stats` builds a `CirculationStats` once from the loan history,
+counting over the `LoanHistory` columns (with NumPy when it is installed),
+and from then on `Library.create_loan` and returns update it in O(1). The
+most borrowed books and most active members are kept ranked as the counts
+change, so a report never walks the loans.
+"""
+
+from __future__ import annotations
+import heapq
+from datetime import date, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+# ranked entries kept per top list; the most a report can ask for
+MAX_TOP = 100
+MAX_DAYS = 366
+
+
+class _Top:
+    """
+    The `size` keys with the highest counts.
+
+    Keys rank by count, ties by key (`_rank`). Counts only grow between
+    rebuilds, so a key outside the list can only enter it by outranking the
+    last entry.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.counts: Dict[str, int] = {}
+
+    def rebuild(self, counts: Dict[str, int]) -> None:
+        self.counts = dict(heapq.nsmallest(self.size, counts.items(), key=_rank))
+
+    def bump(self, key: str, count: int) -> None:
+        if key in self.counts or len(self.counts) < self.size:
+            self.counts[key] = count
+            return
+        last = max(self.counts.items(), key=_rank)
+        if _rank((key, count)) < _rank(last):
+            del self.counts[last[0]]
+            self.counts[key] = count
+
+    def ranked(self, n: int) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=_rank)[:n]
+
+
+def _rank(item: Tuple[str, int]) -> Tuple[int, str]:
+    # most counted first, ties in key order
+    return -item[1], item[0]
+
+
+class CirculationStats:
+    """
+    Circulation counters, updated as loans are issued and returned.
+
+    Attributes:
+        by_isbn, by_member (Dict[str, int]): Loans ever made per ISBN / member ID.
+        issued_by_day, returned_by_day (Dict[int, int]): Loans issued /
+            returned per date ordinal.
+        loan_days (int): Total days on loan over `timed_returns` returned
+            loans; loans returned before return dates were recorded are
+            left out.
+        total, active (int): Loans ever made, and loans not yet returned.
+    """
+
+    def __init__(self) -> None:
+        self.by_isbn: Dict[str, int] = {}
+        self.by_member: Dict[str, int] = {}
+        self.issued_by_day: Dict[int, int] = {}
+        self.returned_by_day: Dict[int, int] = {}
+        self.loan_days = 0
+        self.timed_returns = 0
+        self.total = 0
+        self.active = 0
+        self._top_books = _Top(MAX_TOP)
+        self._top_members = _Top(MAX_TOP)
+
+    @classmethod
+    def from_loans(cls, loans: Any) -> "CirculationStats":
+        """
+        Batch-compute the statistics of every loan in a `LoanStore`.
+
+        Returned loans are counted column-wise over the history arrays;
+        only the active loans are visited one by one.
+        """
+        stats = cls()
+        history = loans.history
+        stats.by_isbn = history.count_by_isbn()
+        stats.by_member = history.count_by_member()
+        stats.issued_by_day = history.count_by_issue_day()
+        stats.returned_by_day = history.count_by_return_day()
+        stats.loan_days, stats.timed_returns = history.loan_days()
+        stats.total = len(history)
+        for loan in loans.active.values():
+            stats._count_issue(loan.member_id, loan.isbn, loan.issue_date)
+        stats.active = len(loans.active)
+        stats._top_books.rebuild(stats.by_isbn)
+        stats._top_members.rebuild(stats.by_member)
+        return stats
+
+    def _count_issue(self, member_id: str, isbn: str, issued: date) -> None:
+        self.by_isbn[isbn] = self.by_isbn.get(isbn, 0) + 1
+        self.by_member[member_id] = self.by_member.get(member_id, 0) + 1
+        day = issued.toordinal()
+        self.issued_by_day[day] = self.issued_by_day.get(day, 0) + 1
+        self.total += 1
+
+    def record_issue(self, member_id: str, isbn: str, issued: date) -> None:
+        self._count_issue(member_id, isbn, issued)
+        self.active += 1
+        self._top_books.bump(isbn, self.by_isbn[isbn])
+        self._top_members.bump(member_id, self.by_member[member_id])
+
+    def record_return(self, issued: date, returned: Optional[date]) -> None:
+        self.active -= 1
+        if returned is not None:
+            day = returned.toordinal()
+            self.returned_by_day[day] = self.returned_by_day.get(day, 0) + 1
+            self.loan_days += (returned - issued).days
+            self.timed_returns += 1
+
+    def record_reopen(self, issued: date, returned: Optional[date]) -> None:
+        """Undo `record_return` for a returned loan marked active again."""
+        self.active += 1
+        if returned is not None:
+            day = returned.toordinal()
+            self.returned_by_day[day] -= 1
+            if not self.returned_by_day[day]:
+                del self.returned_by_day[day]
+            self.loan_days -= (returned - issued).days
+            self.timed_returns -= 1
+
+    def top_books(self, n: int = 10) -> List[Tuple[str, int]]:
+        """The `n` (at most `MAX_TOP`) most borrowed ISBNs with their loan counts."""
+        return self._top_books.ranked(n)
+
+    def top_members(self, n: int = 10) -> List[Tuple[str, int]]:
+        """The `n` (at most `MAX_TOP`) members with the most loans."""
+        return self._top_members.ranked(n)
+
+    def daily(self, start: date, end: date) -> List[Tuple[date, int, int]]:
+        """(day, loans issued, loans returned) for each day in [start, end]."""
+        first = start.toordinal()
+        return [(start + timedelta(days=i), self.issued_by_day.get(first + i, 0),
+                 self.returned_by_day.get(first + i, 0))
+                for i in range(end.toordinal() - first + 1)]
+
+    def average_loan_days(self) -> Optional[float]:
+        """Mean days between issue and return of returned loans, or None if there are none."""
+        return self.loan_days / self.timed_returns if self.timed_returns else None
+
+
+def parse_report_args(args: Mapping[str, str]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Reads the `top`, `days` and `today` query parameters of a stats request.
+
+    Returns:
+        (kwargs, errors): Keyword arguments for `circulation_report`, or field errors.
+    """
+    kwargs: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    for name, limit in (("top", MAX_TOP), ("days", MAX_DAYS)):
+        if args.get(name):
+            try:
+                kwargs[name] = int(args[name])
+            except ValueError:
+                kwargs[name] = 0
+            if not 1 <= kwargs[name] <= limit:
+                errors[name] = f"{name} must be a number from 1 to {limit}."
+    if args.get("today"):
+        try:
+            kwargs["today"] = date.fromisoformat(args["today"])
+        except ValueError:
+            errors["today"] = "today must be YYYY-MM-DD."
+    return kwargs, errors
+
+
+def circulation_report(library: Any, top: int = 10, days: int = 30,
+                       today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Summarize circulation from the library's precomputed statistics.
+
+    Args:
+        library (Library): The library instance.
+        top (int): Entries in the most-borrowed and most-active lists.
+        days (int): Days of issue/return volumes, ending with `today`.
+        today (date): Last day of the volumes; defaults to the current date.
+
+    Returns:
+        dict: {"total_loans", "active_loans", "average_loan_days",
+        "top_books", "top_members", "daily"}.
+    """
+    today = today or date.today()
+    top, days = min(top, MAX_TOP), min(days, MAX_DAYS)
+    with library.lock:
+        stats = library.stats
+        average = stats.average_loan_days()
+        top_books = []
+        for isbn, n in stats.top_books(top):
+            book = library.books.get(isbn)
+            top_books.append({"isbn": isbn, "title": book.title if book else None, "loans": n})
+        top_members = []
+        for member_id, n in stats.top_members(top):
+            member = library.members.get(member_id)
+            top_members.append({"member_id": member_id, "name": member.name if member else None, "loans": n})
+        return {
+            "total_loans": stats.total,
+            "active_loans": stats.active,
+            "average_loan_days": round(average, 2) if average is not None else None,
+            "top_books": top_books,
+            "top_members": top_members,
+            "daily": [{"date": day.isoformat(), "issued": issued, "returned": returned}
+                      for day, issued, returned in stats.daily(today - timedelta(days=days - 1), today)],
+        }
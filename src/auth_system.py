@@ -2,14 +2,125 @@
 Authentication module (Group F)
 
 Provides a simple username/password authentication system.
+
+Passwords are stored as salted scrypt hashes (PBKDF2-SHA256 where the
+interpreter's OpenSSL lacks scrypt). Plaintext entries from older
+databases are hashed once by `AuthSystem.migrate_passwords`, which the
+programs run at startup and commit; `authenticate` also hashes any it still
+meets (e.g. written by an older process). Because a slow hash on every
+login is expensive, successful verifications are remembered in a small
+bounded cache, and login attempts can be rate-limited per user and per
+client with token buckets.
 """
 
 from __future__ import annotations
-from typing import Dict, Any
+import base64
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, Tuple
+
+
+# scrypt cost: 16 MiB and roughly 30-60 ms per hash on current hardware
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+PBKDF2_ITERATIONS = 260_000
+SALT_BYTES = 16
+# successful (username, password) verifications remembered per process
+VERIFY_CACHE_SIZE = 1024
+# login attempts: a burst of LOGIN_BURST, then one more every 60 / LOGIN_RATE_PER_MIN seconds
+LOGIN_BURST = 10
+LOGIN_RATE_PER_MIN = 10.0
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def hash_password(password: str) -> str:
+    """
+    Returns a salted hash of `password` that records its algorithm and cost,
+    e.g. ``scrypt$16384$8$1$<salt>$<hash>``.
+    """
+    salt = secrets.token_bytes(SALT_BYTES)
+    if hasattr(hashlib, "scrypt"):
+        digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(("scrypt$", "pbkdf2_sha256$"))
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """
+    Checks `password` against a value produced by `hash_password`. A value
+    that is not a known hash is treated as a legacy plaintext password.
+    """
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+    try:
+        algorithm, *params, salt, digest = stored.split("$")
+        salt_b, digest_b = base64.b64decode(salt), base64.b64decode(digest)
+        if algorithm == "scrypt":
+            n, r, p = (int(x) for x in params)
+            actual = hashlib.scrypt(password.encode("utf-8"), salt=salt_b, n=n, r=r, p=p,
+                                    maxmem=128 * r * (n + p + 2))
+        else:
+            actual = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt_b, int(params[0]))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(actual, digest_b)
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by arbitrary strings (e.g. "user:alice", "ip:10.0.0.1").
+
+    Each key may spend `burst` tokens at once; tokens come back at
+    `rate_per_min` per minute. At most `max_keys` buckets are kept, the
+    least recently used being dropped first.
+    """
+
+    def __init__(self, burst: int = LOGIN_BURST, rate_per_min: float = LOGIN_RATE_PER_MIN,
+                 max_keys: int = 10_000) -> None:
+        self.burst = burst
+        self.rate = rate_per_min / 60.0
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, *keys: str) -> float:
+        """
+        Takes one token from every key's bucket if all of them have one.
+
+        Returns:
+            float: 0.0 if allowed, otherwise seconds until the attempt
+            would be allowed (no tokens are taken).
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = {}
+            for key in keys:
+                tokens, stamp = self._buckets.get(key, (float(self.burst), now))
+                levels[key] = min(float(self.burst), tokens + (now - stamp) * self.rate)
+            wait = max((1.0 - t) / self.rate for t in levels.values()) if levels else 0.0
+            if wait > 0:
+                return wait
+            for key, tokens in levels.items():
+                self._buckets[key] = (tokens - 1.0, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0.0
 
 
 class AuthSystem:
-    """Simple authentication system holding a username->password map.
+    """Simple authentication system holding a username->password hash map.
 
     This class provides serialization helpers so the user database can
     be persisted and restored by `storage.py`.
@@ -17,32 +128,139 @@ class AuthSystem:
 
     def __init__(self, users: Dict[str, str] | None = None) -> None:
         self.users: Dict[str, str] = dict(users or {})
+        # usernames changed since the last persistence commit
+        self._dirty: Set[str] = set()
+        # guards `users` and `_dirty` against concurrent registrations and saves
+        self.lock = threading.RLock()
+        self.login_limiter = RateLimiter()
+        # HMAC(username, password) -> stored hash it was verified against; keyed
+        # with a per-process secret so no password-equivalent value is kept
+        self._verified: "OrderedDict[bytes, str]" = OrderedDict()
+        self._cache_key = secrets.token_bytes(32)
 
     def authenticate(self, username: str, password: str) -> bool:
-        return self.users.get(username) == password
+        stored = self.users.get(username)
+        if stored is None:
+            return False
+        token = hmac.new(self._cache_key, f"{username}\0{password}".encode("utf-8"), hashlib.sha256).digest()
+        with self.lock:
+            if self._verified.get(token) == stored:
+                self._verified.move_to_end(token)
+                return True
+        # the slow hash runs without the lock so logins verify in parallel
+        if not verify_password(password, stored):
+            return False
+        if not is_hashed(stored):
+            # migrate a legacy plaintext password now that we know it is right
+            hashed = hash_password(password)
+            with self.lock:
+                if self.users.get(username) == stored:
+                    self.users[username] = stored = hashed
+                    self._dirty.add(username)
+        with self.lock:
+            self._verified[token] = stored
+            while len(self._verified) > VERIFY_CACHE_SIZE:
+                self._verified.popitem(last=False)
+        return True
+
+    def attempt_login(self, username: str, password: str, client: str = "") -> Tuple[bool, float]:
+        """
+        Rate-limited `authenticate` for network logins.
+
+        Args:
+            username (str): Claimed username.
+            password (str): Password to check.
+            client (str): Client address; attempts are limited per user and per client.
+
+        Returns:
+            (ok, retry_after): retry_after > 0 means the attempt was refused
+            without checking the password.
+        """
+        keys = [f"user:{username}"] + ([f"client:{client}"] if client else [])
+        retry_after = self.login_limiter.acquire(*keys)
+        if retry_after > 0:
+            return False, retry_after
+        return self.authenticate(username, password), 0.0
 
     def register_user(self, username: str, password: str) -> bool:
         if username in self.users:
             return False
-        self.users[username] = password
-        return True
+        hashed = hash_password(password)
+        with self.lock:
+            if username in self.users:
+                return False
+            self.users[username] = hashed
+            self._dirty.add(username)
+            return True
+
+    def mark_dirty(self, *usernames: str) -> None:
+        """Record usernames whose entries must be written by the next commit."""
+        with self.lock:
+            self._dirty.update(usernames)
+
+    def migrate_passwords(self) -> int:
+        """
+        Hash every password still stored in plaintext and mark it dirty;
+        commit afterwards to write the hashes.
+
+        Returns:
+            int: How many passwords were hashed.
+        """
+        with self.lock:
+            legacy = {u: p for u, p in self.users.items() if not is_hashed(p)}
+        hashed = {u: hash_password(p) for u, p in legacy.items()}
+        with self.lock:
+            for username, stored in hashed.items():
+                # skip entries changed meanwhile (e.g. by a login that migrated them)
+                if self.users.get(username) == legacy[username]:
+                    self.users[username] = stored
+                    self._dirty.add(username)
+        return len(hashed)
+
+    def has_changes(self) -> bool:
+        """True if some users changed since the last commit (e.g. a migrated password)."""
+        return bool(self._dirty)
+
+    def drain_changes(self) -> Set[str]:
+        """Return usernames changed since the last call and reset tracking."""
+        with self.lock:
+            changes = self._dirty
+            self._dirty = set()
+            return changes
+
+    def apply_change(self, username: str, stored: Optional[str]) -> None:
+        """Take over one user as another process stored it (None: deleted), without marking it dirty."""
+        with self.lock:
+            if stored is None:
+                self.users.pop(username, None)
+            else:
+                self.users[username] = stored
+
+    def replace_state(self, other: "AuthSystem") -> None:
+        """Take over the users of `other`, discarding pending changes."""
+        with self.lock:
+            self.users = other.users
+            self._dirty = set()
 
     def to_dict(self) -> Dict[str, Any]:
-        return {"users": dict(self.users)}
+        with self.lock:
+            return {"users": dict(self.users)}
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "AuthSystem":
-        users = (data.get("users") or {})
-        return cls(users=users)
+        """Restore users. Plaintext passwords from older databases are kept
+        as they are, so loading never pays for a hash; see `migrate_passwords`."""
+        return cls(users=data.get("users") or {})
 
 
 # Backwards-compatible helper functions that operate on plain dicts
 def authenticate(username: str, password: str, user_db: Dict[str, str]) -> bool:
-    return user_db.get(username) == password
+    stored: Optional[str] = user_db.get(username)
+    return stored is not None and verify_password(password, stored)
 
 
 def register_user(username: str, password: str, user_db: Dict[str, str]) -> bool:
     if username in user_db:
         return False
-    user_db[username] = password
-    return True
\ No newline at end of file
+    user_db[username] = hash_password(password)
+    return True
@@ -0,0 +1,246 @@
+"""
+Backup module
+
+Incremental, deduplicated backups of the library and users.
+
+Each collection (books, members, holds, users) is split into a fixed set
+of buckets by a hash of the entity key. Loans are chunked by loan ID range
+instead: IDs are sequential, so new loans and returns (which mostly touch
+recent loans) rewrite the newest chunks rather than random buckets across
+the whole collection. Every bucket is stored once under
+the SHA-256 of its canonical JSON, compressed, in ``objects/``. A backup
+itself is only a small manifest in ``manifests/`` listing the chunk
+hashes, so a backup writes just the buckets that changed since any
+earlier backup.
+
+Layout of a backup directory:
+    objects/<2 hex>/<sha256>    zlib-compressed JSON of one bucket
+    manifests/<backup id>.json  {"id", "created", "next_loan_id", "collections": {name: {bucket: sha256}}}
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import storage
+from auth_system import AuthSystem
+from library import Library
+
+# buckets per collection; changing it makes the next backup a full one
+BUCKETS = 1024
+# consecutive loan IDs per loans chunk
+LOAN_CHUNK = 1000
+COMPRESS_LEVEL = 6
+COLLECTIONS = ("books", "members", "loans", "holds", "users")
+
+_lock = threading.Lock()
+
+
+@dataclass
+class BackupResult:
+    """Outcome of `create_backup`: chunks referenced, chunks and bytes actually written."""
+    backup_id: str
+    chunks: int = 0
+    new_chunks: int = 0
+    bytes_written: int = 0
+
+
+def _bucket(name: str, key: str) -> str:
+    if name == "loans" and key.isdigit():
+        return f"r{int(key) // LOAN_CHUNK}"
+    return str(zlib.crc32(key.encode("utf-8")) % BUCKETS)
+
+
+def _object_path(root: Path, digest: str) -> Path:
+    return root / "objects" / digest[:2] / digest
+
+
+def _manifest_dir(root: Path) -> Path:
+    return root / "manifests"
+
+
+def create_backup(backup_dir: str | Path, library: Library, auth: AuthSystem,
+                  now: Optional[datetime] = None) -> BackupResult:
+    """
+    Back up the current in-memory state, writing only chunks not already stored.
+
+    Args:
+        backup_dir (str | Path): Directory holding the backup store.
+        library (Library): Library to back up.
+        auth (AuthSystem): Users to back up.
+        now (datetime): Timestamp of the backup; defaults to the current time.
+
+    Returns:
+        BackupResult: The new backup's id and what was written.
+    """
+    root = Path(backup_dir)
+    created = now or datetime.now()
+    # only the capture holds the library lock; writers keep running while it is serialized
+    data = library.capture()()
+    entities = {name: data[name] for name in ("books", "members", "loans", "holds")}
+    entities["users"] = auth.to_dict()["users"]
+
+    with _lock:
+        backup_id = created.strftime("%Y%m%dT%H%M%S.%f")
+        result = BackupResult(backup_id)
+        manifest: Dict[str, Any] = {"id": backup_id, "created": created.isoformat(),
+                                    "next_loan_id": data["next_loan_id"], "collections": {}}
+        for name in COLLECTIONS:
+            buckets: Dict[str, Dict[str, Any]] = {}
+            for key, value in entities[name].items():
+                buckets.setdefault(_bucket(name, key), {})[key] = value
+            hashes = {}
+            for bucket, content in buckets.items():
+                blob = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                digest = hashlib.sha256(blob).hexdigest()
+                hashes[bucket] = digest
+                result.chunks += 1
+                path = _object_path(root, digest)
+                if not path.exists():
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    packed = zlib.compress(blob, COMPRESS_LEVEL)
+                    storage.atomic_write(path, packed)
+                    result.new_chunks += 1
+                    result.bytes_written += len(packed)
+            manifest["collections"][name] = hashes
+        # the manifest goes last, so a backup only exists once all its chunks do
+        _manifest_dir(root).mkdir(parents=True, exist_ok=True)
+        payload = json.dumps(manifest, indent=1).encode("utf-8")
+        storage.atomic_write(_manifest_dir(root) / f"{backup_id}.json", payload)
+        result.bytes_written += len(payload)
+    return result
+
+
+def list_backups(backup_dir: str | Path) -> List[Dict[str, Any]]:
+    """Backups in the store as {"id", "created"} dicts, oldest first."""
+    mdir = _manifest_dir(Path(backup_dir))
+    if not mdir.exists():
+        return []
+    backups = []
+    for path in sorted(mdir.glob("*.json")):
+        with path.open("r", encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        backups.append({"id": manifest["id"], "created": datetime.fromisoformat(manifest["created"])})
+    return backups
+
+
+def _select(backup_dir: str | Path, backup_id: Optional[str], at: Optional[datetime]) -> str:
+    backups = list_backups(backup_dir)
+    if backup_id is not None:
+        if not any(b["id"] == backup_id for b in backups):
+            raise ValueError(f"Backup {backup_id} not found.")
+        return backup_id
+    candidates = [b for b in backups if at is None or b["created"] <= at]
+    if not candidates:
+        raise ValueError("No backup found" + (f" at or before {at.isoformat()}." if at else "."))
+    return candidates[-1]["id"]
+
+
+def read_backup(backup_dir: str | Path, backup_id: Optional[str] = None,
+                at: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Reassemble a backup as a `storage` snapshot dict.
+
+    Args:
+        backup_dir (str | Path): Directory holding the backup store.
+        backup_id (str): Backup to read; by default the newest one.
+        at (datetime): Point in time: the newest backup taken at or before it.
+
+    Raises:
+        ValueError: If no matching backup exists or a chunk is missing or corrupt.
+    """
+    root = Path(backup_dir)
+    backup_id = _select(root, backup_id, at)
+    with (_manifest_dir(root) / f"{backup_id}.json").open("r", encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    collections: Dict[str, Dict[str, Any]] = {}
+    for name in COLLECTIONS:
+        merged: Dict[str, Any] = {}
+        for digest in manifest["collections"].get(name, {}).values():
+            try:
+                blob = zlib.decompress(_object_path(root, digest).read_bytes())
+            except (OSError, zlib.error) as e:
+                raise ValueError(f"Backup {backup_id}: chunk {digest} is missing or corrupt.") from e
+            if hashlib.sha256(blob).hexdigest() != digest:
+                raise ValueError(f"Backup {backup_id}: chunk {digest} is corrupt.")
+            merged.update(json.loads(blob))
+        collections[name] = merged
+    return {
+        "library": {"books": collections["books"], "members": collections["members"],
+                    "loans": collections["loans"], "holds": collections["holds"],
+                    "next_loan_id": manifest["next_loan_id"]},
+        "auth": {"users": collections["users"]},
+    }
+
+
+def load_backup(backup_dir: str | Path, backup_id: Optional[str] = None,
+                at: Optional[datetime] = None) -> Tuple[Library, AuthSystem]:
+    """Like `storage.load_state`, but from a backup; see `read_backup`."""
+    data = read_backup(backup_dir, backup_id, at)
+    with storage.gc_paused():
+        return Library.from_dict(data["library"]), AuthSystem.from_dict(data["auth"])
+
+
+def restore(backup_dir: str | Path, db_path: str | Path, backup_id: Optional[str] = None,
+            at: Optional[datetime] = None) -> str:
+    """
+    Replace the database at `db_path` (any storage backend) with a backup,
+    so the next `storage.load_state(db_path)` returns the backed-up state.
+
+    Returns:
+        str: The id of the restored backup.
+    """
+    backup_id = _select(backup_dir, backup_id, at)
+    library, auth = load_backup(backup_dir, backup_id)
+    storage.save_state(db_path, library, auth)
+    return backup_id
+
+
+def prune(backup_dir: str | Path, keep_last: int = 24, keep_daily: int = 7,
+          keep_weekly: int = 4) -> List[str]:
+    """
+    Apply a retention policy and delete chunks no remaining backup uses.
+
+    Keeps the `keep_last` newest backups plus the newest backup of each of
+    the `keep_daily` most recent days and `keep_weekly` most recent ISO
+    weeks that have backups.
+
+    Returns:
+        List[str]: Ids of the deleted backups.
+    """
+    root = Path(backup_dir)
+    with _lock:
+        backups = list_backups(root)
+        newest_first = list(reversed(backups))
+        keep = {b["id"] for b in newest_first[:keep_last]}
+        for period, limit in ((lambda c: c.date(), keep_daily), (lambda c: c.isocalendar()[:2], keep_weekly)):
+            seen = []
+            for b in newest_first:
+                bucket = period(b["created"])
+                if bucket not in seen:
+                    if len(seen) == limit:
+                        break
+                    seen.append(bucket)
+                    keep.add(b["id"])
+        removed = [b["id"] for b in backups if b["id"] not in keep]
+        for backup_id in removed:
+            (_manifest_dir(root) / f"{backup_id}.json").unlink()
+
+        referenced = set()
+        for path in _manifest_dir(root).glob("*.json"):
+            with path.open("r", encoding="utf-8") as fh:
+                for hashes in json.load(fh)["collections"].values():
+                    referenced.update(hashes.values())
+        objects = root / "objects"
+        if objects.exists():
+            for path in objects.glob("*/*"):
+                if path.name not in referenced:
+                    os.remove(path)
+    return removed
@@ -0,0 +1,71 @@
+"""
+Backup benchmark
+
+Measures the incremental backup store (`backup.py`) on a synthetic
+database: the first (full) backup, a backup after a small number of
+changes, a point-in-time restore, and the bytes each one writes compared
+with copying the whole JSON snapshot.
+
+Usage:
+    python bench_backup.py [--books N] [--loans-per-book N] [--changes N] [--json]
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+from typing import Dict
+
+import backup
+import storage
+from auth_system import AuthSystem
+from bench_startup import synthetic_state, timed
+from library import Library
+
+
+def run(books: int, loans_per_book: int, changes: int) -> Dict[str, float]:
+    data = synthetic_state(books, books, books * loans_per_book)
+    library = Library.from_dict(data["library"])
+    auth = AuthSystem()
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as d:
+        store = os.path.join(d, "backups")
+        db = os.path.join(d, "library_db.json")
+        storage.save_state(db, library, auth)
+        results["snapshot_mb"] = os.path.getsize(db) / 2 ** 20
+
+        state = {}
+        results["full_backup_s"] = timed(lambda: state.update(full=backup.create_backup(store, library, auth)))
+        results["full_backup_mb_written"] = state["full"].bytes_written / 2 ** 20
+        results["full_backup_mb_per_s"] = results["snapshot_mb"] / results["full_backup_s"]
+
+        for i in range(changes):
+            library.update_book(f"b{i * 7 % books}", copies=i % 5)
+        results["incremental_backup_s"] = timed(lambda: state.update(inc=backup.create_backup(store, library, auth)))
+        results["incremental_mb_written"] = state["inc"].bytes_written / 2 ** 20
+        results["incremental_new_chunks"] = state["inc"].new_chunks
+
+        results["restore_s"] = timed(lambda: backup.restore(store, db, backup_id=state["full"].backup_id))
+        results["restore_mb_per_s"] = results["snapshot_mb"] / results["restore_s"]
+    return {k: round(v, 3) for k, v in results.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=100_000, help="books and members to generate")
+    parser.add_argument("--loans-per-book", type=int, default=10, help="loans generated per book")
+    parser.add_argument("--changes", type=int, default=100, help="books changed between the two backups")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+    results = run(args.books, args.loans_per_book, args.changes)
+    if args.json:
+        print(json.dumps({"books": args.books, "loans_per_book": args.loans_per_book,
+                          "changes": args.changes, "results": results}, indent=2))
+        return
+    for name, value in results.items():
+        print(f"{name:<28} {value:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Login benchmark
+
+Measures login throughput of AuthSystem: the slow path (a full scrypt or
+PBKDF2 verification per attempt), the verification cache hit path, and
+rejected attempts under a login storm that the rate limiter turns away
+before any hashing is done.
+
+Usage:
+    python bench_login.py [--seconds S] [--threads N] [--json]
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import threading
+import time
+from typing import Callable, Dict
+
+from auth_system import AuthSystem, RateLimiter
+
+
+def logins_per_second(attempt: Callable[[int], None], seconds: float, threads: int) -> float:
+    """Runs `attempt(i)` from `threads` threads for `seconds` and returns attempts per second."""
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(t: int) -> None:
+        n = 0
+        while time.perf_counter() < deadline:
+            attempt(t * 1_000_000 + n)
+            n += 1
+        counts[t] = n
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def run(seconds: float, threads: int) -> Dict[str, float]:
+    auth = AuthSystem()
+    auth.register_user("admin", "admin")
+    # unlimited, so only verification is measured
+    auth.login_limiter = RateLimiter(burst=10 ** 9, rate_per_min=10 ** 9)
+
+    def uncached(i: int) -> None:
+        auth._verified.clear()
+        auth.authenticate("admin", "admin")
+
+    def cached(i: int) -> None:
+        auth.attempt_login("admin", "admin", client=f"10.0.{i % 256}.1")
+
+    storm = AuthSystem(auth.to_dict()["users"])
+
+    def limited(i: int) -> None:
+        # one attacker guessing passwords from one address
+        storm.attempt_login("admin", f"guess{i}", client="203.0.113.7")
+
+    return {
+        "uncached_per_sec": round(logins_per_second(uncached, seconds, threads), 1),
+        "cached_per_sec": round(logins_per_second(cached, seconds, threads), 1),
+        "storm_per_sec": round(logins_per_second(limited, seconds, threads), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=2.0, help="duration of each case")
+    parser.add_argument("--threads", type=int, default=4, help="concurrent login threads")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+    results = run(args.seconds, args.threads)
+    if args.json:
+        print(json.dumps({"seconds": args.seconds, "threads": args.threads, "results": results}, indent=2))
+        return
+    print(f"{'case':<32} {'logins/s':>12}")
+    print(f"{'full hash verification':<32} {results['uncached_per_sec']:>12.1f}")
+    print(f"{'verification cache hit':<32} {results['cached_per_sec']:>12.1f}")
+    print(f"{'rate-limited password guessing':<32} {results['storm_per_sec']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
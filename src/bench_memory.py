@@ -0,0 +1,101 @@
+"""
+Memory benchmark
+
+Measures the bytes allocated per Book, Member and Loan object with
+tracemalloc, for the current slotted classes and for dict-backed
+replicas of the previous layout, so the saving is visible side by side.
+
+Usage:
+    python bench_memory.py [--count N] [--json]
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, List
+
+from book import Book
+from member import Member
+from library import Library
+
+
+# --- dict-backed replicas of the pre-__slots__ classes ---
+
+class DictBook:
+    def __init__(self, isbn: str, title: str, author: str, copies: int) -> None:
+        self.isbn = isbn
+        self.title = title
+        self.author = author
+        self.copies = copies
+
+
+class DictMember:
+    def __init__(self, member_id: str, name: str) -> None:
+        self.member_id = member_id
+        self.name = name
+        self.borrowed_books: List[str] = []
+
+
+@dataclass
+class DictLoan:
+    loan_id: str
+    member_id: str
+    isbn: str
+    issue_date: date
+    due_date: date
+    returned: bool = False
+
+
+def bytes_per_object(factory: Callable[[int], Any], count: int) -> float:
+    """Average bytes allocated per object created by `factory(i)`."""
+    # preallocate the list that keeps objects alive so only the objects are measured
+    keep: List[Any] = [None] * count
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        keep[i] = factory(i)
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return used / count
+
+
+def run(count: int) -> Dict[str, Dict[str, float]]:
+    # field values are shared across objects so only per-object overhead is measured
+    today = date.today()
+    title, author, name = "A Title", "An Author", "A Member"
+    ids = [str(i) for i in range(count)]
+    cases = {
+        "book": (lambda i: DictBook(ids[i], title, author, 1), lambda i: Book(ids[i], title, author, 1)),
+        "member": (lambda i: DictMember(ids[i], name), lambda i: Member(ids[i], name)),
+        "loan": (lambda i: DictLoan(ids[i], ids[i], ids[i], today, today),
+                 lambda i: Library.Loan(ids[i], ids[i], ids[i], today, today)),
+    }
+    results: Dict[str, Dict[str, float]] = {}
+    for entity, (before, after) in cases.items():
+        results[entity] = {
+            "dict_bytes": round(bytes_per_object(before, count), 1),
+            "slots_bytes": round(bytes_per_object(after, count), 1),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=100_000, help="objects to create per entity")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+    results = run(args.count)
+    if args.json:
+        print(json.dumps({"count": args.count, "results": results}, indent=2))
+        return
+    print(f"{'entity':<8} {'dict-backed':>12} {'slotted':>10} {'saved':>7}")
+    for entity, r in results.items():
+        saved = 100.0 * (1 - r["slots_bytes"] / r["dict_bytes"])
+        print(f"{entity:<8} {r['dict_bytes']:>10.1f} B {r['slots_bytes']:>8.1f} B {saved:>6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
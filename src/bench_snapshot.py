@@ -0,0 +1,52 @@
+"""
+Snapshot format benchmark
+
+Compares the JSON snapshot with the binary snapshot (`snapshot_binary.py`)
+on a synthetic database: file size, time to write a full snapshot and
+time for `storage.load_state` to read it back.
+
+Usage:
+    python bench_snapshot.py [--books N] [--loans-per-book N] [--json]
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+from typing import Dict
+
+import storage
+from bench_startup import synthetic_state, timed
+
+
+def run(books: int, loans_per_book: int) -> Dict[str, Dict[str, float]]:
+    data = synthetic_state(books, books, books * loans_per_book)
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as d:
+        for name, suffix, binary in (("json", ".json", False), ("binary", storage.BINARY_SUFFIX, True)):
+            path = os.path.join(d, "library_db" + suffix)
+            row = {"save_s": timed(lambda: storage.atomic_write(path, storage.encode_snapshot(data, binary)))}
+            row["file_mb"] = os.path.getsize(path) / 2 ** 20
+            row["load_s"] = timed(lambda: storage.load_state(path))
+            results[name] = {k: round(v, 3) for k, v in row.items()}
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=100_000, help="books and members to generate")
+    parser.add_argument("--loans-per-book", type=int, default=10, help="loans generated per book")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+    results = run(args.books, args.loans_per_book)
+    if args.json:
+        print(json.dumps({"books": args.books, "loans_per_book": args.loans_per_book, "results": results}, indent=2))
+        return
+    print(f"{'format':<10} {'file MB':>10} {'save s':>10} {'load s':>10}")
+    for name, row in results.items():
+        print(f"{name:<10} {row['file_mb']:>10} {row['save_s']:>10} {row['load_s']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Startup benchmark
+
+Writes a synthetic database and measures how long `storage.load_state`
+takes with eager and with lazy loading, together with the one-off cost
+the lazy mode pays later (first search, first history aggregation and
+first per-member loan lookup).
+
+Usage:
+    python bench_startup.py [--books N] [--loans-per-book N] [--json]
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Dict
+
+import storage
+
+
+WORDS = ("alpha", "beta", "garden", "river", "stone", "night", "shadow", "light",
+         "war", "peace", "ocean", "king", "queen", "winter", "summer", "city")
+
+
+def synthetic_state(books: int, members: int, loans: int, returned_ratio: float = 0.95,
+                    seed: int = 1) -> Dict[str, Any]:
+    """A `storage` snapshot dict with the given numbers of books, members and loans."""
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    loan_dicts: Dict[str, Dict[str, Any]] = {}
+    for i in range(1, loans + 1):
+        issued = start + timedelta(days=rng.randrange(1500))
+        loan_dicts[str(i)] = {
+            "loan_id": str(i), "member_id": f"m{rng.randrange(members)}", "isbn": f"b{rng.randrange(books)}",
+            "issue_date": issued.isoformat(), "due_date": (issued + timedelta(days=14)).isoformat(),
+            "returned": rng.random() < returned_ratio,
+        }
+    return {
+        "library": {
+            "books": {f"b{i}": {"isbn": f"b{i}", "title": " ".join(rng.sample(WORDS, 3)).title(),
+                                "author": f"Author {rng.randrange(books // 10 + 1)}", "copies": 3}
+                      for i in range(books)},
+            "members": {f"m{i}": {"member_id": f"m{i}", "name": f"Member {i}", "borrowed_books": []}
+                        for i in range(members)},
+            "loans": loan_dicts,
+            "next_loan_id": loans + 1,
+        },
+        "auth": {"users": {}},
+    }
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run(books: int, loans_per_book: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "library_db.json")
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(synthetic_state(books, books, books * loans_per_book), fh)
+        results = {"file_mb": round(os.path.getsize(path) / 2 ** 20, 1)}
+        results["eager_load_s"] = timed(lambda: storage.load_state(path))
+        state = {}
+        results["lazy_load_s"] = timed(lambda: state.update(lib=storage.load_state(path, lazy=True)[0]))
+        library = state["lib"]
+        results["lazy_first_search_s"] = timed(lambda: library.search_index.search("river"))
+        results["lazy_first_history_s"] = timed(library.circulation_counts)
+        results["lazy_first_member_loans_s"] = timed(lambda: library.loans_for_member("m1"))
+    return {k: round(v, 3) for k, v in results.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=100_000, help="books and members to generate")
+    parser.add_argument("--loans-per-book", type=int, default=10, help="loans generated per book")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+    results = run(args.books, args.loans_per_book)
+    if args.json:
+        print(json.dumps({"books": args.books, "loans_per_book": args.loans_per_book, "results": results}, indent=2))
+        return
+    for name, value in results.items():
+        print(f"{name:<28} {value:>10}")
+
+
+if __name__ == "__main__":
+    main()
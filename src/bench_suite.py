@@ -0,0 +1,178 @@
+"""
+Benchmark suite
+
+Times the core operations on synthetic libraries of 1k, 100k or 1M books,
+members and loans: `add_book`, `issue_book`, `return_book`,
+`search_by_title`/`search_by_author`, `Library.to_dict`/`from_dict`,
+`storage.save_state`/`load_state`, and Flask test-client calls to the main
+`/api` routes (skipped when Flask is not installed).
+
+Results are written as JSON, tagged with the current git commit, so two
+runs can be compared:
+
+    python bench_suite.py --scale 1k,100k --output before.json
+    python bench_suite.py --scale 1k,100k --output after.json --compare before.json
+
+Usage:
+    python bench_suite.py [--scale 1k,100k,1m] [--ops N] [--output FILE] [--compare FILE]
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from typing import Any, Callable, Dict, Optional
+
+import storage
+from auth_system import AuthSystem
+from bench_startup import synthetic_state
+from book import Book
+from issue_return import issue_book, return_book
+from library import Library
+from member import Member
+from search import search_by_title, search_by_author
+
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+# cases slower than this factor against the --compare baseline are flagged
+REGRESSION_FACTOR = 1.2
+
+Result = Dict[str, float]
+
+
+def measure(fn: Callable[[int], Any], ops: int) -> Result:
+    """Calls `fn(i)` for i in range(ops) and returns total and per-operation time."""
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    total = time.perf_counter() - start
+    return {"ops": ops, "total_s": round(total, 4), "per_op_us": round(total / ops * 1e6, 2)}
+
+
+def bench_library(size: int, ops: int, d: str) -> Dict[str, Result]:
+    data = synthetic_state(size, size, size)
+    library = Library.from_dict(data["library"])
+    auth = AuthSystem()
+    results: Dict[str, Result] = {}
+
+    results["add_book"] = measure(lambda i: library.add_book(Book(f"new{i}", f"New Title {i}", "Bench", 1)), ops)
+    members = [Member(f"bench{i}", f"Bench {i}") for i in range(ops)]
+    for member in members:
+        library.add_member(member)
+    results["issue_book"] = measure(lambda i: issue_book(library, f"new{i}", members[i]), ops)
+    results["return_book"] = measure(lambda i: return_book(library, f"new{i}", members[i]), ops)
+    results["search_by_title"] = measure(lambda i: search_by_title(library, ("river", "night", "ocean")[i % 3]), ops)
+    results["search_by_author"] = measure(lambda i: search_by_author(library, f"author {i}"), ops)
+
+    # whole-database operations run once per scale
+    state: Dict[str, Any] = {}
+    results["to_dict"] = measure(lambda i: state.update(data=library.to_dict()), 1)
+    results["from_dict"] = measure(lambda i: Library.from_dict(state["data"]), 1)
+    path = os.path.join(d, f"bench_{size}.json")
+    results["save_state"] = measure(lambda i: storage.save_state(path, library, auth), 1)
+    results["load_state"] = measure(lambda i: storage.load_state(path), 1)
+    return results
+
+
+def bench_api(size: int, ops: int, d: str) -> Optional[Dict[str, Result]]:
+    """Flask test-client timings, or None when Flask is not installed."""
+    try:
+        import flask  # noqa: F401
+    except ImportError:
+        return None
+    # webapp loads its database at import time, so point it at a scratch file first
+    os.environ["LMS_DB_PATH"] = os.path.join(d, "bench_api.json")
+    import webapp
+
+    webapp.library.replace_state(Library.from_dict(synthetic_state(size, size, size)["library"]))
+    client = webapp.app.test_client()
+    client.post("/api/login", json={"username": "admin", "password": "admin"})
+    for i in range(ops):
+        webapp.library.add_book(Book(f"api{i}", f"Api Title {i}", "Bench", 1))
+        webapp.library.add_member(Member(f"apim{i}", f"Api {i}"))
+
+    def call(method: str, target: str, body: Optional[dict] = None) -> Callable[[int], Any]:
+        return lambda i: client.open(target.format(i=i), method=method, json=body and {
+            k: v.format(i=i) for k, v in body.items()})
+
+    return {
+        "GET /api/books": measure(call("GET", "/api/books?limit=50&sort=title"), ops),
+        "GET /api/books?q=": measure(call("GET", "/api/books?q=river&limit=50"), ops),
+        "GET /api/members": measure(call("GET", "/api/members?limit=50"), ops),
+        "GET /api/loans": measure(call("GET", "/api/loans?limit=50&returned=false"), ops),
+        "GET /api/loans/overdue": measure(call("GET", "/api/loans/overdue?limit=50"), ops),
+        "POST /api/issue": measure(call("POST", "/api/issue", {"member_id": "apim{i}", "isbn": "api{i}"}), ops),
+        "POST /api/return": measure(call("POST", "/api/return", {"member_id": "apim{i}", "isbn": "api{i}"}), ops),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(scales: list, ops: int) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"commit": git_commit(), "python": platform.python_version(), "ops": ops, "scales": {}}
+    with tempfile.TemporaryDirectory() as d:
+        for name in scales:
+            size = SCALES[name]
+            entry = {"size": size, "library": bench_library(size, ops, d)}
+            api = bench_api(size, ops, d)
+            if api is None:
+                entry["api_skipped"] = "flask is not installed"
+            else:
+                entry["api"] = api
+            report["scales"][name] = entry
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> list:
+    """Rows of (scale, case, baseline per-op us, current per-op us, ratio) for cases in both reports."""
+    rows = []
+    for scale, entry in report["scales"].items():
+        base = baseline.get("scales", {}).get(scale, {})
+        for group in ("library", "api"):
+            for case, result in entry.get(group, {}).items():
+                old = base.get(group, {}).get(case)
+                if old and old["per_op_us"]:
+                    rows.append((scale, case, old["per_op_us"], result["per_op_us"],
+                                 result["per_op_us"] / old["per_op_us"]))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", default="1k", help="comma-separated scales: " + ", ".join(SCALES))
+    parser.add_argument("--ops", type=int, default=1000, help="operations per per-item case")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+    scales = [s.strip().lower() for s in args.scale.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scale(s): {', '.join(unknown)}")
+
+    report = run(scales, args.ops)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        print(f"{'scale':<6} {'case':<24} {'before us':>12} {'after us':>12} {'ratio':>7}")
+        for scale, case, old, new, ratio in compare(report, baseline):
+            flag = "  <-- slower" if ratio > REGRESSION_FACTOR else ""
+            print(f"{scale:<6} {case:<24} {old:>12.2f} {new:>12.2f} {ratio:>7.2f}{flag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,9 @@ class Book:
         copies (int): Number of copies available in the library.
     """
 
+    # no per-instance __dict__: large catalogues hold hundreds of thousands of books
+    __slots__ = ("isbn", "title", "author", "copies")
+
     def __init__(self, isbn: str, title: str, author: str, copies: int) -> None:
         if copies < 0:
             raise ValueError("Number of copies cannot be negative.")
@@ -0,0 +1,292 @@
+"""
+Bulk import/export module
+
+Streams books and members in and out of the library as CSV or NDJSON
+(one JSON object per line). Imports read one row at a time, validate it
+with the same rules as the web API, and apply rows in batches with one
+persistence commit per batch. Exports write one row at a time.
+"""
+
+from __future__ import annotations
+import csv
+import io
+import itertools
+import json
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from book import Book
+from member import Member
+from library import Library
+
+
+FORMATS = ("csv", "ndjson")
+BATCH_SIZE = 500
+# keys copied per library lock acquisition while exporting
+EXPORT_CHUNK = 1000
+# keep at most this many row errors in a report; `failed` still counts all of them
+MAX_REPORTED_ERRORS = 1000
+
+BOOK_FIELDS = ("isbn", "title", "author", "copies")
+MEMBER_FIELDS = ("member_id", "name")
+
+
+@dataclass
+class ImportReport:
+    """Outcome of a bulk import. `errors` holds {"row": n, "errors": {field: message}} entries."""
+    imported: int = 0
+    failed: int = 0
+    batches: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"imported": self.imported, "failed": self.failed, "batches": self.batches, "errors": self.errors}
+
+
+def format_for_path(path: str) -> str:
+    """Guess the format from a file name: .csv is CSV, anything else NDJSON."""
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+# --- Validation (shared with webapp.py) ---
+
+def validate_book(data: Dict[str, Any]) -> Tuple[Optional[Book], Dict[str, str]]:
+    """
+    Validates book fields the way POST /api/books does.
+
+    Returns:
+        (book, errors): The Book when valid, otherwise None and field errors.
+    """
+    errors: Dict[str, str] = {}
+    isbn = str(data.get('isbn') or '').strip()
+    title = str(data.get('title') or '').strip()
+    author = str(data.get('author') or '').strip()
+    copies_raw = data.get('copies', 0)
+    if not isbn:
+        errors['isbn'] = 'ISBN is required.'
+    if not title:
+        errors['title'] = 'Title is required.'
+    if copies_raw is None:
+        copies_raw = 0
+    copies = 0
+    try:
+        copies = int(copies_raw)
+        if copies < 0:
+            errors['copies'] = 'Copies must be >= 0.'
+    except Exception:
+        errors['copies'] = 'Copies must be a number.'
+    if errors:
+        return None, errors
+    return Book(isbn, title, author, copies), errors
+
+
+def validate_member(data: Dict[str, Any]) -> Tuple[Optional[Member], Dict[str, str]]:
+    """
+    Validates member fields the way POST /api/members does.
+
+    Returns:
+        (member, errors): The Member when valid, otherwise None and field errors.
+    """
+    errors: Dict[str, str] = {}
+    member_id = str(data.get('member_id') or '').strip()
+    name = str(data.get('name') or '').strip()
+    if not member_id:
+        errors['member_id'] = 'Member ID is required.'
+    if not name:
+        errors['name'] = 'Name is required.'
+    if errors:
+        return None, errors
+    return Member(member_id, name), errors
+
+
+# --- Reading / writing ---
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[Any]:
+    """
+    Yields rows from a text stream without reading it all into memory.
+
+    CSV rows are dicts keyed by the header line. NDJSON lines are parsed
+    individually; a line that is not a JSON object is yielded as a
+    ValueError so the importer can report it against its row number.
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    if fmt != "ndjson":
+        raise ValueError(f"Unknown format '{fmt}'. Expected one of: {', '.join(FORMATS)}.")
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield ValueError(f"Invalid JSON: {e.msg}")
+            continue
+        yield row if isinstance(row, dict) else ValueError("Expected a JSON object.")
+
+
+def encode_rows(rows: Iterable[Dict[str, Any]], fmt: str, fields: Tuple[str, ...]) -> Iterator[str]:
+    """Yields the text of each row in turn; CSV output starts with the header line."""
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=list(fields), extrasaction="ignore")
+        writer.writeheader()
+        for row in itertools.chain([None], rows):
+            if row is not None:
+                writer.writerow(row)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    elif fmt == "ndjson":
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+    else:
+        raise ValueError(f"Unknown format '{fmt}'. Expected one of: {', '.join(FORMATS)}.")
+
+
+def write_rows(out: TextIO, rows: Iterable[Dict[str, Any]], fmt: str, fields: Tuple[str, ...]) -> int:
+    """Writes rows one at a time and returns how many were written."""
+    count = -1 if fmt == "csv" else 0
+    for chunk in encode_rows(rows, fmt, fields):
+        out.write(chunk)
+        count += 1
+    return count
+
+
+# --- Import ---
+
+def _import(rows: Iterable[Any], validate: Callable, apply: Callable, commit: Optional[Callable[[], None]],
+            batch_size: int, lock: Optional[threading.RLock]) -> ImportReport:
+    report = ImportReport()
+    batch: List[Any] = []
+
+    def flush() -> None:
+        if not batch:
+            return
+        with lock or nullcontext():
+            for entity in batch:
+                apply(entity)
+            if commit is not None:
+                commit()
+        report.imported += len(batch)
+        report.batches += 1
+        batch.clear()
+
+    for n, row in enumerate(rows, start=1):
+        if isinstance(row, ValueError):
+            entity, errors = None, {"row": str(row)}
+        else:
+            entity, errors = validate(row)
+        if entity is None:
+            report.failed += 1
+            if len(report.errors) < MAX_REPORTED_ERRORS:
+                report.errors.append({"row": n, "errors": errors})
+            continue
+        batch.append(entity)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return report
+
+
+def import_books(library: Library, rows: Iterable[Any], commit: Optional[Callable[[], None]] = None,
+                 batch_size: int = BATCH_SIZE, lock: Optional[threading.RLock] = None) -> ImportReport:
+    """
+    Adds books from `rows` (see `read_rows`) to the library.
+
+    Valid rows are applied with `Library.add_book` in batches of
+    `batch_size`; `commit` runs once after each batch (e.g. a
+    `storage.commit`). If `lock` is given it is held per batch, not for
+    the whole import.
+    """
+    return _import(rows, validate_book, library.add_book, commit, batch_size, lock)
+
+
+def import_members(library: Library, rows: Iterable[Any], commit: Optional[Callable[[], None]] = None,
+                   batch_size: int = BATCH_SIZE, lock: Optional[threading.RLock] = None) -> ImportReport:
+    """
+    Registers members from `rows`; see `import_books` for batching.
+    Existing member IDs are updated with the new name and keep their loans.
+    """
+    def apply(member: Member) -> None:
+        if library.rename_member(member.member_id, member.name) is None:
+            library.add_member(member)
+
+    return _import(rows, validate_member, apply, commit, batch_size, lock)
+
+
+# --- Export ---
+
+def _iter_keys(library: Library, collection: Dict[str, Any]) -> Iterator[str]:
+    """
+    Yields the keys of `collection` in insertion order, copying
+    `EXPORT_CHUNK` of them at a time under the library lock, so a long
+    export neither holds the lock nor copies every key up front.
+
+    When the library changed between two chunks, iteration resumes after
+    the newest exported key that still exists. Keys added meanwhile are
+    appended to the dict and so are still exported.
+    """
+    it: Optional[Iterator[str]] = None
+    chunk: List[str] = []
+    count = version = 0
+    while True:
+        with library.lock:
+            if it is None:
+                it = iter(collection)
+            elif library.version != version:
+                it = _resume(collection, chunk, count)
+            chunk = list(itertools.islice(it, EXPORT_CHUNK))
+            version = library.version
+        if not chunk:
+            return
+        count += len(chunk)
+        yield from chunk
+
+
+def _resume(collection: Dict[str, Any], chunk: List[str], count: int) -> Iterator[str]:
+    """A fresh iterator over `collection` positioned after the exported `chunk` (`count` keys so far)."""
+    it = iter(collection)
+    # nothing up to the last exported key was removed: it is still at the same position
+    if next(itertools.islice(it, count - 1, None), None) == chunk[-1]:
+        return it
+    anchor = next((key for key in reversed(chunk) if key in collection), None)
+    it = iter(collection)
+    if anchor is None:
+        # the whole chunk was removed meanwhile; continue from its position
+        return itertools.islice(it, count - len(chunk), None)
+    for key in it:
+        if key == anchor:
+            break
+    return it
+
+
+def iter_books(library: Library) -> Iterator[Dict[str, Any]]:
+    """
+    Yields book dicts one at a time. ISBNs are read in chunks (see
+    `_iter_keys`), so concurrent additions or removals do not break a
+    long export.
+    """
+    for isbn in _iter_keys(library, library.books):
+        book = library.books.get(isbn)
+        if book is not None:
+            yield book.to_dict()
+
+
+def iter_members(library: Library) -> Iterator[Dict[str, Any]]:
+    """Yields member dicts (without borrowed books) one at a time."""
+    for mid in _iter_keys(library, library.members):
+        member = library.members.get(mid)
+        if member is not None:
+            yield {"member_id": member.member_id, "name": member.name}
+
+
+def export_books(library: Library, out: TextIO, fmt: str) -> int:
+    return write_rows(out, iter_books(library), fmt, BOOK_FIELDS)
+
+
+def export_members(library: Library, out: TextIO, fmt: str) -> int:
+    return write_rows(out, iter_members(library), fmt, MEMBER_FIELDS)
@@ -1,17 +1,220 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
+import tkinter.font as tkfont
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
 
 from book import Book
 from member import Member
 from library import Library
 from issue_return import issue_book, return_book
-from search import search_by_title, search_by_author, search_by_isbn
+from search import search_by_title, search_by_author, search_by_isbn, search_books
 from auth_system import AuthSystem
 import storage
-from pathlib import Path
-
-
-DB_PATH = "library_db.json"
+import backup
+import os
+
+
+# a .db/.sqlite/.sqlite3 path selects the SQLite backend
+DB_PATH = os.environ.get("LMS_DB_PATH", "library_db.json")
+BACKUP_DIR = os.environ.get("LMS_BACKUP_DIR", "backups")
+# wait this long after the last keystroke before searching
+SEARCH_DELAY_MS = 150
+
+
+class VirtualList(ttk.Frame):
+    """
+    A scrollable list that only keeps the rows currently on screen in its
+    Listbox.
+
+    Rows are identified by keys (ISBNs, member IDs); `format_row(key)` builds
+    a row's text when it scrolls into view, so the cost of rendering does not
+    grow with the number of rows. `set_keys` replaces the rows after
+    additions or removals, `refresh_rows` re-renders individual rows after
+    they changed.
+    """
+
+    def __init__(self, master, format_row: Callable[[str], str]) -> None:
+        super().__init__(master)
+        self.format_row = format_row
+        self.row_keys: List[str] = []
+        self.first = 0
+        self._selected: Optional[str] = None
+        self.listbox = tk.Listbox(self, exportselection=False)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._line_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1
+        self.listbox.bind("<Configure>", lambda e: self._render())
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units"))
+        self.listbox.bind("<Button-4>", lambda e: self.scroll(-1, "units"))
+        self.listbox.bind("<Button-5>", lambda e: self.scroll(1, "units"))
+        self.listbox.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        self.listbox.bind("<Next>", lambda e: self.scroll(1, "pages"))
+
+    def visible_count(self) -> int:
+        height = self.listbox.winfo_height()
+        if height <= 1:
+            # not mapped yet
+            return int(self.listbox.cget("height"))
+        return max(1, height // self._line_height)
+
+    def set_keys(self, keys: Sequence[str]) -> None:
+        """Show `keys` as the rows, keeping the scroll position where possible."""
+        self.row_keys = list(keys)
+        self._render()
+
+    def refresh_rows(self, *keys: str) -> None:
+        """Re-render the rows of `keys` that are on screen; off-screen rows render when scrolled to."""
+        changed = set(keys)
+        for offset, key in enumerate(self.row_keys[self.first:self.first + self.listbox.size()]):
+            if key in changed:
+                self.listbox.delete(offset)
+                self.listbox.insert(offset, self.format_row(key))
+                if key == self._selected:
+                    self.listbox.selection_set(offset)
+
+    def selected_key(self) -> Optional[str]:
+        return self._selected
+
+    def scroll(self, number: int, what: str = "units") -> None:
+        step = self.visible_count() if what == "pages" else 1
+        self.first += number * step
+        self._render()
+
+    def _on_scroll(self, action: str, *args: str) -> None:
+        if action == "moveto":
+            self.first = int(float(args[0]) * len(self.row_keys))
+            self._render()
+        else:
+            self.scroll(int(args[0]), args[1])
+
+    def _on_select(self, event=None) -> None:
+        sel = self.listbox.curselection()
+        if sel:
+            self._selected = self.row_keys[self.first + sel[0]]
+
+    def _render(self) -> None:
+        rows = self.visible_count()
+        self.first = max(0, min(self.first, len(self.row_keys) - rows))
+        window = self.row_keys[self.first:self.first + rows]
+        self.listbox.delete(0, tk.END)
+        for key in window:
+            self.listbox.insert(tk.END, self.format_row(key))
+        if self._selected in window:
+            self.listbox.selection_set(window.index(self._selected))
+        total = max(len(self.row_keys), 1)
+        self.scrollbar.set(self.first / total, min(1.0, (self.first + rows) / total))
+
+
+class Task:
+    """Handle given to work running on a `TaskExecutor` worker thread."""
+
+    def __init__(self, executor: "TaskExecutor", channel: Optional[str], on_done: Optional[Callable],
+                 on_error: Optional[Callable], on_progress: Optional[Callable]) -> None:
+        self._executor = executor
+        self.channel = channel
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        # set when a newer task on the same channel was submitted
+        self.cancelled = False
+
+    def progress(self, message: str) -> None:
+        """Report progress; delivered to `on_progress` on the Tk thread."""
+        self._executor._events.put((self, "progress", message))
+
+
+class TaskExecutor:
+    """
+    Runs slow work (saving, backups, searches) on a thread pool and hands
+    progress and results back to the Tk main loop, which polls for them
+    with `after()`; Tk widgets must only be touched from the main thread.
+
+    Tasks submitted on the same channel supersede each other: a new search
+    cancels the previous one, which is skipped if it has not started yet
+    and whose result is dropped otherwise.
+    """
+
+    POLL_MS = 30
+
+    def __init__(self, widget, max_workers: int = 2) -> None:
+        self.widget = widget
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gui-task")
+        self._events: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._latest: Dict[str, Task] = {}
+        self._pending = 0
+        self._polling = False
+
+    def submit(self, work: Callable[[Task], Any], on_done: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None,
+               on_progress: Optional[Callable[[str], None]] = None, channel: Optional[str] = None) -> Task:
+        """
+        Runs `work(task)` on a worker thread. Must be called from the Tk thread.
+
+        Args:
+            work (Callable): Receives the `Task`; may call `task.progress()` and
+                should stop early once `task.cancelled` is set.
+            on_done (Callable): Called on the Tk thread with the result.
+            on_error (Callable): Called on the Tk thread with the exception raised by `work`.
+            on_progress (Callable): Called on the Tk thread with each progress message.
+            channel (str): Tasks on the same channel cancel their predecessors.
+
+        Returns:
+            Task: The submitted task.
+        """
+        task = Task(self, channel, on_done, on_error, on_progress)
+        if channel is not None:
+            previous = self._latest.get(channel)
+            if previous is not None:
+                previous.cancelled = True
+            self._latest[channel] = task
+        self._pending += 1
+        self._pool.submit(self._run, task, work)
+        self._schedule_poll()
+        return task
+
+    def _run(self, task: Task, work: Callable[[Task], Any]) -> None:
+        if task.cancelled:
+            self._events.put((task, "cancelled", None))
+            return
+        try:
+            result = work(task)
+        except Exception as e:
+            self._events.put((task, "error", e))
+        else:
+            self._events.put((task, "done", result))
+
+    def _schedule_poll(self) -> None:
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.POLL_MS, self.poll)
+
+    def poll(self) -> None:
+        """Deliver queued progress messages and results; runs on the Tk thread."""
+        self._polling = False
+        while True:
+            try:
+                task, kind, value = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind != "progress":
+                self._pending -= 1
+                if self._latest.get(task.channel) is task:
+                    del self._latest[task.channel]
+            callback = {"done": task.on_done, "error": task.on_error, "progress": task.on_progress}.get(kind)
+            if callback is not None and not task.cancelled:
+                callback(value)
+        if self._pending:
+            self._schedule_poll()
+
+    def shutdown(self) -> None:
+        """Cancel channel tasks (searches) and wait for the others (e.g. a save) to finish."""
+        for task in self._latest.values():
+            task.cancelled = True
+        self._pool.shutdown(wait=True)
 
 
 class LibraryGUI(tk.Tk):
@@ -45,7 +248,11 @@ class LibraryGUI(tk.Tk):
         ttk.Button(btn_frame, text="Save", command=self.save_state).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(btn_frame, text="Backup", command=self.create_backup).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(btn_frame, text="Refresh", command=self.refresh_all).pack(side=tk.RIGHT, padx=5, pady=5)
+        self.status = ttk.Label(btn_frame, text="")
+        self.status.pack(side=tk.LEFT, padx=10)
 
+        self.tasks = TaskExecutor(self)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.refresh_all()
 
     def create_books_tab(self):
@@ -55,7 +262,7 @@ class LibraryGUI(tk.Tk):
         left = ttk.Frame(frame)
         left.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        self.books_list = tk.Listbox(left)
+        self.books_list = VirtualList(left, self.format_book)
         self.books_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
         right = ttk.Frame(frame)
@@ -72,7 +279,7 @@ class LibraryGUI(tk.Tk):
         left = ttk.Frame(frame)
         left.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        self.members_list = tk.Listbox(left)
+        self.members_list = VirtualList(left, self.format_member)
         self.members_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
         right = ttk.Frame(frame)
@@ -109,12 +316,17 @@ class LibraryGUI(tk.Tk):
         f.pack(fill=tk.X, padx=10, pady=10)
 
         self.search_var = tk.StringVar()
+        # search as you type, once typing pauses
+        self._search_after: Optional[str] = None
+        self.search_var.trace_add("write", lambda *args: self._schedule_search())
         ttk.Entry(f, textvariable=self.search_var, width=60).pack(side=tk.LEFT, padx=5)
         self.search_type = tk.StringVar(value="title")
-        ttk.Combobox(f, textvariable=self.search_type, values=["title", "author", "isbn"], width=10).pack(side=tk.LEFT)
+        search_type = ttk.Combobox(f, textvariable=self.search_type, values=["title", "author", "isbn", "any"], width=10)
+        search_type.pack(side=tk.LEFT)
+        search_type.bind("<<ComboboxSelected>>", lambda e: self._schedule_search())
         ttk.Button(f, text="Search", command=self.search_action).pack(side=tk.LEFT, padx=5)
 
-        self.search_results = tk.Listbox(frame)
+        self.search_results = VirtualList(frame, self.format_book)
         self.search_results.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
     def create_admin_tab(self):
@@ -143,14 +355,22 @@ class LibraryGUI(tk.Tk):
         self.refresh_members()
 
     def refresh_books(self):
-        self.books_list.delete(0, tk.END)
-        for book in self.library.list_books():
-            self.books_list.insert(tk.END, f"{book.title} | {book.author} | ISBN:{book.isbn} | copies:{book.copies}")
+        self.books_list.set_keys(list(self.library.books))
 
     def refresh_members(self):
-        self.members_list.delete(0, tk.END)
-        for m in self.library.list_members():
-            self.members_list.insert(tk.END, f"{m.member_id} | {m.name} | borrowed:{len(m.borrowed_books)}")
+        self.members_list.set_keys(list(self.library.members))
+
+    def format_book(self, isbn: str) -> str:
+        book = self.library.books.get(isbn)
+        if book is None:
+            return f"(removed) ISBN:{isbn}"
+        return f"{book.title} | {book.author} | ISBN:{book.isbn} | copies:{book.copies}"
+
+    def format_member(self, member_id: str) -> str:
+        m = self.library.members.get(member_id)
+        if m is None:
+            return f"(removed) {member_id}"
+        return f"{m.member_id} | {m.name} | borrowed:{len(m.borrowed_books)}"
 
     def add_book_popup(self):
         if not self.logged_in:
@@ -178,16 +398,9 @@ class LibraryGUI(tk.Tk):
         if not self.logged_in:
             messagebox.showwarning("Permission", "Login as librarian to remove books.")
             return
-        sel = self.books_list.curselection()
-        if not sel:
-            return
-        text = self.books_list.get(sel[0])
-        # ISBN is like '... ISBN:xxx ...'
-        import re
-        m = re.search(r"ISBN:([^\s|]+)", text)
-        if not m:
+        isbn = self.books_list.selected_key()
+        if isbn is None:
             return
-        isbn = m.group(1)
         if messagebox.askyesno("Confirm", f"Remove book {isbn}?"):
             if self.library.remove_book(isbn):
                 messagebox.showinfo("Removed", f"Book {isbn} removed.")
@@ -196,11 +409,10 @@ class LibraryGUI(tk.Tk):
                 messagebox.showerror("Error", "Book not found.")
 
     def view_book_details(self):
-        sel = self.books_list.curselection()
-        if not sel:
+        isbn = self.books_list.selected_key()
+        if isbn is None:
             return
-        text = self.books_list.get(sel[0])
-        messagebox.showinfo("Book", text)
+        messagebox.showinfo("Book", self.format_book(isbn))
 
     def add_member_popup(self):
         member_id = simpledialog.askstring("Member ID", "Enter member ID:")
@@ -213,11 +425,10 @@ class LibraryGUI(tk.Tk):
         self.refresh_members()
 
     def view_member_details(self):
-        sel = self.members_list.curselection()
-        if not sel:
+        member_id = self.members_list.selected_key()
+        if member_id is None:
             return
-        text = self.members_list.get(sel[0])
-        messagebox.showinfo("Member", text)
+        messagebox.showinfo("Member", self.format_member(member_id))
 
     def issue_book_action(self):
         member_id = self.issue_member.get().strip()
@@ -231,7 +442,9 @@ class LibraryGUI(tk.Tk):
             return
         ok, msg = issue_book(self.library, isbn, member)
         self.issue_msg.config(text=msg)
-        self.refresh_all()
+        # only the two affected rows change
+        self.books_list.refresh_rows(isbn)
+        self.members_list.refresh_rows(member_id)
 
     def return_book_action(self):
         member_id = self.issue_member.get().strip()
@@ -245,22 +458,38 @@ class LibraryGUI(tk.Tk):
             return
         ok, msg = return_book(self.library, isbn, member)
         self.issue_msg.config(text=msg)
-        self.refresh_all()
+        self.books_list.refresh_rows(isbn)
+        self.members_list.refresh_rows(member_id)
+
+    def _schedule_search(self):
+        if self._search_after is not None:
+            self.after_cancel(self._search_after)
+        self._search_after = self.after(SEARCH_DELAY_MS, self.search_action)
 
     def search_action(self):
+        self._search_after = None
         q = self.search_var.get().strip()
-        if not q:
-            return
         t = self.search_type.get()
-        if t == "title":
-            res = search_by_title(self.library, q)
-        elif t == "author":
-            res = search_by_author(self.library, q)
-        else:
-            res = search_by_isbn(self.library, q)
-        self.search_results.delete(0, tk.END)
-        for b in res:
-            self.search_results.insert(tk.END, f"{b.title} | {b.author} | ISBN:{b.isbn} | copies:{b.copies}")
+
+        def work(task):
+            if not q:
+                return []
+            if t == "title":
+                res = search_by_title(self.library, q)
+            elif t == "author":
+                res = search_by_author(self.library, q)
+            elif t == "any":
+                res = search_books(self.library, q)
+            else:
+                res = search_by_isbn(self.library, q)
+            return [] if task.cancelled else [b.isbn for b in res]
+
+        def show(isbns):
+            self.search_results.first = 0
+            self.search_results.set_keys(isbns)
+
+        self.tasks.submit(work, on_done=show, channel="search",
+                          on_error=lambda e: messagebox.showerror("Error", f"Search failed: {e}"))
 
     def login_action(self):
         u = self.user_entry.get().strip()
@@ -288,25 +517,44 @@ class LibraryGUI(tk.Tk):
             messagebox.showerror("Error", "Username already exists")
 
     def save_state(self):
-        try:
+        def work(task):
+            task.progress("Saving...")
             storage.save_state(DB_PATH, self.library, self.auth)
+
+        def done(_):
+            self.status.config(text="")
             messagebox.showinfo("Saved", "State saved to disk.")
-        except Exception as e:
+
+        def failed(e):
+            self.status.config(text="")
             messagebox.showerror("Error", f"Failed to save: {e}")
 
+        self.tasks.submit(work, on_done=done, on_error=failed, on_progress=lambda m: self.status.config(text=m))
+
     def create_backup(self):
-        p = Path("backups")
-        p.mkdir(parents=True, exist_ok=True)
-        import shutil, datetime
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        dest = p / f"library_db_{timestamp}.json"
-        try:
-            storage.save_state(DB_PATH, self.library, self.auth)
-            shutil.copy2(DB_PATH, dest)
-            messagebox.showinfo("Backup", f"Backup created: {dest}")
-        except Exception as e:
+        def work(task):
+            task.progress("Saving...")
+            storage.commit(DB_PATH, self.library, self.auth)
+            task.progress("Writing backup...")
+            return backup.create_backup(BACKUP_DIR, self.library, self.auth)
+
+        def done(result):
+            self.status.config(text="")
+            messagebox.showinfo("Backup", f"Backup {result.backup_id} created in {BACKUP_DIR} "
+                                          f"({result.new_chunks} new chunk(s), {result.bytes_written} bytes written)")
+
+        def failed(e):
+            self.status.config(text="")
             messagebox.showerror("Error", f"Backup failed: {e}")
 
+        self.tasks.submit(work, on_done=done, on_error=failed, on_progress=lambda m: self.status.config(text=m))
+
+    def on_close(self):
+        self.status.config(text="Finishing background work...")
+        self.update_idletasks()
+        self.tasks.shutdown()
+        self.destroy()
+
 
 if __name__ == "__main__":
     app = LibraryGUI()
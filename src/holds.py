@@ -0,0 +1,102 @@
+"""
+Holds module
+
+Reservation queues for books with no copy on the shelf. Each ISBN has a
+first-come-first-served queue of members; when a copy comes back it is
+set aside for the member at the front of the queue ("ready for pickup"),
+and only that member can borrow it until they do or cancel the hold.
+"""
+
+from __future__ import annotations
+from collections import deque
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Deque, Dict, List, Optional
+
+
+@dataclass(slots=True)
+class Hold:
+    member_id: str
+    isbn: str
+    placed: date
+    # a copy has been set aside for the member
+    ready: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"member_id": self.member_id, "placed": self.placed.isoformat(), "ready": self.ready}
+
+    @classmethod
+    def from_dict(cls, isbn: str, data: Dict[str, Any]) -> "Hold":
+        return cls(member_id=str(data["member_id"]), isbn=isbn,
+                   placed=date.fromisoformat(str(data["placed"])[:10]), ready=bool(data.get("ready", False)))
+
+
+class HoldQueue:
+    """
+    The holds on one ISBN.
+
+    Waiting holds sit in a deque in the order they were placed. Cancelled
+    holds are left in the deque and skipped when they reach the front, so
+    placing, cancelling and taking the next holder are all O(1).
+    """
+
+    def __init__(self, isbn: str) -> None:
+        self.isbn = isbn
+        self._waiting: Deque[Hold] = deque()
+        # member ID -> that member's hold, waiting or ready
+        self._live: Dict[str, Hold] = {}
+        self._stale = 0
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def get(self, member_id: str) -> Optional[Hold]:
+        return self._live.get(member_id)
+
+    def add(self, hold: Hold) -> None:
+        self._live[hold.member_id] = hold
+        if not hold.ready:
+            self._waiting.append(hold)
+
+    def remove(self, member_id: str) -> Optional[Hold]:
+        """Drop a member's hold; returns it, or None if there was none."""
+        hold = self._live.pop(member_id, None)
+        if hold is not None and not hold.ready:
+            self._stale += 1
+            # rebuild once dead entries outnumber live ones
+            if self._stale > len(self._live) + 64:
+                self._waiting = deque(h for h in self._waiting if self._live.get(h.member_id) is h)
+                self._stale = 0
+        return hold
+
+    def next_waiting(self) -> Optional[Hold]:
+        """Take the oldest waiting hold off the queue (it stays in the queue's holds), or None."""
+        while self._waiting:
+            hold = self._waiting.popleft()
+            if self._live.get(hold.member_id) is hold:
+                return hold
+            self._stale -= 1
+        return None
+
+    def holds(self) -> List[Hold]:
+        """Ready holds, then waiting holds in queue order."""
+        ready = [h for h in self._live.values() if h.ready]
+        return ready + [h for h in self._waiting if self._live.get(h.member_id) is h]
+
+    def position(self, member_id: str) -> int:
+        """1-based place of a waiting hold in the queue; 0 if the hold is ready or absent."""
+        hold = self._live.get(member_id)
+        if hold is None or hold.ready:
+            return 0
+        waiting = [h for h in self._waiting if self._live.get(h.member_id) is h]
+        return waiting.index(hold) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"isbn": self.isbn, "holds": [h.to_dict() for h in self.holds()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HoldQueue":
+        queue = cls(str(data["isbn"]))
+        for hdata in data.get("holds") or []:
+            queue.add(Hold.from_dict(queue.isbn, hdata))
+        return queue
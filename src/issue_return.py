@@ -1,11 +1,15 @@
 """
 Issue and Return module (Group D)
 
-Provides functions to issue and return books for members.
+Provides functions to issue and return books for members, one at a
+time or as a batch (a stack of books at the desk) checked and applied
+under one set of locks, and to place and cancel holds on books with no
+copy available. Returning a book sets it aside for the next member in
+its hold queue.
 """
 
 from __future__ import annotations
-from typing import Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 from library import Library
 from member import Member
@@ -24,21 +28,21 @@ def issue_book(library: Library, isbn: str, member: Member) -> Tuple[bool, str]:
     Returns:
         (success, message): Tuple[bool, str]
     """
-    book = library.get_book(isbn)
-    if book is None:
-        return False, "Book not found."
-    if book.copies <= 0:
-        return False, "No copies available."
+    # the member and book locks make the availability/limit checks and the
+    # updates below atomic with respect to other issues and returns
+    with library.locks.hold(("members", member.member_id), ("books", isbn)):
+        book = library.get_book(isbn)
+        if book is None:
+            return False, "Book not found."
+        hold = library.get_hold(member.member_id, isbn)
+        if book.copies <= 0 and not (hold is not None and hold.ready):
+            return False, "No copies available; place a hold to join the queue."
 
-    # Enforce borrowing limit
-    if len(member.borrowed_books) >= getattr(library, "max_books_per_member", 5):
-        return False, f"Member has reached borrowing limit ({library.max_books_per_member})."
+        # Enforce borrowing limit
+        if len(member.borrowed_books) >= getattr(library, "max_books_per_member", 5):
+            return False, f"Member has reached borrowing limit ({library.max_books_per_member})."
 
-    # Update book copies, create loan and member record
-    book.copies -= 1
-    loan = library.create_loan(member.member_id, isbn)
-    member.borrow_book(isbn)
-    return True, f"Book '{book.title}' issued to {member.name}. Due: {loan.due_date.isoformat()} (Loan ID: {loan.loan_id})"
+        return True, _apply_issue(library, book, member)
 
 
 def return_book(library: Library, isbn: str, member: Member) -> Tuple[bool, str]:
@@ -53,28 +57,200 @@ def return_book(library: Library, isbn: str, member: Member) -> Tuple[bool, str]
     Returns:
         (success, message): Tuple[bool, str]
     """
-    book = library.get_book(isbn)
-    if book is None:
-        return False, "Book not found in library."
+    with library.locks.hold(("members", member.member_id), ("books", isbn)):
+        book = library.get_book(isbn)
+        if book is None:
+            return False, "Book not found in library."
 
-    if not member.has_borrowed(isbn):
-        return False, "Member did not borrow this book."
+        if not member.has_borrowed(isbn):
+            return False, "Member did not borrow this book."
 
-    # Find active loan for this member and isbn
-    active_loan_id = None
-    for lid, loan in library.loans.items():
-        if loan.member_id == member.member_id and loan.isbn == isbn and not loan.returned:
-            active_loan_id = lid
-            break
+        return True, _apply_return(library, book, member)
 
-    if active_loan_id is None:
-        # fall back to simple return
-        book.copies += 1
-        member.return_book(isbn)
-        return True, f"Book '{book.title}' returned by {member.name}."
 
-    # Close loan, update book and member
-    library.close_loan(active_loan_id)
+def place_hold(library: Library, isbn: str, member: Member) -> Tuple[bool, str]:
+    """
+    Puts a member in the hold queue of a book that has no copy available.
+
+    Args:
+        library (Library): The library instance.
+        isbn (str): ISBN of the book to reserve.
+        member (Member): The member placing the hold.
+
+    Returns:
+        (success, message): Tuple[bool, str]
+    """
+    with library.locks.hold(("members", member.member_id), ("books", isbn)):
+        book = library.get_book(isbn)
+        if book is None:
+            return False, "Book not found."
+        # the member may have been removed since the caller looked them up
+        if library.get_member(member.member_id) is None:
+            return False, "Member not found."
+        if library.get_hold(member.member_id, isbn) is not None:
+            return False, "Member already has a hold on this book."
+        if member.has_borrowed(isbn):
+            return False, "Member already has this book."
+        if book.copies > 0:
+            return False, "Copies are available; issue the book instead."
+        library.place_hold(member.member_id, isbn)
+        position = library.hold_position(member.member_id, isbn)
+        return True, f"Hold placed for {member.name} on '{book.title}' (position {position} in the queue)."
+
+
+def cancel_hold(library: Library, isbn: str, member: Member) -> Tuple[bool, str]:
+    """
+    Cancels a member's hold; a copy set aside for it passes to the next
+    member in the queue or goes back on the shelf.
+
+    Returns:
+        (success, message): Tuple[bool, str]
+    """
+    with library.locks.hold(("members", member.member_id), ("books", isbn)):
+        if library.cancel_hold(member.member_id, isbn) is None:
+            return False, "Member has no hold on this book."
+        return True, f"Hold on {isbn} cancelled for {member.name}."
+
+
+def _apply_issue(library: Library, book: Book, member: Member) -> str:
+    """Update book copies, create the loan and member record; the caller holds the locks."""
+    # a copy set aside for the member's hold is already off the shelf count
+    if not library.collect_hold(member.member_id, book.isbn):
+        book.copies -= 1
+    loan = library.create_loan(member.member_id, book.isbn)
+    member.borrow_book(book.isbn)
+    library.mark_dirty("books", book.isbn)
+    library.mark_dirty("members", member.member_id)
+    return f"Book '{book.title}' issued to {member.name}. Due: {loan.due_date.isoformat()} (Loan ID: {loan.loan_id})"
+
+
+def _apply_return(library: Library, book: Book, member: Member) -> str:
+    """Close the active loan (if any), update book and member; the caller holds the locks."""
+    loan = library.find_active_loan(member.member_id, book.isbn)
+    if loan is not None:
+        library.close_loan(loan.loan_id)
     book.copies += 1
-    member.return_book(isbn)
-    return True, f"Book '{book.title}' returned by {member.name}. (Loan {active_loan_id} closed)"
\ No newline at end of file
+    member.return_book(book.isbn)
+    library.mark_dirty("books", book.isbn)
+    library.mark_dirty("members", member.member_id)
+    reserved = "".join(f" Reserved for member {hold.member_id} (hold)." for hold in library.allocate_holds(book.isbn))
+    if loan is None:
+        # fall back to simple return
+        return f"Book '{book.title}' returned by {member.name}.{reserved}"
+    return f"Book '{book.title}' returned by {member.name}. (Loan {loan.loan_id} closed){reserved}"
+
+
+# --- Batches ---
+
+MAX_BATCH_ITEMS = 100
+BATCH_ABORTED = "Not applied: another item in the batch failed."
+
+
+def parse_batch_items(data: Dict[str, Any]) -> Tuple[List[Tuple[str, str]], Dict[str, str]]:
+    """
+    Reads the `items` list of a batch request body.
+
+    Args:
+        data (dict): {"items": [{"member_id": ..., "isbn": ...}, ...]}.
+
+    Returns:
+        (items, errors): (member_id, isbn) pairs, or field errors.
+    """
+    raw = data.get("items")
+    if not isinstance(raw, list) or not raw:
+        return [], {"items": "items must be a non-empty list."}
+    if len(raw) > MAX_BATCH_ITEMS:
+        return [], {"items": f"At most {MAX_BATCH_ITEMS} items per batch."}
+    items: List[Tuple[str, str]] = []
+    for n, item in enumerate(raw):
+        member_id = str(item.get("member_id") or "").strip() if isinstance(item, dict) else ""
+        isbn = str(item.get("isbn") or "").strip() if isinstance(item, dict) else ""
+        if not member_id or not isbn:
+            return [], {"items": f"Item {n} needs member_id and isbn."}
+        items.append((member_id, isbn))
+    return items, {}
+
+
+def _run_batch(library: Library, items: Iterable[Tuple[str, str]], atomic: bool,
+               check: Callable[..., Optional[str]], apply: Callable[..., str]) -> Tuple[bool, List[Tuple[bool, str]]]:
+    items = list(items)
+    keys = [("members", m) for m, _ in items] + [("books", i) for _, i in items]
+    with library.locks.hold(*keys):
+        # one pass checks every item against the state the earlier items will leave
+        plan: Dict[Any, int] = {}
+        checked: List[Tuple[Optional[str], Optional[Book], Optional[Member]]] = []
+        for member_id, isbn in items:
+            book, member = library.get_book(isbn), library.get_member(member_id)
+            if member is None:
+                checked.append(("Member not found.", None, None))
+            elif book is None:
+                checked.append(("Book not found.", None, None))
+            else:
+                checked.append((check(library, book, member, plan), book, member))
+        ok = all(error is None for error, _, _ in checked)
+        results: List[Tuple[bool, str]] = []
+        for error, book, member in checked:
+            if error is not None:
+                results.append((False, error))
+            elif atomic and not ok:
+                results.append((False, BATCH_ABORTED))
+            else:
+                results.append((True, apply(library, book, member)))
+        return ok, results
+
+
+def _check_issue(library: Library, book: Book, member: Member, plan: Dict[Any, int]) -> Optional[str]:
+    copies = plan.get(("books", book.isbn), book.copies)
+    held = plan.get(("members", member.member_id), len(member.borrowed_books))
+    limit = getattr(library, "max_books_per_member", 5)
+    # the first issue of a book the member has a ready hold on takes the set-aside copy
+    ready_key = ("ready", member.member_id, book.isbn)
+    hold = library.get_hold(member.member_id, book.isbn)
+    uses_hold = hold is not None and hold.ready and not plan.get(ready_key)
+    if copies <= 0 and not uses_hold:
+        return "No copies available."
+    if held >= limit:
+        return f"Member has reached borrowing limit ({limit})."
+    if uses_hold:
+        plan[ready_key] = 1
+    else:
+        plan[("books", book.isbn)] = copies - 1
+    plan[("members", member.member_id)] = held + 1
+    return None
+
+
+def _check_return(library: Library, book: Book, member: Member, plan: Dict[Any, int]) -> Optional[str]:
+    key = ("returns", member.member_id, book.isbn)
+    if not member.has_borrowed(book.isbn) or plan.get(key):
+        return "Member did not borrow this book."
+    plan[key] = 1
+    return None
+
+
+def issue_books(library: Library, items: Iterable[Tuple[str, str]],
+                atomic: bool = True) -> Tuple[bool, List[Tuple[bool, str]]]:
+    """
+    Issues several books in one step, e.g. a member's whole stack at the desk.
+
+    Availability and `max_books_per_member` are checked for the batch as a
+    whole under one set of locks before anything changes.
+
+    Args:
+        library (Library): The library instance.
+        items: (member_id, isbn) pairs.
+        atomic (bool): If True, nothing is issued unless every item can be;
+            otherwise the valid items are issued and the rest reported.
+
+    Returns:
+        (ok, results): Whether every item succeeded, and a (success, message)
+        tuple per item in order.
+    """
+    return _run_batch(library, items, atomic, _check_issue, _apply_issue)
+
+
+def return_books(library: Library, items: Iterable[Tuple[str, str]],
+                 atomic: bool = True) -> Tuple[bool, List[Tuple[bool, str]]]:
+    """
+    Returns several books in one step; see `issue_books`.
+    """
+    return _run_batch(library, items, atomic, _check_return, _apply_return)
\ No newline at end of file
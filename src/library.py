@@ -6,12 +6,20 @@ and registered members.
 """
 
 from __future__ import annotations
-from typing import Dict, List, Optional, Any
+import heapq
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Any, Set, Tuple
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 
 from book import Book
 from member import Member
+from search_index import SearchIndex
+from loan_history import LoanStore
+from holds import Hold, HoldQueue
+from analytics import CirculationStats
+from concurrency import KeyedLocks
 
 
 class Library:
@@ -21,17 +29,75 @@ class Library:
     Attributes:
         books (Dict[str, Book]): Maps ISBNs to Book objects.
         members (Dict[str, Member]): Maps member IDs to Member objects.
+        search_index (SearchIndex): Title/author index kept in sync with `books`.
+        holds (Dict[str, HoldQueue]): Maps ISBNs to their queue of holds;
+            ISBNs without holds have no entry.
+        lock (threading.RLock): Guards the collections and indexes. Every
+            method takes it briefly; hold it to read several collections
+            consistently or to iterate one while other threads write.
+        locks (KeyedLocks): Per-book/per-member locks that serialize
+            check-then-act sequences such as issuing a copy.
     """
 
     def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.locks = KeyedLocks()
         self.books: Dict[str, Book] = {}
+        self.search_index = SearchIndex()
         self.members: Dict[str, Member] = {}
-        # loans: mapping loan_id -> Loan
-        self.loans: Dict[str, Any] = {}
+        # loans: mapping loan_id -> Loan; returned loans are kept in columnar form
+        self.loans: LoanStore = LoanStore(Library.Loan)
         # next loan id counter
         self._next_loan_id: int = 1
         # borrowing policy
         self.max_books_per_member: int = 5
+        # bumped on every mutation; lets readers detect that nothing changed
+        self.version: int = 0
+        # keys touched since the last persistence commit, per collection
+        self._dirty: Dict[str, Set[str]] = {"books": set(), "members": set(), "loans": set(), "holds": set()}
+        # loan indexes, kept in sync by create_loan/close_loan/update_loan/from_dict
+        # (member_id, isbn) -> IDs of active loans, oldest first
+        self._active_loans: Dict[Tuple[str, str], List[str]] = {}
+        # None until first needed after a lazy `from_dict`
+        self._loans_by_member: Optional[Dict[str, List[str]]] = {}
+        self._loans_by_isbn: Optional[Dict[str, List[str]]] = {}
+        # min-heap of (due date ordinal, loan ID) over active loans. Entries are
+        # invalidated lazily: `_due_of` holds the ordinal of each loan's live entry
+        self._due_heap: List[Tuple[int, str]] = []
+        self._due_of: Dict[str, int] = {}
+        self._due_stale = 0
+        self.holds: Dict[str, HoldQueue] = {}
+        # member ID -> ISBNs the member holds
+        self._holds_by_member: Dict[str, Set[str]] = {}
+        # circulation counters kept up to date by create_loan/_set_returned;
+        # None until first needed after `from_dict`
+        self._stats: Optional[CirculationStats] = CirculationStats()
+
+    # --- Change tracking ---
+
+    def mark_dirty(self, kind: str, key: str) -> None:
+        """
+        Records that an entity was created, changed or removed so the
+        next journal commit in `storage.py` persists it, and bumps
+        `version`.
+
+        Args:
+            kind (str): One of "books", "members", "loans" or "holds".
+            key (str): ISBN, member ID or loan ID of the entity (ISBN for holds).
+        """
+        with self.lock:
+            self._dirty[kind].add(key)
+            self.version += 1
+
+    def drain_changes(self) -> Dict[str, Set[str]]:
+        """
+        Returns the keys touched since the last call and resets tracking.
+        A key that is no longer present in its collection was removed.
+        """
+        with self.lock:
+            changes = self._dirty
+            self._dirty = {"books": set(), "members": set(), "loans": set(), "holds": set()}
+            return changes
 
     # --- Book management ---
 
@@ -43,10 +109,14 @@ class Library:
         Args:
             book (Book): The book to add.
         """
-        if book.isbn in self.books:
-            self.books[book.isbn].copies += book.copies
-        else:
-            self.books[book.isbn] = book
+        with self.locks.hold(("books", book.isbn)), self.lock:
+            if book.isbn in self.books:
+                self.books[book.isbn].copies += book.copies
+            else:
+                self.books[book.isbn] = book
+                self.search_index.add(book)
+            self.mark_dirty("books", book.isbn)
+            self.allocate_holds(book.isbn)
 
     def remove_book(self, isbn: str) -> bool:
         """
@@ -58,10 +128,50 @@ class Library:
         Returns:
             bool: True if the book was removed, False if not found.
         """
-        if isbn in self.books:
-            del self.books[isbn]
-            return True
-        return False
+        with self.locks.hold(("books", isbn)), self.lock:
+            if isbn in self.books:
+                del self.books[isbn]
+                self.search_index.remove(isbn)
+                self.mark_dirty("books", isbn)
+                queue = self.holds.pop(isbn, None)
+                if queue is not None:
+                    for hold in queue.holds():
+                        self._unindex_hold(hold.member_id, isbn)
+                    self.mark_dirty("holds", isbn)
+                return True
+            return False
+
+    def update_book(self, isbn: str, title: Optional[str] = None, author: Optional[str] = None,
+                    copies: Optional[int] = None) -> Optional[Book]:
+        """
+        Updates the given fields of a book; fields left as None are kept.
+
+        Args:
+            isbn (str): The ISBN of the book to update.
+            title (Optional[str]): New title.
+            author (Optional[str]): New author.
+            copies (Optional[int]): New number of copies.
+
+        Returns:
+            Optional[Book]: The updated book, or None if not found.
+        """
+        with self.locks.hold(("books", isbn)), self.lock:
+            book = self.books.get(isbn)
+            if book is None:
+                return None
+            if copies is not None and copies < 0:
+                raise ValueError("Number of copies cannot be negative.")
+            if title is not None:
+                book.title = title
+            if author is not None:
+                book.author = author
+            if copies is not None:
+                book.copies = copies
+            if title is not None or author is not None:
+                self.search_index.add(book)
+            self.mark_dirty("books", isbn)
+            self.allocate_holds(isbn)
+            return book
 
     def list_books(self) -> List[Book]:
         """
@@ -90,7 +200,67 @@ class Library:
         Args:
             member (Member): The member to add.
         """
-        self.members[member.member_id] = member
+        with self.lock:
+            self.members[member.member_id] = member
+            self.mark_dirty("members", member.member_id)
+
+    def remove_member(self, member_id: str) -> bool:
+        """
+        Removes a member from the library by ID, cancelling their holds.
+
+        Args:
+            member_id (str): The member's ID.
+
+        Returns:
+            bool: True if the member was removed, False if not found.
+        """
+        with self.lock_member(member_id), self.lock:
+            if member_id in self.members:
+                del self.members[member_id]
+                self.mark_dirty("members", member_id)
+                for isbn in list(self._holds_by_member.get(member_id, ())):
+                    self.cancel_hold(member_id, isbn)
+                return True
+            return False
+
+    @contextmanager
+    def lock_member(self, member_id: str) -> Iterator[None]:
+        """
+        Holds the lock stripes of a member and of every book they have a
+        hold on, taken together before `self.lock` like every other
+        operation. Holds placed through `issue_return.place_hold` need the
+        member's stripe, so the set of held books cannot grow inside the
+        block.
+        """
+        while True:
+            with self.lock:
+                held = set(self._holds_by_member.get(member_id, ()))
+            with self.locks.hold(("members", member_id), *(("books", isbn) for isbn in held)):
+                with self.lock:
+                    covered = self._holds_by_member.get(member_id, set()) <= held
+                if covered:
+                    yield
+                    return
+            # a hold was placed before the stripes were taken; lock its book too
+
+    def rename_member(self, member_id: str, name: str) -> Optional[Member]:
+        """
+        Changes a member's name.
+
+        Args:
+            member_id (str): The member's ID.
+            name (str): The new name.
+
+        Returns:
+            Optional[Member]: The updated member, or None if not found.
+        """
+        with self.lock:
+            member = self.members.get(member_id)
+            if member is None:
+                return None
+            member.name = name
+            self.mark_dirty("members", member_id)
+            return member
 
     def get_member(self, member_id: str) -> Optional[Member]:
         """
@@ -110,24 +280,265 @@ class Library:
         """
         return list(self.members.values())
 
+    # --- Holds ---
+
+    def place_hold(self, member_id: str, isbn: str, today: Optional[date] = None) -> Hold:
+        """
+        Puts a member at the back of a book's hold queue; does not check
+        availability (see `issue_return.place_hold`).
+
+        Raises:
+            ValueError: If the member is unknown or already holds the book.
+        """
+        with self.locks.hold(("books", isbn)), self.lock:
+            if member_id not in self.members:
+                raise ValueError("Member not found.")
+            queue = self.holds.get(isbn)
+            if queue is None:
+                queue = self.holds[isbn] = HoldQueue(isbn)
+            if queue.get(member_id) is not None:
+                raise ValueError("Member already has a hold on this book.")
+            hold = Hold(member_id=member_id, isbn=isbn, placed=today or date.today())
+            queue.add(hold)
+            self._holds_by_member.setdefault(member_id, set()).add(isbn)
+            self.mark_dirty("holds", isbn)
+            return hold
+
+    def cancel_hold(self, member_id: str, isbn: str) -> Optional[Hold]:
+        """
+        Removes a member's hold. A copy set aside for it goes to the next
+        member in the queue, or back on the shelf.
+
+        Returns:
+            Optional[Hold]: The cancelled hold, or None if there was none.
+        """
+        with self.locks.hold(("books", isbn)), self.lock:
+            hold = self._remove_hold(member_id, isbn)
+            if hold is not None and hold.ready:
+                book = self.books.get(isbn)
+                if book is not None:
+                    book.copies += 1
+                    self.mark_dirty("books", isbn)
+                    self.allocate_holds(isbn)
+            return hold
+
+    def collect_hold(self, member_id: str, isbn: str) -> bool:
+        """
+        Removes a member's hold as they borrow the book.
+
+        Returns:
+            bool: True if a copy was set aside for them (it is not counted
+            in `Book.copies`), False otherwise.
+        """
+        with self.lock:
+            hold = self._remove_hold(member_id, isbn)
+            return hold is not None and hold.ready
+
+    def allocate_holds(self, isbn: str) -> List[Hold]:
+        """
+        Sets shelf copies aside for the members at the front of the queue,
+        one copy per hold, while both last. Called when copies come back
+        or are added; the caller holds the book's lock.
+
+        Returns:
+            List[Hold]: The holds that became ready.
+        """
+        with self.lock:
+            queue = self.holds.get(isbn)
+            book = self.books.get(isbn)
+            allocated: List[Hold] = []
+            while queue is not None and book is not None and book.copies > 0:
+                hold = queue.next_waiting()
+                if hold is None:
+                    break
+                hold.ready = True
+                book.copies -= 1
+                allocated.append(hold)
+            if allocated:
+                self.mark_dirty("books", isbn)
+                self.mark_dirty("holds", isbn)
+            return allocated
+
+    def get_hold(self, member_id: str, isbn: str) -> Optional[Hold]:
+        with self.lock:
+            queue = self.holds.get(isbn)
+            return queue.get(member_id) if queue is not None else None
+
+    def hold_queue(self, isbn: str) -> List[Hold]:
+        """Holds on a book: ready ones first, then waiting ones in queue order."""
+        with self.lock:
+            queue = self.holds.get(isbn)
+            return queue.holds() if queue is not None else []
+
+    def hold_position(self, member_id: str, isbn: str) -> int:
+        """1-based place of a waiting hold in its queue; 0 if ready or absent."""
+        with self.lock:
+            queue = self.holds.get(isbn)
+            return queue.position(member_id) if queue is not None else 0
+
+    def holds_for_member(self, member_id: str) -> List[Hold]:
+        with self.lock:
+            return [self.holds[isbn].get(member_id) for isbn in sorted(self._holds_by_member.get(member_id, ()))]
+
+    def _remove_hold(self, member_id: str, isbn: str) -> Optional[Hold]:
+        queue = self.holds.get(isbn)
+        hold = queue.remove(member_id) if queue is not None else None
+        if hold is None:
+            return None
+        if not len(queue):
+            del self.holds[isbn]
+        self._unindex_hold(member_id, isbn)
+        self.mark_dirty("holds", isbn)
+        return hold
+
+    def _unindex_hold(self, member_id: str, isbn: str) -> None:
+        isbns = self._holds_by_member.get(member_id)
+        if isbns is not None:
+            isbns.discard(isbn)
+            if not isbns:
+                del self._holds_by_member[member_id]
+
     def to_dict(self) -> dict:
         """Serialize the whole library to a dictionary."""
-        return {
-            "books": {isbn: book.to_dict() for isbn, book in self.books.items()},
-            "members": {mid: member.to_dict() for mid, member in self.members.items()},
-            "loans": {lid: loan.to_dict() for lid, loan in self.loans.items()},
-            "next_loan_id": self._next_loan_id,
-        }
+        with self.lock:
+            return self.capture()()
+
+    def capture(self) -> Callable[[], dict]:
+        """
+        Take a cheap copy of the collections under the lock and return a
+        function that serializes it like `to_dict` without holding the lock.
+
+        An entity changed between the two calls may be serialized in its
+        old or new state; the change also marks it dirty, so a commit after
+        the `drain_changes` that accompanies the capture rewrites it.
+        """
+        with self.lock:
+            books = list(self.books.items())
+            members = list(self.members.items())
+            loans = self.loans.capture()
+            # hold queues are few and small; copy them out now
+            holds = {isbn: queue.to_dict() for isbn, queue in self.holds.items()}
+            next_loan_id = self._next_loan_id
+
+        def serialize() -> dict:
+            return {
+                "books": {isbn: book.to_dict() for isbn, book in books},
+                "members": {mid: member.to_dict() for mid, member in members},
+                "loans": dict(loans()),
+                "holds": holds,
+                "next_loan_id": next_loan_id,
+            }
+        return serialize
+
+    def replace_state(self, other: "Library") -> None:
+        """
+        Takes over the contents of `other` (e.g. state just reloaded from
+        storage) while keeping this object, its locks and its version
+        counter, so existing references see the new state and cached
+        responses are invalidated.
+        """
+        with self.lock:
+            for name in ("books", "search_index", "members", "loans", "_next_loan_id",
+                         "_active_loans", "_loans_by_member", "_loans_by_isbn",
+                         "_due_heap", "_due_of", "_due_stale", "holds", "_holds_by_member", "_stats"):
+                setattr(self, name, getattr(other, name))
+            self._dirty = {kind: set() for kind in self._dirty}
+            self.version += 1
+
+    def apply_change(self, kind: str, key: str, value: Any) -> None:
+        """
+        Applies one entity as another process stored it, keeping every
+        index in step, without marking anything dirty (see `shared.py`).
+
+        Args:
+            kind (str): "books", "members", "loans", "holds" or "meta".
+            key (str): The entity's key (``next_loan_id`` for "meta").
+            value: The stored dict (a number for "meta"), or None if the
+                entity was deleted.
+
+        Raises:
+            ValueError: For changes that cannot be applied in place (a
+                deleted loan); reload the whole state instead.
+        """
+        with self.lock:
+            if kind == "books":
+                book = self.books.get(key)
+                if value is None:
+                    if book is not None:
+                        del self.books[key]
+                        self.search_index.remove(key)
+                elif book is None:
+                    book = self.books[key] = Book.from_dict(value)
+                    self.search_index.add(book)
+                else:
+                    # in place, so references held by other threads stay current
+                    new = Book.from_dict(value)
+                    reindex = (new.title, new.author) != (book.title, book.author)
+                    book.title, book.author, book.copies = new.title, new.author, new.copies
+                    if reindex:
+                        self.search_index.add(book)
+            elif kind == "members":
+                member = self.members.get(key)
+                if value is None:
+                    self.members.pop(key, None)
+                elif member is None:
+                    self.members[key] = Member.from_dict(value)
+                else:
+                    new = Member.from_dict(value)
+                    member.name, member.borrowed_books = new.name, new.borrowed_books
+            elif kind == "loans":
+                if value is None:
+                    raise ValueError(f"Loan {key} was deleted.")
+                new = Library.Loan.from_dict(value)
+                loan = self.loans.get(key)
+                if loan is None:
+                    self.loans.add(new)
+                    self._index_loan(new)
+                    if self._stats is not None:
+                        self._stats.record_issue(new.member_id, new.isbn, new.issue_date)
+                        if new.returned:
+                            self._stats.record_return(new.issue_date, new.return_date)
+                else:
+                    loan = self._set_returned(loan, new.returned, on=new.return_date)
+                    if loan.due_date != new.due_date:
+                        if loan.returned:
+                            self.loans.history.set_due(key, new.due_date)
+                        loan.due_date = new.due_date
+                        if not loan.returned:
+                            self._track_due(loan)
+            elif kind == "holds":
+                old = self.holds.pop(key, None)
+                if old is not None:
+                    for hold in old.holds():
+                        self._unindex_hold(hold.member_id, key)
+                if value is not None:
+                    queue = self.holds[key] = HoldQueue.from_dict(value)
+                    for hold in queue.holds():
+                        self._holds_by_member.setdefault(hold.member_id, set()).add(key)
+            elif kind == "meta" and key == "next_loan_id" and value is not None:
+                self._next_loan_id = int(value)
+            self.version += 1
 
     @classmethod
-    def from_dict(cls, data: dict) -> "Library":
-        """Reconstruct a Library from a dictionary produced by `to_dict`."""
+    def from_dict(cls, data: dict, lazy: bool = False) -> "Library":
+        """
+        Reconstruct a Library from a dictionary produced by `to_dict`.
+
+        Args:
+            data (dict): The serialized library.
+            lazy (bool): Defer the expensive parts until first use: search
+                postings are built on the first search, returned loans stay
+                as stored dicts until the history is needed, and the
+                per-member/per-book loan lists are built on first lookup.
+        """
         lib = cls()
+        index_book = lib.search_index.defer if lazy else lib.search_index.add
         books = data.get("books", {}) or {}
         for isbn, bdata in books.items():
             # Book.from_dict will validate copies
             book = Book.from_dict(bdata)
             lib.books[isbn] = book
+            index_book(book)
 
         members = data.get("members", {}) or {}
         for mid, mdata in members.items():
@@ -136,15 +547,27 @@ class Library:
 
         # load loans if any
         loans = data.get("loans", {}) or {}
+        if lazy:
+            lib._loans_by_member = lib._loans_by_isbn = None
+            returned = lib.loans.defer_all({lid: ldata for lid, ldata in loans.items() if ldata.get("returned")})
+            loans = {lid: ldata for lid, ldata in loans.items() if lid not in returned}
         for lid, ldata in loans.items():
             loan = Library.Loan.from_dict(ldata)
-            lib.loans[lid] = loan
+            lib.loans.add(loan)
+            lib._index_loan(loan)
+        lib._stats = None
+
+        for isbn, qdata in (data.get("holds", {}) or {}).items():
+            queue = HoldQueue.from_dict(qdata)
+            lib.holds[isbn] = queue
+            for hold in queue.holds():
+                lib._holds_by_member.setdefault(hold.member_id, set()).add(isbn)
 
         lib._next_loan_id = int(data.get("next_loan_id", lib._next_loan_id))
 
         return lib
 
-    @dataclass
+    @dataclass(slots=True)
     class Loan:
         loan_id: str
         member_id: str
@@ -152,6 +575,8 @@ class Library:
         issue_date: date
         due_date: date
         returned: bool = False
+        # None while active, and for loans returned before return dates were recorded
+        return_date: Optional[date] = None
 
         def to_dict(self) -> Dict[str, Any]:
             return {
@@ -161,6 +586,7 @@ class Library:
                 "issue_date": self.issue_date.isoformat(),
                 "due_date": self.due_date.isoformat(),
                 "returned": bool(self.returned),
+                "return_date": self.return_date.isoformat() if self.return_date else None,
             }
 
         @classmethod
@@ -172,27 +598,214 @@ class Library:
                 issue_date=datetime.fromisoformat(data["issue_date"]).date(),
                 due_date=datetime.fromisoformat(data["due_date"]).date(),
                 returned=bool(data.get("returned", False)),
+                return_date=datetime.fromisoformat(data["return_date"]).date() if data.get("return_date") else None,
             )
 
     def _generate_loan_id(self) -> str:
-        lid = str(self._next_loan_id)
-        self._next_loan_id += 1
-        return lid
+        with self.lock:
+            lid = str(self._next_loan_id)
+            self._next_loan_id += 1
+            return lid
 
     def create_loan(self, member_id: str, isbn: str, days: int = 14) -> "Loan":
         """Create and record a loan; does not check availability.
 
         Returns the Loan object.
         """
-        lid = self._generate_loan_id()
-        today = date.today()
-        loan = Library.Loan(loan_id=lid, member_id=member_id, isbn=isbn, issue_date=today, due_date=today + timedelta(days=days))
-        self.loans[lid] = loan
-        return loan
+        with self.lock:
+            lid = self._generate_loan_id()
+            today = date.today()
+            loan = Library.Loan(loan_id=lid, member_id=member_id, isbn=isbn, issue_date=today, due_date=today + timedelta(days=days))
+            self.loans.add(loan)
+            self._index_loan(loan)
+            if self._stats is not None:
+                self._stats.record_issue(member_id, isbn, today)
+            self.mark_dirty("loans", lid)
+            return loan
 
     def close_loan(self, loan_id: str) -> bool:
-        loan = self.loans.get(loan_id)
-        if loan is None:
-            return False
-        loan.returned = True
-        return True
+        with self.lock:
+            loan = self.loans.get(loan_id)
+            if loan is None:
+                return False
+            self._set_returned(loan, True)
+            self.mark_dirty("loans", loan_id)
+            return True
+
+    def update_loan(self, loan_id: str, due_date: Optional[date] = None,
+                    returned: Optional[bool] = None) -> Optional["Library.Loan"]:
+        """Change a loan's due date and/or returned flag; None keeps the current value."""
+        with self.lock:
+            loan = self.loans.get(loan_id)
+            if loan is None:
+                return None
+            if returned is not None:
+                loan = self._set_returned(loan, bool(returned))
+            if due_date is not None:
+                if loan.returned:
+                    self.loans.history.set_due(loan_id, due_date)
+                loan.due_date = due_date
+                if not loan.returned:
+                    self._track_due(loan)
+            self.mark_dirty("loans", loan_id)
+            return loan
+
+    # --- Loan reports ---
+
+    @property
+    def stats(self) -> CirculationStats:
+        """Circulation statistics (see `analytics`), computed from the loans on first use."""
+        with self.lock:
+            if self._stats is None:
+                self._stats = CirculationStats.from_loans(self.loans)
+            return self._stats
+
+    def circulation_counts(self) -> Dict[str, int]:
+        """
+        Returns the number of loans (active and returned) per ISBN.
+        """
+        with self.lock:
+            counts = self.loans.history.count_by_isbn()
+            for loan in self.loans.active.values():
+                counts[loan.isbn] = counts.get(loan.isbn, 0) + 1
+            return counts
+
+    def overdue_loans(self, today: Optional[date] = None, limit: Optional[int] = None) -> List["Library.Loan"]:
+        """
+        Returns active loans whose due date is before `today`, most overdue
+        first.
+
+        Only the heap entries that are actually overdue are visited, so
+        finding k overdue loans costs O(k log n) whatever the size of the
+        loan history.
+
+        Args:
+            today (date): Reference date; defaults to the current date.
+            limit (int): Stop after this many loans.
+        """
+        with self.lock:
+            cutoff = (today or date.today()).toordinal()
+            heap = self._due_heap
+            found: List[Library.Loan] = []
+            while heap and heap[0][0] < cutoff and (limit is None or len(found) < limit):
+                due, loan_id = heapq.heappop(heap)
+                if self._due_of.get(loan_id) != due:
+                    self._due_stale -= 1
+                    continue
+                loan = self.loans.active[loan_id]
+                if loan.due_date.toordinal() != due:
+                    # due date assigned directly on the object; re-file it
+                    self._due_of[loan_id] = loan.due_date.toordinal()
+                    heapq.heappush(heap, (self._due_of[loan_id], loan_id))
+                    continue
+                found.append(loan)
+            # the loans are still active: put their entries back
+            for loan in found:
+                heapq.heappush(heap, (self._due_of[loan.loan_id], loan.loan_id))
+            return found
+
+    # --- Loan lookups ---
+
+    def find_active_loan(self, member_id: str, isbn: str) -> Optional["Library.Loan"]:
+        """
+        Returns the oldest active loan of `isbn` to `member_id`, or None.
+        """
+        with self.lock:
+            ids = self._active_loans.get((member_id, isbn))
+            return self.loans[ids[0]] if ids else None
+
+    def loans_for_member(self, member_id: str, active_only: bool = False) -> List["Library.Loan"]:
+        """
+        Returns the member's loans in the order they were created.
+
+        Args:
+            member_id (str): The member's ID.
+            active_only (bool): Skip loans that have been returned.
+        """
+        with self.lock:
+            loans = [self.loans[lid] for lid in self._loan_lists()[0].get(member_id, ())]
+            return [loan for loan in loans if not loan.returned] if active_only else loans
+
+    def loans_for_book(self, isbn: str, active_only: bool = False) -> List["Library.Loan"]:
+        """
+        Returns the loans of a book in the order they were created.
+
+        Args:
+            isbn (str): The ISBN of the book.
+            active_only (bool): Skip loans that have been returned.
+        """
+        with self.lock:
+            loans = [self.loans[lid] for lid in self._loan_lists()[1].get(isbn, ())]
+            return [loan for loan in loans if not loan.returned] if active_only else loans
+
+    def _loan_lists(self) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+        """The per-member and per-book loan ID lists, built on first use after a lazy load."""
+        if self._loans_by_member is None or self._loans_by_isbn is None:
+            by_member: Dict[str, List[str]] = {}
+            by_isbn: Dict[str, List[str]] = {}
+            refs = sorted(self.loans.refs(), key=lambda ref: _loan_order(ref[0]))
+            for loan_id, member_id, isbn in refs:
+                by_member.setdefault(member_id, []).append(loan_id)
+                by_isbn.setdefault(isbn, []).append(loan_id)
+            self._loans_by_member, self._loans_by_isbn = by_member, by_isbn
+        return self._loans_by_member, self._loans_by_isbn
+
+    def _index_loan(self, loan: "Library.Loan") -> None:
+        if self._loans_by_member is not None and self._loans_by_isbn is not None:
+            self._loans_by_member.setdefault(loan.member_id, []).append(loan.loan_id)
+            self._loans_by_isbn.setdefault(loan.isbn, []).append(loan.loan_id)
+        if not loan.returned:
+            self._active_loans.setdefault((loan.member_id, loan.isbn), []).append(loan.loan_id)
+            self._track_due(loan)
+
+    def _track_due(self, loan: "Library.Loan") -> None:
+        """File an active loan in the due-date heap under its current due date."""
+        due = loan.due_date.toordinal()
+        previous = self._due_of.get(loan.loan_id)
+        if previous == due:
+            return
+        if previous is not None:
+            self._due_stale += 1
+        self._due_of[loan.loan_id] = due
+        heapq.heappush(self._due_heap, (due, loan.loan_id))
+
+    def _untrack_due(self, loan_id: str) -> None:
+        if self._due_of.pop(loan_id, None) is not None:
+            self._due_stale += 1
+            # rebuild once dead entries outnumber live ones, keeping the heap O(active loans)
+            if self._due_stale > len(self._due_of) + 64:
+                self._due_heap = [(due, lid) for lid, due in self._due_of.items()]
+                heapq.heapify(self._due_heap)
+                self._due_stale = 0
+
+    def _set_returned(self, loan: "Library.Loan", returned: bool,
+                      on: Optional[date] = None) -> "Library.Loan":
+        """Flip a loan's returned flag, moving it between the active set and
+        the history; returns the object now representing the loan. `on` is
+        the return date, today by default."""
+        if loan.returned == returned:
+            return loan
+        key = (loan.member_id, loan.isbn)
+        if returned:
+            loan.returned = True
+            loan.return_date = on or date.today()
+            self.loans.archive(loan.loan_id)
+            if self._stats is not None:
+                self._stats.record_return(loan.issue_date, loan.return_date)
+            ids = self._active_loans[key]
+            ids.remove(loan.loan_id)
+            if not ids:
+                del self._active_loans[key]
+            self._untrack_due(loan.loan_id)
+            return loan
+        if self._stats is not None:
+            self._stats.record_reopen(loan.issue_date, loan.return_date)
+        loan = self.loans.restore(loan.loan_id)
+        self._active_loans.setdefault(key, []).append(loan.loan_id)
+        self._track_due(loan)
+        return loan
+
+
+def _loan_order(loan_id: str) -> Tuple[int, Any]:
+    """Sort key putting generated (numeric) loan IDs in creation order."""
+    return (0, int(loan_id)) if loan_id.isdigit() else (1, loan_id)
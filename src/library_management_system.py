@@ -9,13 +9,21 @@ from __future__ import annotations
 from book import Book
 from member import Member
 from library import Library
-from issue_return import issue_book, return_book
-from search import search_by_title, search_by_author, search_by_isbn
+from issue_return import issue_book, return_book, place_hold, cancel_hold
+from search import search_by_title, search_by_author, search_by_isbn, search_books
 from auth_system import AuthSystem
 import storage
-import shutil
-from pathlib import Path
-from datetime import datetime
+import bulk
+import backup
+import analytics
+import os
+from datetime import date, datetime
+
+
+# a .db/.sqlite/.sqlite3 path selects the SQLite backend
+DB_PATH = os.environ.get("LMS_DB_PATH", "library_db.json")
+# incremental backup store (see backup.py)
+BACKUP_DIR = os.environ.get("LMS_BACKUP_DIR", "backups")
 
 
 def print_menu() -> None:
@@ -35,6 +43,11 @@ def print_menu() -> None:
     print("10. Remove Book")
     print("11. Save Now")
     print("12. Backup DB")
+    print("13. Overdue Loans")
+    print("14. Place Hold")
+    print("15. Cancel Hold")
+    print("16. List Holds")
+    print("17. Circulation Stats")
     print("0. Exit")
 
 
@@ -46,6 +59,131 @@ def search_menu() -> None:
     print("1. By Title")
     print("2. By Author")
     print("3. By ISBN")
+    print("4. By Title or Author (ranked)")
+
+
+BULK_COMMANDS = ("import-books", "export-books", "import-members", "export-members")
+BACKUP_COMMANDS = ("backup", "backups", "restore", "prune-backups")
+
+
+def run_bulk_command(command: str, path: str) -> int:
+    """
+    Runs a bulk import/export command against the database; the file
+    format (CSV or NDJSON) follows the file extension.
+
+    Returns:
+        int: Process exit status (1 if any row failed to import).
+    """
+    library, auth = storage.load_state(DB_PATH)
+    fmt = bulk.format_for_path(path)
+    kind = command.split("-", 1)[1]
+    if command.startswith("export"):
+        with open(path, "w", encoding="utf-8", newline="") as fh:
+            exporter = bulk.export_books if kind == "books" else bulk.export_members
+            count = exporter(library, fh, fmt)
+        print(f"Exported {count} {kind} to {path}")
+        return 0
+
+    importer = bulk.import_books if kind == "books" else bulk.import_members
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        report = importer(library, bulk.read_rows(fh, fmt), commit=lambda: storage.commit(DB_PATH, library, auth))
+    print(f"Imported {report.imported} {kind} in {report.batches} batch(es); {report.failed} row(s) failed.")
+    for err in report.errors:
+        details = "; ".join(f"{k}: {v}" for k, v in err["errors"].items())
+        print(f"  row {err['row']}: {details}")
+    return 1 if report.failed else 0
+
+
+def run_backup_command(command: str, args: list[str]) -> int:
+    """
+    Runs a backup command against the database and `BACKUP_DIR`:
+    ``backup``, ``backups`` (list), ``restore [ID | --at YYYY-MM-DDTHH:MM]``
+    and ``prune-backups [KEEP_LAST KEEP_DAILY KEEP_WEEKLY]``.
+
+    Returns:
+        int: Process exit status.
+    """
+    if command == "backup":
+        library, auth = storage.load_state(DB_PATH)
+        result = backup.create_backup(BACKUP_DIR, library, auth)
+        print(f"Backup {result.backup_id}: {result.new_chunks} of {result.chunks} chunk(s) new, "
+              f"{result.bytes_written} bytes written")
+    elif command == "backups":
+        for b in backup.list_backups(BACKUP_DIR):
+            print(f"{b['id']}  {b['created'].isoformat(sep=' ', timespec='seconds')}")
+    elif command == "restore":
+        try:
+            if args[:1] == ["--at"] and len(args) >= 2:
+                restored = backup.restore(BACKUP_DIR, DB_PATH, at=datetime.fromisoformat(args[1]))
+            else:
+                restored = backup.restore(BACKUP_DIR, DB_PATH, backup_id=args[0] if args else None)
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"Restored backup {restored} into {DB_PATH}")
+    else:
+        if len(args) > 3 or not all(a.isascii() and a.isdigit() for a in args):
+            print("Usage: prune-backups [KEEP_LAST KEEP_DAILY KEEP_WEEKLY] (non-negative whole numbers)")
+            return 1
+        limits = [int(a) for a in args]
+        removed = backup.prune(BACKUP_DIR, *limits)
+        print(f"Removed {len(removed)} backup(s)")
+    return 0
+
+
+def print_overdue(library: Library, today: date | None = None) -> int:
+    """
+    Prints active loans past their due date, most overdue first.
+
+    Returns:
+        int: Number of overdue loans.
+    """
+    today = today or date.today()
+    loans = library.overdue_loans(today)
+    if not loans:
+        print("No overdue loans.")
+        return 0
+    print(f"\n--- Overdue Loans ({today.isoformat()}) ---")
+    for loan in loans:
+        days = (today - loan.due_date).days
+        print(f"Loan {loan.loan_id}: Member {loan.member_id} -> ISBN {loan.isbn} | Due: {loan.due_date.isoformat()} | {days} day(s) overdue")
+    return len(loans)
+
+
+def print_holds(library: Library, isbn: str) -> int:
+    """
+    Prints a book's hold queue: holds ready for pickup, then waiting ones in order.
+
+    Returns:
+        int: Number of holds.
+    """
+    holds = library.hold_queue(isbn)
+    if not holds:
+        print("No holds on this book.")
+        return 0
+    print(f"\n--- Holds on {isbn} ---")
+    for hold in holds:
+        status = "Ready for pickup" if hold.ready else f"Position {library.hold_position(hold.member_id, isbn)}"
+        print(f"Member {hold.member_id} | Placed: {hold.placed.isoformat()} | {status}")
+    return len(holds)
+
+
+def print_stats(library: Library, top: int = 10, days: int = 7) -> None:
+    """Prints the most borrowed books, the most active members and recent daily volumes."""
+    report = analytics.circulation_report(library, top=top, days=days)
+    average = report["average_loan_days"]
+    print("\n--- Circulation ---")
+    print(f"Loans: {report['total_loans']} ({report['active_loans']} active) | "
+          f"Average loan: {'n/a' if average is None else f'{average} day(s)'}")
+    print("Most borrowed books:")
+    for entry in report["top_books"]:
+        print(f"  {entry['loans']:>6}  {entry['isbn']}  {entry['title'] or '(removed)'}")
+    print("Most active members:")
+    for entry in report["top_members"]:
+        print(f"  {entry['loans']:>6}  {entry['member_id']}  {entry['name'] or '(removed)'}")
+    print("Daily volumes (issued / returned):")
+    for entry in report["daily"]:
+        print(f"  {entry['date']}  {entry['issued']:>5} / {entry['returned']}")
 
 
 def main(no_save: bool = False) -> tuple[Library, AuthSystem]:
@@ -55,7 +193,7 @@ def main(no_save: bool = False) -> tuple[Library, AuthSystem]:
     library = Library()
 
     # Load persisted state (library + auth). Falls back to new instances.
-    library, auth = storage.load_state("library_db.json")
+    library, auth = storage.load_state(DB_PATH)
     if not isinstance(auth, AuthSystem):
         # backwards compatibility (if storage returned a plain dict)
         auth = AuthSystem.from_dict(getattr(auth, "to_dict", lambda: {"users": {}})())
@@ -63,6 +201,9 @@ def main(no_save: bool = False) -> tuple[Library, AuthSystem]:
     # Ensure there is at least one default librarian
     if not auth.users:
         auth.register_user("admin", "admin")
+    # hash plaintext passwords left by older versions once, not on every load
+    if auth.migrate_passwords() and not no_save:
+        storage.commit(DB_PATH, library, auth)
 
     logged_in = False
 
@@ -75,25 +216,15 @@ def main(no_save: bool = False) -> tuple[Library, AuthSystem]:
 
     def save_now() -> None:
         try:
-            storage.save_state("library_db.json", library, auth)
-            print("State saved to library_db.json")
+            storage.save_state(DB_PATH, library, auth)
+            print(f"State saved to {DB_PATH}")
         except Exception as e:
             print(f"Failed to save state: {e}")
 
-    def create_backup(backup_dir: str = "backups") -> str:
-        p = Path(backup_dir)
-        p.mkdir(parents=True, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = p / f"library_db_{timestamp}.json"
-        # Ensure latest state is saved before backup
-        storage.save_state("library_db.json", library, auth)
-        try:
-            shutil.copy2("library_db.json", backup_path)
-            return str(backup_path)
-        except Exception:
-            # If library_db.json does not exist yet, write a fresh one
-            storage.save_state(str(backup_path), library, auth)
-            return str(backup_path)
+    def create_backup(backup_dir: str = BACKUP_DIR) -> backup.BackupResult:
+        # Ensure latest state is persisted before backup
+        storage.commit(DB_PATH, library, auth)
+        return backup.create_backup(backup_dir, library, auth)
 
     while True:
         print_menu()
@@ -201,8 +332,28 @@ def main(no_save: bool = False) -> tuple[Library, AuthSystem]:
             save_now()
 
         elif choice == "12":
-            path = create_backup()
-            print(f"Backup created at: {path}")
+            result = create_backup()
+            print(f"Backup {result.backup_id} created in {BACKUP_DIR} "
+                  f"({result.new_chunks} new chunk(s), {result.bytes_written} bytes written)")
+
+        elif choice == "13":
+            print_overdue(library)
+
+        elif choice in ("14", "15"):
+            member_id = input("Enter member ID: ").strip()
+            member = library.get_member(member_id)
+            if member is None:
+                print("Member not found.")
+                continue
+            isbn = input("Enter ISBN: ").strip()
+            success, message = (place_hold if choice == "14" else cancel_hold)(library, isbn, member)
+            print(message)
+
+        elif choice == "16":
+            print_holds(library, input("Enter ISBN: ").strip())
+
+        elif choice == "17":
+            print_stats(library)
 
         elif choice == "7":
             search_menu()
@@ -216,6 +367,9 @@ def main(no_save: bool = False) -> tuple[Library, AuthSystem]:
             elif s_choice == "3":
                 isbn = input("Enter ISBN: ").strip()
                 results = search_by_isbn(library, isbn)
+            elif s_choice == "4":
+                query = input("Enter words to search for: ").strip()
+                results = search_books(library, query)
             else:
                 print("Invalid search option.")
                 continue
@@ -266,6 +420,27 @@ def main(no_save: bool = False) -> tuple[Library, AuthSystem]:
 
 if __name__ == "__main__":
     import sys
+    # bulk commands: python library_management_system.py import-books books.csv
+    if len(sys.argv) >= 3 and sys.argv[1] in BULK_COMMANDS:
+        sys.exit(run_bulk_command(sys.argv[1], sys.argv[2]))
+    # overdue report for scheduled notice jobs: python library_management_system.py overdue [YYYY-MM-DD]
+    if len(sys.argv) >= 2 and sys.argv[1] == "overdue":
+        day = date.fromisoformat(sys.argv[2]) if len(sys.argv) >= 3 else None
+        print_overdue(storage.load_state(DB_PATH)[0], day)
+        sys.exit(0)
+    # circulation report: python library_management_system.py stats
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        print_stats(storage.load_state(DB_PATH)[0])
+        sys.exit(0)
+    # backups: python library_management_system.py backup | backups | restore [ID | --at ISO] | prune-backups
+    if len(sys.argv) >= 2 and sys.argv[1] in BACKUP_COMMANDS:
+        sys.exit(run_backup_command(sys.argv[1], sys.argv[2:]))
+    # snapshot format conversion: python library_management_system.py convert-db library_db.json library_db.lmsb
+    if len(sys.argv) >= 4 and sys.argv[1] == "convert-db":
+        storage.convert_snapshot(sys.argv[2], sys.argv[3])
+        print(f"Wrote {sys.argv[3]}")
+        sys.exit(0)
+
     # simple CLI flag parsing
     no_save_flag = "--no-save" in sys.argv
 
@@ -275,6 +450,6 @@ if __name__ == "__main__":
         # Save state on exit unless user disabled it
         if not no_save_flag:
             try:
-                storage.save_state("library_db.json", library, auth)
+                storage.save_state(DB_PATH, library, auth)
             except Exception:
                 pass
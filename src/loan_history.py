@@ -0,0 +1,372 @@
+"""
+Loan history module (Group C)
+
+Defines LoanHistory, a columnar store for returned loans, and LoanStore,
+the mapping behind `Library.loans` that keeps active loans as objects and
+moves returned ones into the history columns.
+
+Member IDs and ISBNs are interned into a shared string table and stored
+as integer indexes; dates are stored as proleptic Gregorian ordinals.
+Aggregations such as per-book circulation counts run over whole columns
+(with NumPy when it is installed) instead of looping over Loan objects.
+
+A lazily loaded store keeps returned loans as the raw dicts read from
+storage and only parses them into the columns when the history is first
+needed; single loans can be looked up before that.
+"""
+
+from __future__ import annotations
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from datetime import date
+from itertools import compress
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+try:  # optional: vectorized column operations
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when NumPy is absent
+    np = None
+
+# (member_id, isbn, issue_date, due_date, return_date) of a returned loan
+Fields = Tuple[str, str, date, date, Optional[date]]
+
+
+def is_plain_number(loan_id: str) -> bool:
+    """True for IDs as `Library` issues them: a positive number without leading zeros."""
+    return loan_id.isascii() and loan_id.isdigit() and loan_id[0] != "0"
+
+
+class LoanHistory:
+    """
+    Columnar store of returned loans.
+
+    Attributes:
+        row_of (Dict[str, int]): Maps loan IDs to their row.
+        member, isbn (array): Interned string indexes per row.
+        issued, due (array): Date ordinals per row.
+        closed (array): Return date ordinal per row; 0 for loans returned
+            before return dates were recorded.
+        returned (bytearray): Bitmap, one bit per row; a cleared bit marks a
+            row whose loan was reopened and moved back to the active set.
+    """
+
+    def __init__(self) -> None:
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        self.row_of: Dict[str, int] = {}
+        self.member = array("i")
+        self.isbn = array("i")
+        self.issued = array("i")
+        self.due = array("i")
+        self.closed = array("i")
+        self.returned = bytearray()
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def __contains__(self, loan_id: object) -> bool:
+        return loan_id in self.row_of
+
+    @property
+    def rows(self) -> int:
+        return len(self.member)
+
+    def string(self, idx: int) -> str:
+        return self._strings[idx]
+
+    def intern(self, value: str) -> int:
+        idx = self._string_ids.get(value)
+        if idx is None:
+            idx = len(self._strings)
+            self._strings.append(value)
+            self._string_ids[value] = idx
+        return idx
+
+    def append(self, loan_id: str, member_id: str, isbn: str, issue_date: date, due_date: date,
+               return_date: Optional[date] = None) -> int:
+        """Adds a returned loan and returns its row."""
+        row = self.rows
+        self.member.append(self.intern(member_id))
+        self.isbn.append(self.intern(isbn))
+        self.issued.append(issue_date.toordinal())
+        self.due.append(due_date.toordinal())
+        self.closed.append(return_date.toordinal() if return_date is not None else 0)
+        if row % 8 == 0:
+            self.returned.append(0)
+        self.returned[row >> 3] |= 1 << (row & 7)
+        self.row_of[loan_id] = row
+        return row
+
+    def fields(self, loan_id: str) -> Optional[Fields]:
+        """Returns (member_id, isbn, issue_date, due_date, return_date) of a loan, or None."""
+        row = self.row_of.get(loan_id)
+        return self.fields_at(row) if row is not None else None
+
+    def fields_at(self, row: int) -> Fields:
+        """Like `fields`, by row. Rows are never reused, so a row stays readable after its loan is discarded."""
+        closed = self.closed[row]
+        return (self._strings[self.member[row]], self._strings[self.isbn[row]],
+                date.fromordinal(self.issued[row]), date.fromordinal(self.due[row]),
+                date.fromordinal(closed) if closed else None)
+
+    def discard(self, loan_id: str) -> Optional[Fields]:
+        """Removes a loan (e.g. when it is reopened) and returns its fields."""
+        fields = self.fields(loan_id)
+        if fields is not None:
+            row = self.row_of.pop(loan_id)
+            self.returned[row >> 3] &= ~(1 << (row & 7)) & 0xFF
+            self._dead += 1
+        return fields
+
+    def set_due(self, loan_id: str, due_date: date) -> None:
+        self.due[self.row_of[loan_id]] = due_date.toordinal()
+
+    def items(self) -> Iterator[Tuple[str, Fields]]:
+        for loan_id in self.row_of:
+            yield loan_id, self.fields(loan_id)
+
+    # --- Column aggregations ---
+
+    def _live(self) -> Optional[Any]:
+        """Mask of rows still in the history, or None when every row is."""
+        if not self._dead:
+            return None
+        if np is not None:
+            bits = np.unpackbits(np.frombuffer(bytes(self.returned), dtype=np.uint8), bitorder="little")
+            return bits[:self.rows].astype(bool)
+        return [bool(self.returned[r >> 3] & (1 << (r & 7))) for r in range(self.rows)]
+
+    def _count(self, column: array) -> Dict[str, int]:
+        live = self._live()
+        if np is not None:
+            values = np.frombuffer(column, dtype=np.int32)
+            if live is not None:
+                values = values[live]
+            if not len(values):
+                return {}
+            counts = np.bincount(values, minlength=len(self._strings))
+            return {self._strings[i]: int(n) for i, n in enumerate(counts) if n}
+        values = column if live is None else compress(column, live)
+        return {self._strings[i]: n for i, n in Counter(values).items()}
+
+    def count_by_isbn(self) -> Dict[str, int]:
+        """Number of returned loans per ISBN."""
+        return self._count(self.isbn)
+
+    def count_by_member(self) -> Dict[str, int]:
+        """Number of returned loans per member ID."""
+        return self._count(self.member)
+
+    def count_issued_between(self, start: date, end: date) -> int:
+        """Number of returned loans issued in [start, end]."""
+        lo, hi = start.toordinal(), end.toordinal()
+        live = self._live()
+        if np is not None:
+            issued = np.frombuffer(self.issued, dtype=np.int32)
+            hits = (issued >= lo) & (issued <= hi)
+            if live is not None:
+                hits &= live
+            return int(hits.sum())
+        values = self.issued if live is None else compress(self.issued, live)
+        return sum(1 for d in values if lo <= d <= hi)
+
+    def _tally(self, column: array) -> Dict[int, int]:
+        """Rows per distinct nonzero value (a date ordinal) of `column`."""
+        live = self._live()
+        if np is not None:
+            values = np.frombuffer(column, dtype=np.int32)
+            if live is not None:
+                values = values[live]
+            values, counts = np.unique(values[values != 0], return_counts=True)
+            return dict(zip(values.tolist(), counts.tolist()))
+        values = column if live is None else compress(column, live)
+        counts = Counter(values)
+        counts.pop(0, None)
+        return dict(counts)
+
+    def count_by_issue_day(self) -> Dict[int, int]:
+        """Number of returned loans per issue date ordinal."""
+        return self._tally(self.issued)
+
+    def count_by_return_day(self) -> Dict[int, int]:
+        """Number of returned loans per return date ordinal (loans with a recorded return date only)."""
+        return self._tally(self.closed)
+
+    def loan_days(self) -> Tuple[int, int]:
+        """(total days on loan, number of loans) over loans with a recorded return date."""
+        live = self._live()
+        if np is not None:
+            issued = np.frombuffer(self.issued, dtype=np.int32)
+            closed = np.frombuffer(self.closed, dtype=np.int32)
+            known = closed != 0
+            if live is not None:
+                known &= live
+            return int((closed[known] - issued[known]).sum()), int(known.sum())
+        rows = zip(self.issued, self.closed)
+        if live is not None:
+            rows = compress(rows, live)
+        total = n = 0
+        for issued, closed in rows:
+            if closed:
+                total += closed - issued
+                n += 1
+        return total, n
+
+
+class LoanStore(Mapping):
+    """
+    Mapping of loan ID -> Loan used as `Library.loans`.
+
+    Active loans are kept as objects in `active`; returned loans live in
+    the columnar `history` and are rebuilt as Loan objects on access, so
+    mutating such an object does not change the stored loan. Use the
+    Library methods (`close_loan`, `update_loan`) to change loans.
+    """
+
+    def __init__(self, loan_factory: Callable[..., Any]) -> None:
+        self.active: Dict[str, Any] = {}
+        self._history = LoanHistory()
+        # returned loans not parsed yet: loan ID -> dict as stored
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._factory = loan_factory
+        # the largest plain-number loan ID, and any IDs that are not plain numbers
+        self.max_number = 0
+        self.irregular_ids: Set[str] = set()
+
+    def _note_id(self, loan_id: str) -> None:
+        if is_plain_number(loan_id):
+            self.max_number = max(self.max_number, int(loan_id))
+        else:
+            self.irregular_ids.add(loan_id)
+
+    @property
+    def history(self) -> LoanHistory:
+        """The history columns, including any returned loans still pending."""
+        if self._pending:
+            for loan_id, data in self._pending.items():
+                self._history.append(loan_id, *_raw_fields(data))
+            self._pending.clear()
+        return self._history
+
+    def __getitem__(self, loan_id: str) -> Any:
+        loan = self.active.get(loan_id)
+        if loan is not None:
+            return loan
+        data = self._pending.get(loan_id)
+        fields = _raw_fields(data) if data is not None else self._history.fields(loan_id)
+        if fields is None:
+            raise KeyError(loan_id)
+        member_id, isbn, issue_date, due_date, return_date = fields
+        return self._factory(loan_id=loan_id, member_id=member_id, isbn=isbn, issue_date=issue_date,
+                             due_date=due_date, returned=True, return_date=return_date)
+
+    def __contains__(self, loan_id: object) -> bool:
+        return loan_id in self.active or loan_id in self._pending or loan_id in self._history
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.active
+        yield from self._history.row_of
+        yield from self._pending
+
+    def __len__(self) -> int:
+        return len(self.active) + len(self._history) + len(self._pending)
+
+    def defer_all(self, loans: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Keeps returned loans (loan ID -> stored dict) unparsed until the
+        history is needed; returns the pending loans."""
+        self._pending.update(loans)
+        for loan_id in loans:
+            self._note_id(loan_id)
+        return self._pending
+
+    def refs(self) -> Iterator[Tuple[str, str, str]]:
+        """Yields (loan_id, member_id, isbn) of every loan without building Loan objects."""
+        for loan_id, loan in self.active.items():
+            yield loan_id, loan.member_id, loan.isbn
+        h = self._history
+        for loan_id, row in h.row_of.items():
+            yield loan_id, h.string(h.member[row]), h.string(h.isbn[row])
+        for loan_id, data in self._pending.items():
+            yield loan_id, str(data["member_id"]), str(data["isbn"])
+
+    def dicts(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yields (loan_id, dict) for serialization; pending loans are passed through as stored."""
+        for loan_id in self.active:
+            yield loan_id, self.active[loan_id].to_dict()
+        for loan_id in self._history.row_of:
+            yield loan_id, self[loan_id].to_dict()
+        yield from self._pending.items()
+
+    def capture(self) -> Callable[[], Iterator[Tuple[str, Dict[str, Any]]]]:
+        """
+        Records which loans exist now (call it under the library lock) and
+        returns a function that yields them as `dicts` does, without the lock.
+
+        Loans changed after the capture are yielded in their old or new
+        state; the history rows themselves are never moved or reused.
+        """
+        active = list(self.active.values())
+        rows = list(self._history.row_of.items())
+        pending = list(self._pending.items())
+        history = self._history
+
+        def dicts() -> Iterator[Tuple[str, Dict[str, Any]]]:
+            for loan in active:
+                yield loan.loan_id, loan.to_dict()
+            for loan_id, row in rows:
+                member_id, isbn, issue_date, due_date, return_date = history.fields_at(row)
+                yield loan_id, self._factory(loan_id=loan_id, member_id=member_id, isbn=isbn, issue_date=issue_date,
+                                             due_date=due_date, returned=True, return_date=return_date).to_dict()
+            yield from pending
+        return dicts
+
+    def add(self, loan: Any) -> None:
+        """Stores a loan in the active set or the history depending on `returned`."""
+        self._note_id(loan.loan_id)
+        if loan.returned:
+            self._history.append(loan.loan_id, loan.member_id, loan.isbn, loan.issue_date, loan.due_date,
+                                 loan.return_date)
+        else:
+            self.active[loan.loan_id] = loan
+
+    def numbered_ids(self, descending: bool = False, after: Optional[int] = None) -> Optional[Iterator[str]]:
+        """
+        Loan IDs in numeric order, starting past `after`, found by probing
+        consecutive numbers, so a page of IDs costs about the page size
+        (plus any gaps) instead of a scan. None when some IDs are not plain
+        numbers; scan then.
+        """
+        if self.irregular_ids:
+            return None
+        if descending:
+            top = self.max_number if after is None else min(after - 1, self.max_number)
+            numbers = range(top, 0, -1)
+        else:
+            numbers = range((after or 0) + 1, self.max_number + 1)
+        return (loan_id for loan_id in map(str, numbers) if loan_id in self)
+
+    def archive(self, loan_id: str) -> None:
+        """Moves an active loan into the history."""
+        loan = self.active.pop(loan_id)
+        self._history.append(loan.loan_id, loan.member_id, loan.isbn, loan.issue_date, loan.due_date,
+                             loan.return_date)
+
+    def restore(self, loan_id: str) -> Any:
+        """Moves a returned loan back into the active set and returns its object."""
+        data = self._pending.pop(loan_id, None)
+        fields = _raw_fields(data) if data is not None else self._history.discard(loan_id)
+        member_id, isbn, issue_date, due_date, _ = fields
+        loan = self._factory(loan_id=loan_id, member_id=member_id, isbn=isbn,
+                             issue_date=issue_date, due_date=due_date, returned=False)
+        self.active[loan_id] = loan
+        return loan
+
+
+def _raw_fields(data: Dict[str, Any]) -> Fields:
+    """(member_id, isbn, issue_date, due_date, return_date) of a loan dict as stored by `Loan.to_dict`."""
+    returned_on = data.get("return_date")
+    return (str(data["member_id"]), str(data["isbn"]),
+            date.fromisoformat(str(data["issue_date"])[:10]), date.fromisoformat(str(data["due_date"])[:10]),
+            date.fromisoformat(str(returned_on)[:10]) if returned_on else None)
@@ -18,6 +18,8 @@ class Member:
         borrowed_books (List[str]): List of ISBNs for borrowed books.
     """
 
+    __slots__ = ("member_id", "name", "borrowed_books")
+
     def __init__(self, member_id: str, name: str) -> None:
         self.member_id = member_id
         self.name = name
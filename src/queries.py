@@ -0,0 +1,240 @@
+"""
+Queries module
+
+Provides filtered, sorted and paginated listings of books, members and
+loans for the web API. Filters use the Library's search and loan indexes
+where possible, and pages are cut with keyset cursors so each response
+stays bounded no matter how large the collections grow.
+"""
+
+from __future__ import annotations
+import base64
+import heapq
+import itertools
+import json
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from library import Library
+from loan_history import is_plain_number
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+@dataclass
+class Page:
+    """One page of results plus the cursor for the next one (None on the last page)."""
+    items: List[Any]
+    next_cursor: Optional[str]
+    total: int
+
+
+def listing_version(library: Library) -> Tuple[int, int]:
+    """What a listing depends on: the library version and today's date (overdue filters move at midnight)."""
+    return library.version, date.today().toordinal()
+
+
+def listing_etag(prefix: str, version: Tuple[int, int]) -> str:
+    """The (unquoted) ETag of a listing at `listing_version`; `prefix` tells server instances apart."""
+    return f"{prefix}-{version[0]}-{version[1]}"
+
+
+def encode_cursor(key: Tuple[Any, ...], sort: str = "") -> str:
+    raw = json.dumps([sort, list(key)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort: str = "") -> Tuple[Any, ...]:
+    """
+    Decode a cursor produced by `encode_cursor` for the same `sort`.
+
+    Raises:
+        ValueError: If the cursor is malformed or was issued for another sort.
+    """
+    try:
+        name, key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor.") from None
+    if not isinstance(key, list) or not all(isinstance(v, (str, int)) and not isinstance(v, bool) for v in key):
+        raise ValueError("Invalid cursor.")
+    if name != sort:
+        raise ValueError("Cursor belongs to another sort order.")
+    return tuple(key)
+
+
+def _check_cursor(after: Tuple[Any, ...], k: Tuple[Any, ...]) -> None:
+    # compared against the first key so a forged cursor fails with ValueError, not TypeError
+    if len(after) != len(k) or any(type(a) is not type(b) for a, b in zip(after, k)):
+        raise ValueError("Invalid cursor.")
+
+
+def paginate(items: Iterable[Any], key: Callable[[Any], Tuple[Any, ...]], limit: int = DEFAULT_LIMIT,
+             cursor: Optional[str] = None, descending: bool = False, sort: str = "") -> Page:
+    """
+    Returns the `limit` items that follow `cursor` in `key` order.
+
+    Only the requested page is sorted (a bounded heap selection), not the
+    whole input, but every item is still visited once. Keys must be unique
+    tuples of strings and integers. `sort` names the order, so a cursor
+    from one sort is rejected by another.
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    after = decode_cursor(cursor, sort) if cursor else None
+    total = 0
+    candidates: List[Tuple[Tuple[Any, ...], Any]] = []
+    for item in items:
+        total += 1
+        k = key(item)
+        if after is not None and total == 1:
+            _check_cursor(after, k)
+        if after is None or (k < after if descending else k > after):
+            candidates.append((k, item))
+    select = heapq.nlargest if descending else heapq.nsmallest
+    chosen = select(limit + 1, candidates, key=lambda pair: pair[0])
+    next_cursor = encode_cursor(chosen[limit - 1][0], sort) if len(chosen) > limit else None
+    return Page(items=[item for _, item in chosen[:limit]], next_cursor=next_cursor, total=total)
+
+
+def _sort_spec(sort: str, keys: Dict[str, Callable[[Any], Tuple[Any, ...]]]) -> Tuple[Callable[[Any], Tuple[Any, ...]], bool]:
+    descending = sort.startswith("-")
+    name = sort[1:] if descending else sort
+    if name not in keys:
+        raise ValueError(f"Unknown sort key '{name}'. Expected one of: {', '.join(keys)}.")
+    return keys[name], descending
+
+
+def _natural(value: str) -> Tuple[int, str]:
+    # numeric IDs stored as strings sort by value: "9" < "10"
+    return len(value), value
+
+
+BOOK_SORTS: Dict[str, Callable[[Any], Tuple[Any, ...]]] = {
+    "isbn": lambda b: (b.isbn,),
+    "title": lambda b: (b.title.lower(), b.isbn),
+    "author": lambda b: (b.author.lower(), b.isbn),
+    "copies": lambda b: (b.copies, b.isbn),
+}
+
+MEMBER_SORTS: Dict[str, Callable[[Any], Tuple[Any, ...]]] = {
+    "member_id": lambda m: (m.member_id,),
+    "name": lambda m: (m.name.lower(), m.member_id),
+}
+
+LOAN_SORTS: Dict[str, Callable[[Any], Tuple[Any, ...]]] = {
+    "loan_id": lambda l: _natural(l.loan_id),
+    "due_date": lambda l: (l.due_date.isoformat(),) + _natural(l.loan_id),
+    "issue_date": lambda l: (l.issue_date.isoformat(),) + _natural(l.loan_id),
+}
+
+
+def query_books(library: Library, q: Optional[str] = None, title: Optional[str] = None,
+                author: Optional[str] = None, isbn: Optional[str] = None, available: Optional[bool] = None,
+                sort: str = "isbn", limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None) -> Page:
+    """
+    Lists books matching all given filters.
+
+    Args:
+        q: Words matched against title and author (see `SearchIndex.search`).
+        title / author: Case-insensitive substrings of the field.
+        isbn: Exact ISBN.
+        available: Only books with (True) or without (False) copies left.
+        sort: Key from `BOOK_SORTS`, prefixed with "-" for descending order.
+    """
+    key, descending = _sort_spec(sort, BOOK_SORTS)
+    isbns: Optional[set] = None
+
+    def narrow(found: Iterable[str]) -> None:
+        nonlocal isbns
+        found = set(found)
+        isbns = found if isbns is None else isbns & found
+
+    if isbn is not None:
+        narrow([isbn] if isbn in library.books else [])
+    if q:
+        narrow(i for i, _ in library.search_index.search(q))
+    if title:
+        narrow(library.search_index.match("title", title))
+    if author:
+        narrow(library.search_index.match("author", author))
+    books = library.books.values() if isbns is None else (library.books[i] for i in isbns)
+    if available is not None:
+        books = (b for b in books if (b.copies > 0) == available)
+    return paginate(books, key, limit, cursor, descending, sort)
+
+
+def query_members(library: Library, q: Optional[str] = None, sort: str = "member_id",
+                  limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None) -> Page:
+    """
+    Lists members whose ID or name contains `q` (case-insensitive).
+    """
+    key, descending = _sort_spec(sort, MEMBER_SORTS)
+    members: Iterable[Any] = library.members.values()
+    if q:
+        needle = q.lower()
+        members = (m for m in members if needle in m.member_id.lower() or needle in m.name.lower())
+    return paginate(members, key, limit, cursor, descending, sort)
+
+
+def query_loans(library: Library, member_id: Optional[str] = None, isbn: Optional[str] = None,
+                returned: Optional[bool] = None, overdue: Optional[bool] = None, sort: str = "loan_id",
+                limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None, today: Optional[date] = None) -> Page:
+    """
+    Lists loans matching all given filters.
+
+    Args:
+        member_id / isbn: Restrict to one member's or one book's loans (indexed).
+        returned: Only returned (True) or active (False) loans.
+        overdue: Only active loans past (True) or not past (False) their due date.
+        today: Reference date for `overdue`; defaults to today.
+    """
+    key, descending = _sort_spec(sort, LOAN_SORTS)
+    if (member_id, isbn, returned, overdue) == (None, None, None, None) and key is LOAN_SORTS["loan_id"]:
+        page = _loans_by_id(library, limit, cursor, descending, sort)
+        if page is not None:
+            return page
+    if member_id is not None:
+        loans: Iterable[Any] = library.loans_for_member(member_id)
+        if isbn is not None:
+            loans = (l for l in loans if l.isbn == isbn)
+    elif isbn is not None:
+        loans = library.loans_for_book(isbn)
+    elif overdue:
+        loans = library.overdue_loans(today)
+    elif returned is False:
+        loans = library.loans.active.values()
+    else:
+        loans = library.loans.values()
+    if returned is not None:
+        loans = (l for l in loans if bool(l.returned) == returned)
+    if overdue is not None:
+        today = today or date.today()
+        loans = (l for l in loans if (not l.returned and l.due_date < today) == overdue)
+    return paginate(loans, key, limit, cursor, descending, sort)
+
+
+def _loans_by_id(library: Library, limit: int, cursor: Optional[str], descending: bool, sort: str) -> Optional[Page]:
+    """
+    All loans in loan ID order without a scan: the page's IDs come from
+    `LoanStore.numbered_ids` and only those loans are built. Cursors are the
+    ones `paginate` makes for `LOAN_SORTS["loan_id"]`. None when some loan
+    IDs are not plain numbers.
+    """
+    if library.loans.irregular_ids:
+        return None
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    after = None
+    if cursor:
+        k = decode_cursor(cursor, sort)
+        if len(k) != 2 or not isinstance(k[1], str) or not is_plain_number(k[1]) or k != _natural(k[1]):
+            raise ValueError("Invalid cursor.")
+        after = int(k[1])
+    ids = library.loans.numbered_ids(descending, after)
+    if ids is None:
+        return None
+    chosen = list(itertools.islice(ids, limit + 1))
+    next_cursor = encode_cursor(_natural(chosen[limit - 1]), sort) if len(chosen) > limit else None
+    return Page(items=[library.loans[loan_id] for loan_id in chosen[:limit]], next_cursor=next_cursor,
+                total=len(library.loans))
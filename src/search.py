@@ -1,11 +1,13 @@
 """
 Search module (Group E)
 
-Provides search functions for books in the library.
+Provides search functions for books in the library. Each search holds
+`library.lock`, so books added or removed by other threads cannot change
+the index while it is read.
 """
 
 from __future__ import annotations
-from typing import List
+from typing import List, Optional
 
 from library import Library
 from book import Book
@@ -22,11 +24,8 @@ def search_by_title(library: Library, title: str) -> List[Book]:
     Returns:
         List[Book]: Matching books.
     """
-    title = title.lower()
-    return [
-        book for book in library.list_books()
-        if title in book.title.lower()
-    ]
+    with library.lock:
+        return [library.books[isbn] for isbn in library.search_index.match("title", title)]
 
 
 def search_by_author(library: Library, author: str) -> List[Book]:
@@ -40,11 +39,8 @@ def search_by_author(library: Library, author: str) -> List[Book]:
     Returns:
         List[Book]: Matching books.
     """
-    author = author.lower()
-    return [
-        book for book in library.list_books()
-        if author in book.author.lower()
-    ]
+    with library.lock:
+        return [library.books[isbn] for isbn in library.search_index.match("author", author)]
 
 
 def search_by_isbn(library: Library, isbn: str) -> List[Book]:
@@ -59,4 +55,20 @@ def search_by_isbn(library: Library, isbn: str) -> List[Book]:
         List[Book]: A list with the book if found, otherwise empty.
     """
     book = library.get_book(isbn)
-    return [book] if book is not None else []
\ No newline at end of file
+    return [book] if book is not None else []
+
+
+def search_books(library: Library, query: str, limit: Optional[int] = None) -> List[Book]:
+    """
+    Searches titles and authors for the words in `query`, best match first.
+
+    Args:
+        library (Library): The library instance.
+        query (str): Words or partial words to search for.
+        limit (Optional[int]): Maximum number of results.
+
+    Returns:
+        List[Book]: Matching books ranked by relevance.
+    """
+    with library.lock:
+        return [library.books[isbn] for isbn, _ in library.search_index.search(query, limit=limit)]
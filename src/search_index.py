@@ -0,0 +1,206 @@
+"""
+Search index module (Group E)
+
+Defines the SearchIndex class, an incrementally maintained index over
+book titles and authors used by `search.py`.
+"""
+
+from __future__ import annotations
+import re
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from book import Book
+
+
+_TOKEN_RE = re.compile(r"\w+")
+# longest character n-grams used for partial matches; shorter queries use
+# the 1- and 2-grams, so every non-empty query is answered from postings
+GRAM = 3
+FIELDS = ("title", "author")
+# score for a query token that equals a word of the field / only occurs inside it
+EXACT_WEIGHT = {"title": 3.0, "author": 2.0}
+PARTIAL_WEIGHT = {"title": 1.0, "author": 0.5}
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into lowercase word tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def ngrams(text: str, n: int = GRAM) -> Set[str]:
+    """Returns the set of character n-grams of `text`."""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _all_grams(text: str) -> Set[str]:
+    """The 1- to `GRAM`-grams of `text`, i.e. the keys it is posted under."""
+    grams: Set[str] = set()
+    for n in range(1, GRAM + 1):
+        grams |= ngrams(text, n)
+    return grams
+
+
+class SearchIndex:
+    """
+    Inverted index over book titles and authors.
+
+    For each field it keeps a word index (token -> ISBNs) and a character
+    n-gram index (1-, 2- and 3-gram -> ISBNs). Substring queries intersect
+    the posting sets of the query's trigrams (or look up its single 1- or
+    2-gram when it is shorter) and only verify the surviving candidates,
+    so lookups do not scan the catalogue, whatever the query length.
+
+    Attributes:
+        docs (Dict[str, Tuple[str, str, int]]): Maps ISBNs to the lowercased
+            title and author and an insertion sequence number.
+    """
+
+    def __init__(self) -> None:
+        self.docs: Dict[str, Tuple[str, str, int]] = {}
+        self._words: Dict[str, Dict[str, Set[str]]] = {f: {} for f in FIELDS}
+        self._grams: Dict[str, Dict[str, Set[str]]] = {f: {} for f in FIELDS}
+        self._seq = 0
+        # ISBNs registered with `defer` whose postings are not built yet
+        self._pending: List[str] = []
+        self._pending_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    # --- Maintenance ---
+
+    def add(self, book: Book) -> None:
+        """
+        Indexes a book, replacing any previous entry for its ISBN.
+
+        Args:
+            book (Book): The book to index.
+        """
+        if book.isbn in self.docs:
+            self.remove(book.isbn)
+        title, author = book.title.lower(), book.author.lower()
+        self._seq += 1
+        self.docs[book.isbn] = (title, author, self._seq)
+        self._post(book.isbn, title, author)
+
+    def defer(self, book: Book) -> None:
+        """
+        Registers a book like `add` but postpones building its postings
+        until the first query, so loading a large catalogue stays cheap.
+
+        Args:
+            book (Book): The book to index.
+        """
+        if book.isbn in self.docs:
+            self.remove(book.isbn)
+        self._seq += 1
+        self.docs[book.isbn] = (book.title.lower(), book.author.lower(), self._seq)
+        self._pending.append(book.isbn)
+
+    def _post(self, isbn: str, title: str, author: str) -> None:
+        for field, text in zip(FIELDS, (title, author)):
+            for token in set(tokenize(text)):
+                self._words[field].setdefault(token, set()).add(isbn)
+            for gram in _all_grams(text):
+                self._grams[field].setdefault(gram, set()).add(isbn)
+
+    def _flush(self) -> None:
+        """Builds the postings of deferred books (once, even with concurrent queries)."""
+        if not self._pending:
+            return
+        with self._pending_lock:
+            for isbn in self._pending:
+                doc = self.docs.get(isbn)
+                # removed or re-added books are already up to date
+                if doc is not None:
+                    self._post(isbn, doc[0], doc[1])
+            # cleared last, so other threads wait above until the postings are complete
+            self._pending = []
+
+    def remove(self, isbn: str) -> None:
+        """
+        Removes a book from the index; unknown ISBNs are ignored.
+
+        Args:
+            isbn (str): The ISBN of the book.
+        """
+        self._flush()
+        doc = self.docs.pop(isbn, None)
+        if doc is None:
+            return
+        for field, text in zip(FIELDS, doc[:2]):
+            for postings, keys in ((self._words[field], set(tokenize(text))), (self._grams[field], _all_grams(text))):
+                for key in keys:
+                    isbns = postings.get(key)
+                    if isbns is not None:
+                        isbns.discard(isbn)
+                        if not isbns:
+                            del postings[key]
+
+    # --- Queries ---
+
+    def match(self, field: str, text: str) -> List[str]:
+        """
+        Returns ISBNs whose `field` contains `text` (case-insensitive),
+        in the order the books were indexed.
+
+        Args:
+            field (str): "title" or "author".
+            text (str): Substring to look for.
+        """
+        self._flush()
+        text = text.lower()
+        pos = FIELDS.index(field)
+        candidates = self._candidates(field, text)
+        if candidates is None:
+            hits = [isbn for isbn, doc in self.docs.items() if text in doc[pos]]
+        else:
+            hits = [isbn for isbn in candidates if text in self.docs[isbn][pos]]
+        return sorted(hits, key=lambda isbn: self.docs[isbn][2])
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Ranks books against a free-text query over title and author.
+
+        Each query word scores a book by the field it matches in: a whole
+        word in the title counts most, then a whole word in the author,
+        then a partial (substring) match. Books matching more query words
+        rank higher; ties keep indexing order.
+
+        Args:
+            query (str): Words to look for.
+            limit (Optional[int]): Maximum number of results.
+
+        Returns:
+            List[Tuple[str, float]]: (ISBN, score) pairs, best first.
+        """
+        self._flush()
+        scores: Dict[str, float] = {}
+        for token in set(tokenize(query)):
+            best: Dict[str, float] = {}
+            for field in FIELDS:
+                exact = self._words[field].get(token, ())
+                for isbn in exact:
+                    best[isbn] = max(best.get(isbn, 0.0), EXACT_WEIGHT[field])
+                for isbn in self.match(field, token):
+                    if isbn not in exact:
+                        best[isbn] = max(best.get(isbn, 0.0), PARTIAL_WEIGHT[field])
+            for isbn, score in best.items():
+                scores[isbn] = scores.get(isbn, 0.0) + score
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.docs[item[0]][2]))
+        return ranked[:limit] if limit is not None else ranked
+
+    def _candidates(self, field: str, text: str) -> Optional[Set[str]]:
+        """Intersects n-gram postings; None for the empty text, which matches every book."""
+        if not text:
+            return None
+        grams = ngrams(text, min(len(text), GRAM))
+        postings = self._grams[field]
+        sets = sorted((postings.get(g, set()) for g in grams), key=len)
+        result = set(sets[0])
+        for s in sets[1:]:
+            if not result:
+                break
+            result &= s
+        return result
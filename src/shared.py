@@ -0,0 +1,170 @@
+"""
+Shared state module
+
+Lets several worker processes (e.g. `gunicorn -w 4 webapp:app`) serve one
+library. Each process keeps its own in-memory Library and AuthSystem; they
+stay consistent by coordinating through the storage backend:
+
+- Writes run under an exclusive lock file next to the database
+  (``<db>.lock``). A write first reloads state if another process has
+  written since, then mutates and commits before releasing the lock, so
+  writes are serialized across processes and never start from stale data.
+- Reads compare a cheap cursor of the storage (see
+  `StorageBackend.cursor`) with the one seen last. When it moved, only the
+  records written since are read (`StorageBackend.changes_since`: the
+  journal tail for JSON, the change log for SQLite) and applied in place;
+  the whole state is reloaded only after a full snapshot or when the
+  records are no longer available. Read requests run in parallel on every
+  core.
+"""
+
+from __future__ import annotations
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+import storage
+from library import Library
+from auth_system import AuthSystem
+
+
+LOCK_SUFFIX = ".lock"
+
+
+def lock_path(path: str | Path) -> Path:
+    p = Path(path)
+    return p.with_name(p.name + LOCK_SUFFIX)
+
+
+class SharedState:
+    """
+    Keeps a process-local Library/AuthSystem in sync with the storage at `path`.
+
+    Attributes:
+        library (Library): The process-local library; reloads replace its
+            contents in place, so references to it stay valid.
+        auth (AuthSystem): The process-local user database.
+        reloads (int): How many times the whole state was reloaded from storage.
+        replays (int): How many times only the new records were applied.
+    """
+
+    def __init__(self, path: str | Path, library: Library, auth: AuthSystem) -> None:
+        self.path = path
+        self.library = library
+        self.auth = auth
+        self.backend = storage.get_backend(path)
+        self.lock_path = lock_path(path)
+        self.reloads = 0
+        self.replays = 0
+        self._reload_lock = threading.Lock()
+        # set while a thread of this process holds the write lock; its state is
+        # current and must not be replaced under it
+        self._writing = False
+        # storage position the in-memory state was loaded from or last written to;
+        # None forces a full reload
+        self._cursor: Any = self.backend.cursor()
+
+    def refresh(self) -> bool:
+        """
+        Catches up with writes made by other processes since the last check.
+
+        Returns:
+            bool: True if state changed.
+        """
+        if self._writing or self.backend.cursor() == self._cursor:
+            return False
+        with self._reload_lock:
+            if self._writing:
+                return False
+            records, cursor = self.backend.changes_since(self._cursor)
+            if records == []:
+                self._cursor = cursor
+                return False
+            if records is not None:
+                try:
+                    self._apply(records)
+                except ValueError:
+                    records = None
+                else:
+                    self.replays += 1
+            if records is None:
+                # the cursor was taken before loading: a write that lands during
+                # the load is applied again by the next refresh, which is harmless
+                with storage.gc_paused():
+                    library, auth = self.backend.load(lazy=True)
+                self.library.replace_state(library)
+                self.auth.replace_state(auth)
+                self.reloads += 1
+            self._cursor = cursor
+            return True
+
+    def _apply(self, records: List[Dict[str, Any]]) -> None:
+        """Apply journal-form records to the in-memory state, in order."""
+        with self.library.lock:
+            for record in records:
+                for op in record.get("ops", ()):
+                    value = op.get("value") if op["op"] == "put" else None
+                    if op["kind"] == "users":
+                        self.auth.apply_change(op["key"], value)
+                    else:
+                        self.library.apply_change(op["kind"], op["key"], value)
+                if "next_loan_id" in record:
+                    self.library.apply_change("meta", "next_loan_id", record["next_loan_id"])
+
+    def acquire(self) -> int:
+        """
+        Takes the cross-process write lock and refreshes state.
+
+        Returns:
+            int: A token to pass to `release`.
+        """
+        # a fresh descriptor per holder, so threads of one process exclude each other too
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:  # pragma: no cover - Windows
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+            self.refresh()
+            with self._reload_lock:
+                self._writing = True
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def release(self, token: int) -> None:
+        """
+        Releases the write lock. Changes should already be committed; if
+        some are still pending, state is reloaded from storage on the next
+        refresh instead of diverging from the other processes.
+        """
+        try:
+            with self._reload_lock:
+                pending = any(self.library._dirty.values()) or bool(self.auth._dirty)
+                self._cursor = None if pending else self.backend.cursor()
+                self._writing = False
+        finally:
+            os.close(token)  # closing the descriptor drops the lock
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """Holds the write lock for the `with` block; commit before leaving it."""
+        token = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(token)
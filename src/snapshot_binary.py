@@ -0,0 +1,59 @@
+"""
+Binary snapshot module
+
+A compact binary encoding of the snapshot dictionary that `storage.py`
+otherwise writes as indented JSON. The dictionary is serialized with the
+standard library's `marshal`, which writes each repeated field name once
+and refers back to it afterwards, so files are a fraction of the JSON size
+and load without any text parsing.
+
+File layout:
+    MAGIC (4 bytes) | format version (uint16) | payload length (uint64) | payload
+
+The payload is `marshal` data: only load snapshot files this application
+wrote, never ones received from untrusted sources.
+"""
+
+from __future__ import annotations
+import marshal
+import struct
+from typing import Any, Dict
+
+MAGIC = b"LMSB"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct(">4sHQ")
+# marshal format understood by every supported Python version
+_MARSHAL_VERSION = 4
+
+
+def is_binary(head: bytes) -> bool:
+    """True if `head` (the first bytes of a file) starts a binary snapshot."""
+    return head[:len(MAGIC)] == MAGIC
+
+
+def encode(data: Dict[str, Any]) -> bytes:
+    """Encodes a snapshot dict ({"library": ..., "auth": ...}) with its header."""
+    body = marshal.dumps(data, _MARSHAL_VERSION)
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, len(body)) + body
+
+
+def decode(blob: bytes) -> Dict[str, Any]:
+    """
+    Decodes a binary snapshot back into the snapshot dict.
+
+    Raises:
+        ValueError: If the data is not a binary snapshot, was written by a
+            newer format version, or is truncated.
+    """
+    if len(blob) < _HEADER.size or not is_binary(blob):
+        raise ValueError("Not a binary library snapshot.")
+    _, version, length = _HEADER.unpack_from(blob)
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Snapshot format version {version} is newer than supported ({FORMAT_VERSION}).")
+    body = memoryview(blob)[_HEADER.size:]
+    if len(body) != length:
+        raise ValueError("Truncated binary snapshot.")
+    data = marshal.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("Malformed binary snapshot.")
+    return data
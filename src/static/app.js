@@ -8,27 +8,42 @@ async function api(path, method = 'GET', data = null) {
   return res.json();
 }
 
+// append one page of a paginated /api list to root, with a "Load more" button while pages remain
+async function appendPage(root, path, render, cursor = null){
+  const res = await api(cursor ? `${path}${path.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(cursor)}` : path);
+  (res.items || []).forEach(item => root.appendChild(render(item)));
+  if(res.next_cursor){
+    const more = document.createElement('button');
+    more.type = 'button';
+    more.className = 'list-group-item list-group-item-action text-center';
+    more.textContent = `Load more (${res.total} total)`;
+    more.addEventListener('click', ()=>{
+      more.remove();
+      appendPage(root, path, render, res.next_cursor);
+    });
+    root.appendChild(more);
+  }
+}
+
 async function loadBooks(){
-  const books = await api('/api/books');
   const root = document.getElementById('booksList');
   root.innerHTML = '';
-  books.forEach(b => {
+  await appendPage(root, '/api/books', b => {
     const el = document.createElement('div');
     el.className = 'list-group-item';
     el.innerHTML = `<div class="d-flex justify-content-between"><div><div class="book-title">${b.title}</div><div class="text-muted">${b.author}</div></div><div>ISBN:${b.isbn}<br>copies:${b.copies}</div></div>`;
-    root.appendChild(el);
+    return el;
   });
 }
 
 async function loadMembers(){
-  const members = await api('/api/members');
   const root = document.getElementById('membersList');
   root.innerHTML = '';
-  members.forEach(m => {
+  await appendPage(root, '/api/members', m => {
     const el = document.createElement('div');
     el.className = 'list-group-item';
     el.textContent = `${m.member_id} | ${m.name} | borrowed:${m.borrowed_books.length}`;
-    root.appendChild(el);
+    return el;
   });
 }
 
@@ -74,16 +89,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const q = document.getElementById('searchQ').value.trim();
     const t = document.getElementById('searchType').value;
     if(!q) return;
-    let res;
-    if(t==='title') res = await api('/api/books');
-    else if(t==='author') res = await api('/api/books');
-    else res = await api('/api/books');
-    // client-side filter for simplicity
-    const results = res.filter(b => {
-      if(t==='title') return b.title.toLowerCase().includes(q.toLowerCase());
-      if(t==='author') return b.author.toLowerCase().includes(q.toLowerCase());
-      return b.isbn===q;
-    });
+    const params = t==='title' ? {title: q} : t==='author' ? {author: q} : t==='any' ? {q: q} : {isbn: q};
+    const results = (await api('/api/books?' + new URLSearchParams(params))).items;
     const root = document.getElementById('searchResults'); root.innerHTML='';
     results.forEach(b=>{
       const el = document.createElement('div'); el.className='list-group-item'; el.textContent = `${b.title} | ${b.author} | ISBN:${b.isbn} | copies:${b.copies}`; root.appendChild(el);
@@ -1,14 +1,13 @@
 document.addEventListener('DOMContentLoaded', ()=>{
   async function loadBooks(){
-    const books = await api('/api/books');
     const root = document.getElementById('booksList');
     root.innerHTML = '';
-    books.forEach(b => {
+    await loadPaged(root, '/api/books', {sort: 'title'}, b => {
       const el = document.createElement('div');
       el.className = 'list-group-item d-flex justify-content-between align-items-start';
       el.setAttribute('data-isbn', b.isbn);
       el.innerHTML = `<div><div class="book-title">${b.title}</div><div class="text-muted">${b.author}</div><small class="text-muted">ISBN: ${b.isbn}</small></div><div class="text-end"><div>copies: <strong>${b.copies}</strong></div><div class="mt-2"><button class="btn btn-sm btn-outline-primary me-1 edit-book">Edit</button><button class="btn btn-sm btn-outline-danger delete-book">Delete</button></div></div>`;
-      root.appendChild(el);
+      return el;
     });
   }
   loadBooks();
@@ -38,7 +37,7 @@ document.addEventListener('DOMContentLoaded', ()=>{
 
   // delegate edit/delete with inline edit and confirmation modal
   document.getElementById('booksList').addEventListener('click', async (e)=>{
-    const el = e.target.closest('.list-group-item');
+    const el = e.target.closest('[data-isbn]');
     if(!el) return;
     const isbn = el.getAttribute('data-isbn');
     // delete flow: show confirm modal
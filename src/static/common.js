@@ -12,6 +12,32 @@ async function api(path, method = 'GET', data = null) {
 
 function el(id){ return document.getElementById(id); }
 
+// build a query string from an object, skipping empty values
+function qs(params = {}){
+  const q = new URLSearchParams();
+  Object.entries(params).forEach(([k, v]) => { if(v !== undefined && v !== null && v !== '') q.set(k, v); });
+  const s = q.toString();
+  return s ? '?' + s : '';
+}
+
+// render one page of a paginated /api list into root; adds a "Load more" button while pages remain
+async function loadPaged(root, path, params, render){
+  const res = await api(path + qs(params));
+  (res.items || []).forEach(item => root.appendChild(render(item)));
+  if(res.next_cursor){
+    const more = document.createElement('button');
+    more.type = 'button';
+    more.className = 'list-group-item list-group-item-action text-center text-primary';
+    more.textContent = `Load more (${res.total} total)`;
+    more.addEventListener('click', ()=>{
+      more.remove();
+      loadPaged(root, path, {...params, cursor: res.next_cursor}, render);
+    });
+    root.appendChild(more);
+  }
+  return res;
+}
+
 // show toast message; type: 'info'|'success'|'danger'
 function showToast(message, type = 'info'){
   const container = document.getElementById('toastContainer');
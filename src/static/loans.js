@@ -3,13 +3,12 @@ document.addEventListener('DOMContentLoaded', ()=>{
   if(!root) return;
 
   async function loadLoans(){
-    const loans = await api('/api/loans');
     root.innerHTML = '';
-    loans.forEach(l=>{
+    await loadPaged(root, '/api/loans', {sort: '-loan_id'}, l=>{
       const el = document.createElement('div');
       el.className = 'list-group-item d-flex justify-content-between align-items-start';
       el.innerHTML = `<div><div><strong>Loan ${l.loan_id}</strong></div><div class="text-muted">Member: ${l.member_id} — ISBN: ${l.isbn}</div><div class="text-muted">Due: ${l.due_date} — Issued: ${l.issue_date}</div></div><div class="text-end"><div>${l.returned?'<span class="badge bg-success">Returned</span>':'<span class="badge bg-warning text-dark">Active</span>'}</div><div class="mt-2"><button class="btn btn-sm btn-outline-primary edit-loan" data-loan="${l.loan_id}">Edit</button></div></div>`;
-      root.appendChild(el);
+      return el;
     });
   }
   loadLoans();
@@ -17,10 +16,8 @@ document.addEventListener('DOMContentLoaded', ()=>{
   root.addEventListener('click', async (e)=>{
     if(!e.target.classList.contains('edit-loan')) return;
     const loanId = e.target.getAttribute('data-loan');
-    // get loan details from API list (simple approach)
-    const loans = await api('/api/loans');
-    const loan = loans.find(x=>x.loan_id===loanId);
-    if(!loan) return showToast('Loan not found','danger');
+    const loan = await api('/api/loans/'+encodeURIComponent(loanId));
+    if(!loan || !loan.loan_id) return showToast('Loan not found','danger');
 
     // populate modal
     document.getElementById('editLoanId').textContent = loan.loan_id;
@@ -1,15 +1,14 @@
 document.addEventListener('DOMContentLoaded', ()=>{
   async function loadMembers(){
-    const members = await api('/api/members');
     const root = document.getElementById('membersList');
     if(!root) return;
     root.innerHTML = '';
-    members.forEach(m => {
+    await loadPaged(root, '/api/members', {}, m => {
       const el = document.createElement('div');
       el.className = 'list-group-item d-flex justify-content-between align-items-center';
       el.setAttribute('data-mid', m.member_id);
       el.innerHTML = `<div>${m.member_id} <span class="text-muted">| ${m.name}</span></div><div><small class="text-muted">borrowed: ${m.borrowed_books.length}</small> <button class="btn btn-sm btn-outline-primary ms-2 edit-member">Edit</button><button class="btn btn-sm btn-outline-danger ms-1 delete-member">Delete</button></div>`;
-      root.appendChild(el);
+      return el;
     });
   }
   loadMembers();
@@ -36,7 +35,7 @@ document.addEventListener('DOMContentLoaded', ()=>{
   }
 
   document.getElementById('membersList').addEventListener('click', async (e)=>{
-    const el = e.target.closest('.list-group-item');
+    const el = e.target.closest('[data-mid]');
     if(!el) return;
     const mid = el.getAttribute('data-mid');
     // delete -> show modal
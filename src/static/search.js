@@ -1,19 +1,35 @@
 document.addEventListener('DOMContentLoaded', ()=>{
   const btn = document.getElementById('searchBtn');
   if(!btn) return;
-  btn.addEventListener('click', async ()=>{
-    const q = document.getElementById('searchQ').value.trim();
+  const input = document.getElementById('searchQ');
+  let timer = null;
+  let seq = 0;
+
+  async function runSearch(){
+    const q = input.value.trim();
     const t = document.getElementById('searchType').value;
-    if(!q) return;
-    const res = await api('/api/books');
-    const results = res.filter(b => {
-      if(t==='title') return b.title.toLowerCase().includes(q.toLowerCase());
-      if(t==='author') return b.author.toLowerCase().includes(q.toLowerCase());
-      return b.isbn===q;
-    });
-    const root = document.getElementById('searchResults'); root.innerHTML='';
-    results.forEach(b=>{
-      const el = document.createElement('div'); el.className='list-group-item'; el.textContent = `${b.title} | ${b.author} | ISBN:${b.isbn} | copies:${b.copies}`; root.appendChild(el);
+    const root = document.getElementById('searchResults');
+    if(!q){ root.innerHTML = ''; return; }
+    // filtering happens server-side; only one page of matches is transferred
+    const params = {limit: 25};
+    if(t==='title') params.title = q;
+    else if(t==='author') params.author = q;
+    else if(t==='any') params.q = q;
+    else params.isbn = q;
+    const mine = ++seq;
+    const page = document.createElement('div');
+    page.className = 'list-group';
+    await loadPaged(page, '/api/books', params, b=>{
+      const el = document.createElement('div'); el.className='list-group-item'; el.textContent = `${b.title} | ${b.author} | ISBN:${b.isbn} | copies:${b.copies}`; return el;
     });
+    // ignore responses for queries that were superseded while in flight
+    if(mine !== seq) return;
+    root.replaceChildren(page);
+  }
+
+  btn.addEventListener('click', runSearch);
+  input.addEventListener('input', ()=>{
+    clearTimeout(timer);
+    timer = setTimeout(runSearch, 250);
   });
 });
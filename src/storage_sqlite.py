@@ -0,0 +1,271 @@
+"""
+storage_sqlite.py
+
+SQLite persistence backend (stdlib `sqlite3`).
+
+Books, members, loans, hold queues and users live in their own tables, so committing an
+issue or return touches a handful of rows instead of rewriting the whole
+database. Selected by `storage.get_backend` for ``.db``/``.sqlite``/``.sqlite3``
+paths.
+
+Every row written by a commit is also logged in the ``changes`` table, and
+a full save stores a new ``generation`` in ``meta``, so other processes
+can pick up just the rows changed since they last looked (see
+`SqliteBackend.changes_since`).
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from library import Library
+from auth_system import AuthSystem
+from storage import StorageBackend, _snapshot
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    isbn TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    copies INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    member_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    borrowed_books TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS loans (
+    loan_id TEXT PRIMARY KEY,
+    member_id TEXT NOT NULL,
+    isbn TEXT NOT NULL,
+    issue_date TEXT NOT NULL,
+    due_date TEXT NOT NULL,
+    returned INTEGER NOT NULL,
+    return_date TEXT
+);
+CREATE INDEX IF NOT EXISTS loans_member_id ON loans (member_id);
+CREATE INDEX IF NOT EXISTS loans_isbn ON loans (isbn);
+CREATE INDEX IF NOT EXISTS loans_returned ON loans (returned);
+CREATE TABLE IF NOT EXISTS holds (
+    isbn TEXT PRIMARY KEY,
+    holds TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL
+);
+"""
+
+# rows kept in the change log; a process further behind reloads everything
+CHANGE_LOG_ROWS = 10_000
+
+# kind -> (table, key column, value columns)
+TABLES: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    "books": ("books", "isbn", ("title", "author", "copies")),
+    "members": ("members", "member_id", ("name", "borrowed_books")),
+    "loans": ("loans", "loan_id", ("member_id", "isbn", "issue_date", "due_date", "returned", "return_date")),
+    "holds": ("holds", "isbn", ("holds",)),
+    "users": ("users", "username", ("password",)),
+    "meta": ("meta", "key", ("value",)),
+}
+
+
+def _to_row(kind: str, key: str, value: Any) -> Tuple[Any, ...]:
+    if kind == "members":
+        return key, value.get("name", ""), json.dumps(list(value.get("borrowed_books") or []))
+    if kind == "loans":
+        return (key, value["member_id"], value["isbn"], value["issue_date"], value["due_date"],
+                int(bool(value.get("returned", False))), value.get("return_date"))
+    if kind == "books":
+        return key, value.get("title", ""), value.get("author", ""), int(value.get("copies", 0))
+    if kind == "holds":
+        # one row per ISBN holding the whole queue in order
+        return key, json.dumps(value.get("holds") or [])
+    if kind == "meta":
+        return key, json.dumps(value)
+    return key, value
+
+
+def _from_row(kind: str, row: Tuple[Any, ...]) -> Any:
+    """The stored value of a row selected as (key column, *value columns); inverse of `_to_row`."""
+    if kind == "books":
+        isbn, title, author, copies = row
+        return {"isbn": isbn, "title": title, "author": author, "copies": copies}
+    if kind == "members":
+        mid, name, borrowed = row
+        return {"member_id": mid, "name": name, "borrowed_books": json.loads(borrowed)}
+    if kind == "loans":
+        lid, mid, isbn, issued, due, returned, returned_on = row
+        return {"loan_id": lid, "member_id": mid, "isbn": isbn, "issue_date": issued,
+                "due_date": due, "returned": bool(returned), "return_date": returned_on}
+    if kind == "holds":
+        isbn, queue = row
+        return {"isbn": isbn, "holds": json.loads(queue)}
+    if kind == "meta":
+        return json.loads(row[1])
+    return row[1]
+
+
+def _select(kind: str) -> str:
+    table, key_col, cols = TABLES[kind]
+    return f"SELECT {key_col}, {', '.join(cols)} FROM {table}"
+
+
+class SqliteBackend(StorageBackend):
+    """Stores the library in an SQLite database file.
+
+    Connections are opened per thread, so the backend can be shared by
+    the Flask request threads and a `storage.BackgroundSaver`.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # databases created before loans recorded their return date
+        if "return_date" not in {row[1] for row in conn.execute("PRAGMA table_info(loans)")}:
+            conn.execute("ALTER TABLE loans ADD COLUMN return_date TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        conn = self._conn()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+        self._local.depth = 1
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    def cursor(self) -> Tuple[Any, ...]:
+        # read from the tables, not file stats: WAL writes can leave sizes and mtimes unchanged
+        return self._conn().execute(
+            "SELECT (SELECT value FROM meta WHERE key = 'generation'), "
+            "COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'changes'), 0)").fetchone()
+
+    def changes_since(self, cursor: Any) -> Tuple[Optional[List[Dict[str, Any]]], Any]:
+        conn = self._conn()
+        # one read transaction, so the log and the rows it points at agree
+        conn.execute("BEGIN")
+        try:
+            current = self.cursor()
+            if cursor is None or current[0] != cursor[0]:
+                return None, current
+            seq = cursor[1]
+            if current[1] == seq:
+                return [], current
+            first = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            if first is None or first > seq + 1:
+                return None, current
+            record: Dict[str, Any] = {"ops": []}
+            changed = conn.execute("SELECT kind, key FROM changes WHERE seq > ? GROUP BY kind, key ORDER BY MAX(seq)",
+                                   (seq,)).fetchall()
+            for kind, key in changed:
+                row = conn.execute(f"{_select(kind)} WHERE {TABLES[kind][1]} = ?", (key,)).fetchone()
+                if kind == "meta":
+                    if row is not None:
+                        record[key] = _from_row(kind, row)
+                elif row is None:
+                    record["ops"].append({"op": "del", "kind": kind, "key": key})
+                else:
+                    record["ops"].append({"op": "put", "kind": kind, "key": key, "value": _from_row(kind, row)})
+            return [record], current
+        finally:
+            conn.execute("COMMIT")
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        table, key_col, cols = TABLES[kind]
+        placeholders = ", ".join("?" * (len(cols) + 1))
+        with self.transaction():
+            self._conn().execute(
+                f"INSERT OR REPLACE INTO {table} ({key_col}, {', '.join(cols)}) VALUES ({placeholders})",
+                _to_row(kind, key, value),
+            )
+            self._log(kind, key)
+
+    def delete(self, kind: str, key: str) -> None:
+        table, key_col, _ = TABLES[kind]
+        with self.transaction():
+            self._conn().execute(f"DELETE FROM {table} WHERE {key_col} = ?", (key,))
+            self._log(kind, key)
+
+    def _log(self, kind: str, key: str) -> None:
+        if kind == "meta" and key != "next_loan_id":
+            return
+        conn = self._conn()
+        seq = conn.execute("INSERT INTO changes (kind, key) VALUES (?, ?)", (kind, key)).lastrowid
+        conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - CHANGE_LOG_ROWS,))
+
+    def load(self, lazy: bool = False) -> Tuple[Library, AuthSystem]:
+        conn = self._conn()
+        data: Dict[str, Any] = {
+            kind: {row[0]: _from_row(kind, row) for row in conn.execute(_select(kind))}
+            for kind in ("books", "members", "loans", "holds")
+        }
+        users = dict(conn.execute(_select("users")))
+        meta = {k: json.loads(v) for k, v in conn.execute(_select("meta"))}
+        if "next_loan_id" in meta:
+            data["next_loan_id"] = meta["next_loan_id"]
+        return Library.from_dict(data, lazy=lazy), AuthSystem.from_dict({"users": users})
+
+    def save(self, library: Library, auth: AuthSystem) -> None:
+        conn = self._conn()
+        with _snapshot(library, auth) as state:
+            self._write_all(conn, state["library"], state["auth"]["users"])
+        # fold the WAL into the main file so it can be copied as a backup
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _write_all(self, conn: sqlite3.Connection, data: Dict[str, Any], users: Dict[str, str]) -> None:
+        with self.transaction():
+            for table, _, _ in TABLES.values():
+                conn.execute(f"DELETE FROM {table}")
+            for kind in ("books", "members", "loans", "holds"):
+                table, key_col, cols = TABLES[kind]
+                placeholders = ", ".join("?" * (len(cols) + 1))
+                conn.executemany(
+                    f"INSERT INTO {table} ({key_col}, {', '.join(cols)}) VALUES ({placeholders})",
+                    (_to_row(kind, key, value) for key, value in data[kind].items()),
+                )
+            conn.executemany("INSERT INTO users (username, password) VALUES (?, ?)", users.items())
+            self.put("meta", "next_loan_id", data["next_loan_id"])
+            # readers holding an older generation reload everything; AUTOINCREMENT
+            # keeps numbering after the old log so cursors never go backwards
+            conn.execute("DELETE FROM changes")
+            self.put("meta", "generation", uuid.uuid4().hex)
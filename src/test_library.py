@@ -9,12 +9,38 @@ import unittest
 from book import Book
 from member import Member
 from library import Library
-from issue_return import issue_book, return_book
-from search import search_by_title
+from issue_return import issue_book, return_book, issue_books, return_books, place_hold, cancel_hold
+from search import search_by_title, search_by_author, search_books
+import asyncio
+import json
 import storage
-from auth_system import AuthSystem
+from shared import SharedState
+from webapp_async import AsyncApp
+import queries
+import bulk
+import backup
+import io
+import metrics
+import analytics
+import loan_history
+from auth_system import AuthSystem, RateLimiter, is_hashed, hash_password
 import tempfile
 import os
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+
+class _NoScan(dict):
+    """A dict that fails the test when iterated."""
+
+    def items(self):
+        raise AssertionError("full scan")
+
+    def __iter__(self):
+        raise AssertionError("full scan")
 
 
 class TestLibrarySystem(unittest.TestCase):
@@ -108,6 +134,1353 @@ class TestLibrarySystem(unittest.TestCase):
             except Exception:
                 pass
 
+    def test_journal_commit_and_replay(self):
+        library = Library()
+        library.add_book(Book("j1", "Journal", "X", 1))
+        library.add_book(Book("j2", "Gone", "Y", 1))
+        member = Member("jm", "Journ")
+        library.add_member(member)
+        auth = AuthSystem()
+        auth.register_user("admin", "admin")
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.json")
+            storage.save_state(path, library, auth)
+
+            ok, msg = issue_book(library, "j1", member)
+            self.assertTrue(ok)
+            library.remove_book("j2")
+            storage.commit(path, library, auth)
+            # only the journal was written, and only the changed entities
+            jp = storage.journal_path(path)
+            self.assertTrue(jp.exists())
+            self.assertNotIn("Gone", jp.read_text(encoding="utf-8"))
+
+            lib2, auth2 = storage.load_state(path)
+            self.assertEqual(lib2.books["j1"].copies, 0)
+            self.assertNotIn("j2", lib2.books)
+            self.assertIn("j1", lib2.members["jm"].borrowed_books)
+            self.assertEqual(len(lib2.loans), 1)
+            self.assertEqual(lib2._next_loan_id, library._next_loan_id)
+
+            storage.compact(path, library, auth)
+            self.assertFalse(jp.exists())
+            lib3, _ = storage.load_state(path)
+            self.assertEqual(lib3.books["j1"].copies, 0)
+
+    def test_journal_folded_into_a_snapshot_is_not_replayed(self):
+        library = Library()
+        auth = AuthSystem()
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.json")
+            library.add_book(Book("f1", "Folded", "X", 1))
+            storage.commit(path, library, auth)
+            library.update_book("f1", title="Newer")
+            # crash between writing the snapshot and deleting the journal
+            jp = storage.journal_path(path)
+            journal = jp.read_bytes()
+            storage.save_state(path, library, auth)
+            jp.write_bytes(journal)
+            self.assertEqual(storage.load_state(path)[0].books["f1"].title, "Newer")
+
+            # later commits start a new journal, which is replayed
+            library.update_book("f1", title="Newest")
+            jp.unlink()
+            storage.commit(path, library, auth)
+            self.assertEqual(storage.load_state(path)[0].books["f1"].title, "Newest")
+
+    def test_journal_ignores_torn_tail(self):
+        library = Library()
+        auth = AuthSystem()
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.json")
+            library.add_book(Book("t1", "Torn", "X", 1))
+            storage.commit(path, library, auth)
+            with storage.journal_path(path).open("a", encoding="utf-8") as fh:
+                fh.write('{"ops":[{"op":"put"')
+            lib2, _ = storage.load_state(path)
+            self.assertIn("t1", lib2.books)
+
+    def test_binary_snapshot_roundtrip_and_conversion(self):
+        library = Library()
+        library.add_book(Book("x1", "Binary", "X", 2))
+        member = Member("xm", "Packed")
+        library.add_member(member)
+        self.assertTrue(issue_book(library, "x1", member)[0])
+        auth = AuthSystem()
+        auth.register_user("u", "p")
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.lmsb")
+            storage.save_state(path, library, auth)
+            with open(path, "rb") as fh:
+                self.assertEqual(fh.read(4), b"LMSB")
+            library.add_book(Book("x2", "Journaled", "Y", 1))
+            storage.commit(path, library, auth)
+            lib2, auth2 = storage.load_state(path)
+            self.assertEqual(lib2.to_dict(), library.to_dict())
+            self.assertTrue(auth2.authenticate("u", "p"))
+
+            # conversion folds in the journal; loading detects the format from content
+            json_path = os.path.join(d, "db.json")
+            storage.convert_snapshot(path, json_path)
+            with open(json_path, encoding="utf-8") as fh:
+                self.assertIn("x2", json.load(fh)["library"]["books"])
+            disguised = os.path.join(d, "binary.json")
+            storage.convert_snapshot(json_path, disguised, binary=True)
+            self.assertEqual(storage.load_state(disguised)[0].to_dict(), library.to_dict())
+
+            with open(disguised, "rb") as fh:
+                blob = fh.read()
+            with open(disguised, "wb") as fh:
+                fh.write(blob[:-10])
+            with self.assertRaises(ValueError):
+                storage.read_snapshot(disguised)
+
+    def test_atomic_snapshot_leaves_no_temp_file(self):
+        library = Library()
+        library.add_book(Book("a1", "Atomic", "X", 1))
+        auth = AuthSystem()
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.json")
+            storage.save_state(path, library, auth)
+            storage.save_state(path, library, auth)
+            self.assertEqual(os.listdir(d), ["db.json"])
+            lib2, _ = storage.load_state(path)
+            self.assertIn("a1", lib2.books)
+
+    def test_background_saver_coalesces_notifications(self):
+        library = Library()
+        auth = AuthSystem()
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.json")
+            saver = storage.BackgroundSaver(path, library, auth, interval_ms=50, save=storage.commit).start()
+            for i in range(20):
+                with saver.lock:
+                    library.add_book(Book(f"b{i}", "Bulk", "X", 1))
+                saver.notify()
+            saver.stop()
+            self.assertLess(saver.writes, 20)
+            self.assertIsNone(saver.last_error)
+            lib2, _ = storage.load_state(path)
+            self.assertEqual(len(lib2.books), 20)
+
+    def test_sqlite_backend_roundtrip_and_commit(self):
+        library = Library()
+        library.add_book(Book("s1", "Sqlite", "X", 2))
+        library.add_book(Book("s2", "Gone", "Y", 1))
+        member = Member("sm", "Rows")
+        library.add_member(member)
+        auth = AuthSystem()
+        auth.register_user("admin", "admin")
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.sqlite3")
+            storage.save_state(path, library, auth)
+            ok, msg = issue_book(library, "s1", member)
+            self.assertTrue(ok)
+            library.remove_book("s2")
+            storage.commit(path, library, auth)
+
+            lib2, auth2 = storage.load_state(path)
+            self.assertEqual(lib2.books["s1"].copies, 1)
+            self.assertNotIn("s2", lib2.books)
+            self.assertEqual(lib2.members["sm"].borrowed_books, ["s1"])
+            self.assertEqual(len(lib2.loans), 1)
+            self.assertEqual(lib2._next_loan_id, library._next_loan_id)
+            self.assertIn("admin", auth2.users)
+
+    def test_backend_transaction_rolls_back(self):
+        with tempfile.TemporaryDirectory() as d:
+            backend = storage.get_backend(os.path.join(d, "db.sqlite3"))
+            with self.assertRaises(RuntimeError):
+                with backend.transaction():
+                    backend.put("books", "r1", Book("r1", "Rollback", "X", 1).to_dict())
+                    raise RuntimeError("abort")
+            lib, _ = backend.load()
+            self.assertNotIn("r1", lib.books)
+
+    def test_loan_indexes(self):
+        library = Library()
+        library.add_book(Book("i1", "Indexed", "X", 3))
+        library.add_book(Book("i2", "Other", "Y", 3))
+        alice = Member("a", "Alice")
+        bob = Member("b", "Bob")
+        library.add_member(alice)
+        library.add_member(bob)
+
+        issue_book(library, "i1", alice)
+        issue_book(library, "i1", bob)
+        issue_book(library, "i2", alice)
+        self.assertEqual([l.isbn for l in library.loans_for_member("a")], ["i1", "i2"])
+        self.assertEqual(len(library.loans_for_book("i1")), 2)
+
+        loan = library.find_active_loan("b", "i1")
+        ok, msg = return_book(library, "i1", bob)
+        self.assertTrue(ok)
+        self.assertTrue(loan.returned)
+        self.assertIsNone(library.find_active_loan("b", "i1"))
+        self.assertEqual(library.loans_for_member("b", active_only=True), [])
+
+        # reopening a loan makes it active again, and indexes survive a roundtrip
+        library.update_loan(loan.loan_id, returned=False)
+        self.assertEqual(library.find_active_loan("b", "i1").loan_id, loan.loan_id)
+        lib2 = Library.from_dict(library.to_dict())
+        self.assertEqual(lib2.find_active_loan("a", "i2").loan_id, library.find_active_loan("a", "i2").loan_id)
+        self.assertEqual(len(lib2.loans_for_book("i1", active_only=True)), 2)
+
+    def test_search_index_tracks_edits(self):
+        library = Library()
+        library.add_book(Book("s1", "The Python Cookbook", "Beazley", 1))
+        library.add_book(Book("s2", "Fluent Python", "Ramalho", 1))
+        library.add_book(Book("s3", "Dune", "Herbert", 1))
+
+        self.assertEqual([b.isbn for b in search_by_title(library, "PYTH")], ["s1", "s2"])
+        self.assertEqual([b.isbn for b in search_by_author(library, "ama")], ["s2"])
+        self.assertEqual([b.isbn for b in search_by_title(library, "u")], ["s2", "s3"])
+
+        library.update_book("s3", title="Dune Messiah")
+        self.assertEqual([b.isbn for b in search_by_title(library, "messiah")], ["s3"])
+        library.remove_book("s1")
+        self.assertEqual([b.isbn for b in search_by_title(library, "python")], ["s2"])
+
+        lib2 = Library.from_dict(library.to_dict())
+        self.assertEqual([b.isbn for b in search_by_title(lib2, "messiah")], ["s3"])
+
+        # one- and two-character queries are answered from postings, not by scanning
+        index = library.search_index
+        index.docs = _NoScan(index.docs)
+        self.assertEqual(index.match("title", "Me"), ["s3"])
+        self.assertEqual(index.match("title", "n"), ["s2", "s3"])
+        self.assertEqual(index.match("author", "zz"), [])
+
+    def test_search_while_books_are_removed(self):
+        library = Library()
+        for i in range(200):
+            library.add_book(Book(f"c{i}", f"Concurrent {i}", "Writer", 1))
+        errors = []
+
+        def churn():
+            try:
+                for n in range(300):
+                    library.remove_book(f"c{n % 200}")
+                    library.add_book(Book(f"c{n % 200}", f"Concurrent {n}", "Writer", 1))
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        t = threading.Thread(target=churn)
+        t.start()
+        try:
+            while t.is_alive():
+                search_by_title(library, "concurrent")
+                search_by_author(library, "writer")
+                search_books(library, "concurrent writer", limit=10)
+        except Exception as e:
+            errors.append(e)
+        t.join()
+        self.assertEqual(errors, [])
+
+    def test_ranked_search(self):
+        library = Library()
+        library.add_book(Book("r1", "Herbert Goes Fishing", "Someone", 1))
+        library.add_book(Book("r2", "Dune", "Frank Herbert", 1))
+        library.add_book(Book("r3", "Children of Dune", "Frank Herbert", 1))
+
+        results = [b.isbn for b in search_books(library, "dune herbert")]
+        self.assertEqual(results[:2], ["r2", "r3"])
+        self.assertIn("r1", results)
+        self.assertEqual(len(search_books(library, "herb", limit=2)), 2)
+
+    def test_query_books_pages_with_cursor(self):
+        library = Library()
+        for i in range(7):
+            library.add_book(Book(f"q{i}", f"Title {6 - i}", "Author", i % 2))
+
+        seen = []
+        cursor = None
+        while True:
+            page = queries.query_books(library, sort="title", limit=3, cursor=cursor)
+            self.assertLessEqual(len(page.items), 3)
+            self.assertEqual(page.total, 7)
+            seen.extend(b.title for b in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), 7)
+
+        page = queries.query_books(library, available=True, sort="-isbn")
+        self.assertEqual([b.isbn for b in page.items], ["q5", "q3", "q1"])
+        page = queries.query_books(library, title="title 2")
+        self.assertEqual([b.isbn for b in page.items], ["q4"])
+        with self.assertRaises(ValueError):
+            queries.query_books(library, sort="nope")
+
+        # cursors from another sort, or forged ones, are rejected with ValueError
+        copies_cursor = queries.query_books(library, sort="copies", limit=2).next_cursor
+        forged = queries.encode_cursor((1, "q1"), "title")
+        for bad in (copies_cursor, forged, queries.encode_cursor(("x",), "title"), "!!"):
+            with self.assertRaises(ValueError):
+                queries.query_books(library, sort="title", cursor=bad)
+
+    def test_query_loans_filters(self):
+        library = Library()
+        library.add_book(Book("l1", "Loaned", "X", 5))
+        m1, m2 = Member("m1", "One"), Member("m2", "Two")
+        library.add_member(m1)
+        library.add_member(m2)
+        issue_book(library, "l1", m1)
+        issue_book(library, "l1", m2)
+        late = library.create_loan("m2", "l1")
+        library.update_loan(late.loan_id, due_date=date.today() - timedelta(days=1))
+
+        page = queries.query_loans(library, member_id="m2")
+        self.assertEqual([l.loan_id for l in page.items], ["2", "3"])
+        page = queries.query_loans(library, overdue=True)
+        self.assertEqual([l.loan_id for l in page.items], [late.loan_id])
+        return_book(library, "l1", m1)
+        page = queries.query_loans(library, returned=False, sort="-loan_id")
+        self.assertEqual([l.loan_id for l in page.items], ["3", "2"])
+
+    @unittest.skipIf(loan_history.np is None, "numpy not installed")
+    def test_history_aggregations_match_without_numpy(self):
+        from unittest import mock
+        history = loan_history.LoanHistory()
+        start = date(2024, 1, 1)
+        for i in range(50):
+            issued = start + timedelta(days=i % 7)
+            returned = issued + timedelta(days=i % 5) if i % 4 else None
+            history.append(str(i), f"m{i % 3}", f"b{i % 6}", issued, issued + timedelta(days=14), returned)
+        for i in range(0, 50, 9):
+            history.discard(str(i))
+
+        def aggregates():
+            return (history.count_by_isbn(), history.count_by_member(),
+                    history.count_issued_between(start + timedelta(days=2), start + timedelta(days=4)),
+                    history.count_by_issue_day(), history.count_by_return_day(), history.loan_days())
+
+        self.assertEqual(loan_history.LoanHistory().count_by_isbn(), {})
+        vectorized = aggregates()
+        with mock.patch.object(loan_history, "np", None):
+            self.assertEqual(loan_history.LoanHistory().count_by_isbn(), {})
+            self.assertEqual(aggregates(), vectorized)
+
+    def test_query_loans_by_id_builds_only_the_page(self):
+        library = Library()
+        for i in range(300):
+            loan = library.create_loan(f"m{i % 7}", f"b{i % 11}")
+            if i % 3:
+                library.close_loan(loan.loan_id)
+        built = []
+        factory = library.loans._factory
+        library.loans._factory = lambda **kw: built.append(kw["loan_id"]) or factory(**kw)
+        for sort in ("-loan_id", "loan_id"):
+            ids, cursor = [], None
+            while True:
+                page = queries.query_loans(library, sort=sort, limit=40, cursor=cursor)
+                self.assertEqual(page.total, 300)
+                ids += [l.loan_id for l in page.items]
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+            expected = [str(n) for n in range(1, 301)]
+            self.assertEqual(ids, expected[::-1] if sort.startswith("-") else expected)
+        # only returned loans on the pages were rebuilt from the history columns
+        self.assertEqual(len(built), 200 * 2)
+
+        # cursors are the same as a scan's, and non-numeric IDs fall back to one
+        first = queries.query_loans(library, sort="-loan_id", limit=40)
+        scan = queries.paginate(library.loans.values(), queries.LOAN_SORTS["loan_id"], 40, descending=True,
+                                sort="-loan_id")
+        self.assertEqual(first.next_cursor, scan.next_cursor)
+        with self.assertRaises(ValueError):
+            queries.query_loans(library, sort="loan_id", cursor=queries.encode_cursor((2, "07"), "loan_id"))
+        library.loans.add(Library.Loan(loan_id="x9", member_id="m1", isbn="b1", issue_date=date.today(),
+                                       due_date=date.today()))
+        page = queries.query_loans(library, sort="-loan_id", limit=2)
+        self.assertEqual([l.loan_id for l in page.items], ["300", "299"])
+        self.assertEqual(page.total, 301)
+
+    def test_version_bumps_on_mutation(self):
+        library = Library()
+        v0 = library.version
+        library.add_book(Book("v1", "Versioned", "X", 1))
+        member = Member("vm", "Ver")
+        library.add_member(member)
+        v1 = library.version
+        self.assertGreater(v1, v0)
+        library.get_book("v1")
+        library.list_members()
+        self.assertEqual(library.version, v1)
+        issue_book(library, "v1", member)
+        self.assertGreater(library.version, v1)
+
+    def test_cached_get_etags_and_invalidation(self):
+        try:
+            import flask  # noqa: F401
+        except ImportError:
+            self.skipTest("flask not installed")
+        from unittest import mock
+        with tempfile.TemporaryDirectory() as d:
+            os.environ["LMS_DB_PATH"] = os.path.join(d, "db.json")
+            try:
+                import webapp
+            finally:
+                os.environ.pop("LMS_DB_PATH", None)
+            client = webapp.app.test_client()
+            self.assertTrue(client.post("/api/login", json={"username": "admin", "password": "admin"}).get_json()["ok"])
+            first = client.get("/api/books?limit=5")
+            etag = first.headers["ETag"]
+            hits = webapp.RESPONSE_CACHE.value(result="hit")
+            self.assertEqual(client.get("/api/books?limit=5").data, first.data)
+            self.assertEqual(webapp.RESPONSE_CACHE.value(result="hit"), hits + 1)
+            self.assertEqual(client.get("/api/books?limit=5", headers={"If-None-Match": etag}).status_code, 304)
+
+            # a mutation changes the ETag and the body
+            client.post("/api/books", json={"isbn": "e1", "title": "Etag", "author": "X", "copies": 1})
+            fresh = client.get("/api/books?limit=5", headers={"If-None-Match": etag})
+            self.assertEqual(fresh.status_code, 200)
+            self.assertNotEqual(fresh.headers["ETag"], etag)
+            self.assertIn(b"e1", fresh.data)
+
+            # so does a new day, since overdue filters depend on it
+            etag = fresh.headers["ETag"]
+
+            class Tomorrow(date):
+                @classmethod
+                def today(cls):
+                    return date.today() + timedelta(days=1)
+
+            with mock.patch.object(queries, "date", Tomorrow):
+                self.assertEqual(client.get("/api/books?limit=5", headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_shared_mode_logins_skip_the_write_lock(self):
+        try:
+            import flask  # noqa: F401
+        except ImportError:
+            self.skipTest("flask not installed")
+        from unittest import mock
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.json")
+            os.environ["LMS_DB_PATH"] = path
+            try:
+                import webapp
+            finally:
+                os.environ.pop("LMS_DB_PATH", None)
+            webapp.auth.users["legacy"] = "pw"
+            storage.save_state(path, webapp.library, webapp.auth)
+            shared = SharedState(path, webapp.library, webapp.auth)
+            acquired = []
+            acquire = shared.acquire
+
+            def counting_acquire():
+                acquired.append(1)
+                return acquire()
+
+            shared.acquire = counting_acquire
+            with mock.patch.object(webapp, "shared", shared), mock.patch.object(webapp, "DB_PATH", path):
+                client = webapp.app.test_client()
+                self.assertTrue(client.post("/api/login", json={"username": "admin", "password": "admin"}).get_json()["ok"])
+                client.post("/api/logout")
+                self.assertEqual(len(acquired), 0)
+                # migrating a plaintext password commits it under the lock
+                self.assertTrue(client.post("/api/login", json={"username": "legacy", "password": "pw"}).get_json()["ok"])
+                self.assertEqual(len(acquired), 1)
+                self.assertTrue(is_hashed(storage.load_state(path)[1].users["legacy"]))
+                client.post("/api/members", json={"member_id": "lm1", "name": "Locked"})
+                self.assertEqual(len(acquired), 2)
+            webapp.auth.users.pop("legacy")
+
+    def test_failing_requests_release_the_profiler(self):
+        try:
+            import flask  # noqa: F401
+        except ImportError:
+            self.skipTest("flask not installed")
+        from unittest import mock
+        with tempfile.TemporaryDirectory() as d:
+            os.environ["LMS_DB_PATH"] = os.path.join(d, "db.json")
+            try:
+                import webapp
+            finally:
+                os.environ.pop("LMS_DB_PATH", None)
+            profiler = metrics.SlowRequestProfiler(threshold_ms=10_000, out_dir=d)
+            client = webapp.app.test_client()
+            boom = mock.Mock(side_effect=RuntimeError("boom"))
+            with mock.patch.object(webapp, "profiler", profiler), \
+                    mock.patch.object(webapp.analytics, "circulation_report", boom), \
+                    mock.patch.dict(webapp.app.config, {"PROPAGATE_EXCEPTIONS": True}):
+                # with propagated exceptions (debug/testing) Flask skips after_request
+                with self.assertRaises(RuntimeError):
+                    client.get("/api/stats")
+                self.assertFalse(profiler._busy.locked())
+                profile = profiler.start()
+                self.assertIsNotNone(profile)
+                profiler.finish(profile, 0.0, "GET /api/stats")
+
+    def test_prune_backups_rejects_bad_counts(self):
+        from unittest import mock
+        import contextlib
+        import library_management_system as cli
+        with tempfile.TemporaryDirectory() as d:
+            out = io.StringIO()
+            with mock.patch.object(cli, "BACKUP_DIR", d), contextlib.redirect_stdout(out):
+                self.assertEqual(cli.run_backup_command("prune-backups", ["ten"]), 1)
+                self.assertEqual(cli.run_backup_command("prune-backups", ["-1"]), 1)
+                self.assertEqual(cli.run_backup_command("prune-backups", ["5", "3"]), 0)
+            self.assertIn("Usage: prune-backups", out.getvalue())
+            self.assertIn("Removed 0 backup(s)", out.getvalue())
+
+    def test_bulk_import_books_in_batches(self):
+        library = Library()
+        data = io.StringIO(
+            "isbn,title,author,copies\n"
+            "b1,First,A,2\n"
+            ",No Isbn,B,1\n"
+            "b2,Second,C,x\n"
+            "b3,Third,D,1\n"
+            "b1,First,A,1\n"
+        )
+        commits = []
+        report = bulk.import_books(library, bulk.read_rows(data, "csv"), commit=lambda: commits.append(1), batch_size=2)
+        self.assertEqual(report.imported, 3)
+        self.assertEqual(report.failed, 2)
+        self.assertEqual([e["row"] for e in report.errors], [2, 3])
+        self.assertIn("isbn", report.errors[0]["errors"])
+        self.assertEqual(len(commits), report.batches)
+        self.assertEqual(library.books["b1"].copies, 3)
+
+        rows = bulk.read_rows(io.StringIO('{"member_id": "m1", "name": "One"}\nnot json\n'), "ndjson")
+        report = bulk.import_members(library, rows)
+        self.assertEqual((report.imported, report.failed), (1, 1))
+
+    def test_bulk_export_roundtrip(self):
+        library = Library()
+        library.add_book(Book("e1", "Export, with comma", "X", 1))
+        library.add_book(Book("e2", "Second", "Y", 0))
+        for fmt in bulk.FORMATS:
+            out = io.StringIO()
+            self.assertEqual(bulk.export_books(library, out, fmt), 2)
+            lib2 = Library()
+            out.seek(0)
+            report = bulk.import_books(lib2, bulk.read_rows(out, fmt))
+            self.assertEqual(report.failed, 0)
+            self.assertEqual(lib2.books["e1"].title, "Export, with comma")
+            self.assertEqual(lib2.books["e2"].copies, 0)
+
+    def test_export_reads_keys_in_chunks_while_books_change(self):
+        from unittest import mock
+        library = Library()
+        for i in range(7):
+            library.add_book(Book(f"k{i}", f"Chunk {i}", "X", 1))
+        with mock.patch.object(bulk, "EXPORT_CHUNK", 2):
+            rows = bulk.iter_books(library)
+            exported = [next(rows)["isbn"] for _ in range(3)]
+            self.assertEqual(exported, ["k0", "k1", "k2"])
+            # k2 ends the second chunk; k3 is in none yet
+            library.remove_book("k0")
+            library.remove_book("k3")
+            library.add_book(Book("k7", "Chunk 7", "X", 1))
+            exported += [row["isbn"] for row in rows]
+            self.assertEqual(exported, ["k0", "k1", "k2", "k4", "k5", "k6", "k7"])
+
+            # removing the whole exported chunk resumes at its position
+            rows = bulk.iter_books(library)
+            exported = [next(rows)["isbn"] for _ in range(2)]
+            library.remove_book("k1")
+            library.remove_book("k2")
+            exported += [row["isbn"] for row in rows]
+            self.assertEqual(exported, ["k1", "k2", "k4", "k5", "k6", "k7"])
+
+    def test_entities_are_slotted(self):
+        book = Book("x1", "Slots", "X", 1)
+        member = Member("m1", "Slim")
+        loan = Library().create_loan("m1", "x1")
+        for obj in (book, member, loan):
+            self.assertFalse(hasattr(obj, "__dict__"))
+        self.assertEqual(Book.from_dict(book.to_dict()).to_dict(), book.to_dict())
+        self.assertEqual(Library.Loan.from_dict(loan.to_dict()), loan)
+
+    def test_returned_loans_move_to_columnar_history(self):
+        library = Library()
+        library.add_book(Book("h1", "History", "X", 5))
+        library.add_book(Book("h2", "Other", "Y", 5))
+        member = Member("hm", "Hist")
+        library.add_member(member)
+        for isbn in ("h1", "h2", "h1"):
+            issue_book(library, isbn, member)
+            return_book(library, isbn, member)
+        issue_book(library, "h1", member)
+
+        self.assertEqual(len(library.loans.active), 1)
+        self.assertEqual(len(library.loans.history), 3)
+        self.assertEqual(len(library.loans), 4)
+        self.assertTrue(library.loans["1"].returned)
+        self.assertEqual(library.circulation_counts(), {"h1": 3, "h2": 1})
+
+        new_due = date.today() + timedelta(days=30)
+        library.update_loan("2", due_date=new_due)
+        self.assertEqual(library.loans["2"].due_date, new_due)
+        reopened = library.update_loan("2", returned=False)
+        self.assertFalse(reopened.returned)
+        self.assertIn("2", library.loans.active)
+        self.assertEqual(library.loans.history.count_by_isbn(), {"h1": 2})
+
+        lib2 = Library.from_dict(library.to_dict())
+        self.assertEqual(lib2.to_dict(), library.to_dict())
+        self.assertEqual(lib2.loans["2"].due_date, new_due)
+
+    def test_concurrent_issue_return_keeps_invariants(self):
+        library = Library()
+        copies = {f"c{i}": 3 for i in range(5)}
+        for isbn, n in copies.items():
+            library.add_book(Book(isbn, f"Title {isbn}", "X", n))
+        members = [Member(f"cm{i}", f"M{i}") for i in range(8)]
+        for m in members:
+            library.add_member(m)
+        errors = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(300):
+                    member, isbn = rng.choice(members), rng.choice(list(copies))
+                    if rng.random() < 0.5:
+                        issue_book(library, isbn, member)
+                    else:
+                        return_book(library, isbn, member)
+                    if rng.random() < 0.05:
+                        Library.from_dict(library.to_dict())
+            except Exception as e:  # surfaced below; a thread cannot fail the test itself
+                errors.append(e)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        self.assertEqual(errors, [])
+        active = list(library.loans.active.values())
+        self.assertEqual(len(set(library.loans)), len(library.loans))
+        for isbn, n in copies.items():
+            book = library.get_book(isbn)
+            self.assertGreaterEqual(book.copies, 0)
+            self.assertEqual(book.copies + sum(1 for l in active if l.isbn == isbn), n)
+        for m in members:
+            self.assertLessEqual(len(m.borrowed_books), library.max_books_per_member)
+            # issuing a title the member already holds adds a loan but not a second
+            # borrowed entry, so only check that every borrowed book has a loan
+            self.assertLessEqual(set(m.borrowed_books),
+                                 {l.isbn for l in active if l.member_id == m.member_id})
+
+    def test_shared_state_syncs_workers_through_storage(self):
+        for name in ("db.json", "db.sqlite"):
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, name)
+                # two "worker processes", each with its own in-memory state
+                workers = []
+                for _ in range(2):
+                    library, auth = storage.load_state(path)
+                    workers.append(SharedState(path, library, auth))
+                a, b = workers
+
+                with a.write():
+                    a.library.add_book(Book("s1", "Shared", "X", 1))
+                    storage.commit(path, a.library, a.auth)
+                self.assertFalse(a.refresh())
+                version = b.library.version
+                self.assertTrue(b.refresh())
+                self.assertGreater(b.library.version, version)
+                self.assertEqual(b.library.get_book("s1").title, "Shared")
+
+                # writes from both workers serialize on the lock file and none are lost
+                def add_books(worker, prefix):
+                    for i in range(10):
+                        with worker.write():
+                            worker.library.add_book(Book(f"{prefix}{i}", "T", "A", 1))
+                            storage.commit(path, worker.library, worker.auth)
+
+                threads = [threading.Thread(target=add_books, args=(w, p)) for w, p in ((a, "a"), (b, "b"))]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                a.refresh()
+                self.assertEqual(len(a.library.books), 21)
+                self.assertEqual(len(storage.load_state(path)[0].books), 21)
+
+    def test_shared_state_replays_only_new_changes(self):
+        for name in ("db.json", "db.sqlite"):
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, name)
+                setup, auth = storage.load_state(path)
+                setup.add_book(Book("r1", "River", "X", 1))
+                setup.add_member(Member("m1", "Ann"))
+                setup.add_member(Member("m2", "Bob"))
+                storage.save_state(path, setup, auth)
+                a, b = (SharedState(path, *storage.load_state(path)) for _ in range(2))
+                b.library.stats  # built before the replays, so they must keep it current
+
+                with a.write():
+                    issue_book(a.library, "r1", a.library.get_member("m1"))
+                    place_hold(a.library, "r1", a.library.get_member("m2"))
+                    a.library.update_book("r1", title="Ocean")
+                    a.auth.register_user("carol", "pw")
+                    storage.commit(path, a.library, a.auth)
+                with a.write():
+                    return_book(a.library, "r1", a.library.get_member("m1"))
+                    storage.commit(path, a.library, a.auth)
+
+                version = b.library.version
+                self.assertTrue(b.refresh())
+                self.assertEqual((b.replays, b.reloads), (1, 0), name)
+                self.assertGreater(b.library.version, version)
+                self.assertFalse(b.refresh())
+                self.assertEqual(b.library.to_dict(), a.library.to_dict())
+                self.assertEqual([bk.isbn for bk in search_by_title(b.library, "ocean")], ["r1"])
+                self.assertEqual(search_by_title(b.library, "river"), [])
+                self.assertEqual([h.isbn for h in b.library.holds_for_member("m2")], ["r1"])
+                self.assertTrue(b.auth.authenticate("carol", "pw"))
+                batch = analytics.CirculationStats.from_loans(b.library.loans)
+                for field in ("by_isbn", "by_member", "total", "active", "returned_by_day"):
+                    self.assertEqual(getattr(b.library.stats, field), getattr(batch, field), field)
+
+                # a new full snapshot cannot be replayed; it is reloaded
+                storage.save_state(path, a.library, a.auth)
+                self.assertTrue(b.refresh())
+                self.assertEqual(b.reloads, 1)
+
+    def test_async_server_stays_responsive_while_the_library_is_locked(self):
+        async def scenario(path):
+            library, auth = Library(), AuthSystem()
+            app = AsyncApp(library, auth, db_path=path)
+            server = await app.serve("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+
+            async def get(target):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(f"GET {target} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".encode())
+                data = await reader.read()
+                writer.close()
+                return data
+
+            locked, release = threading.Event(), threading.Event()
+
+            def hold_lock():
+                with library.lock:
+                    locked.set()
+                    release.wait(5)
+
+            holder = threading.Thread(target=hold_lock)
+            holder.start()
+            locked.wait(5)
+            listing = asyncio.ensure_future(get("/api/books"))
+            # the listing waits for the lock in the executor; other requests are still served
+            me = await asyncio.wait_for(get("/api/me"), 2)
+            self.assertIn(b'"user": null', me)
+            self.assertFalse(listing.done())
+            release.set()
+            self.assertIn(b" 200 ", await asyncio.wait_for(listing, 5))
+            holder.join()
+            server.close()
+            await server.wait_closed()
+            app.saver.stop()
+
+        with tempfile.TemporaryDirectory() as d:
+            asyncio.run(scenario(os.path.join(d, "db.json")))
+
+    def test_async_sessions_expire_and_are_bounded(self):
+        from unittest import mock
+        import webapp_async
+        app = AsyncApp(Library(), AuthSystem())
+        with mock.patch.object(webapp_async, "MAX_SESSIONS", 2):
+            tokens = [app._login(u).headers["Set-Cookie"].split(";")[0].split("=", 1)[1] for u in ("a", "b", "c")]
+        self.assertEqual(list(app.sessions), tokens[1:])
+        self.assertIsNone(app._session_user(tokens[0]))
+        self.assertEqual(app._session_user(tokens[1]), "b")
+        app.sessions[tokens[2]] = ("c", time.monotonic() - 1)
+        self.assertIsNone(app._session_user(tokens[2]))
+        self.assertNotIn(tokens[2], app.sessions)
+
+    def test_async_api_over_keepalive_connection(self):
+        from unittest import mock
+
+        async def scenario(path):
+            library, auth = Library(), AuthSystem()
+            auth.register_user("admin", "admin")
+            app = AsyncApp(library, auth, db_path=path)
+            server = await app.serve("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            cookie = ""
+
+            async def call(method, target, body=b"", ctype="application/json"):
+                nonlocal cookie
+                if isinstance(body, dict):
+                    body = json.dumps(body).encode()
+                writer.write((f"{method} {target} HTTP/1.1\r\nHost: x\r\nCookie: {cookie}\r\n"
+                              f"Content-Type: {ctype}\r\nContent-Length: {len(body)}\r\n\r\n").encode() + body)
+                head = (await reader.readuntil(b"\r\n\r\n")).decode()
+                headers = dict(line.split(": ", 1) for line in head.split("\r\n")[1:] if line)
+                if "Set-Cookie" in headers:
+                    cookie = headers["Set-Cookie"].split(";")[0]
+                if headers.get("Transfer-Encoding") == "chunked":
+                    data = b""
+                    while True:
+                        size = int(await reader.readline(), 16)
+                        chunk = await reader.readexactly(size + 2)
+                        if size == 0:
+                            break
+                        data += chunk[:-2]
+                else:
+                    data = await reader.readexactly(int(headers["Content-Length"]))
+                return int(head.split()[1]), data
+
+            status, _ = await call("POST", "/api/books", {"isbn": "a1", "title": "T", "author": "A"})
+            self.assertEqual(status, 401)
+            status, body = await call("POST", "/api/login", {"username": "admin", "password": "admin"})
+            self.assertEqual((status, json.loads(body)["ok"]), (200, True))
+            status, _ = await call("POST", "/api/books", {"isbn": "a1", "title": "Async", "author": "A", "copies": 2})
+            self.assertEqual(status, 200)
+            rows = b"".join(json.dumps({"isbn": f"b{i}", "title": f"Bulk {i}", "copies": 1}).encode() + b"\n"
+                            for i in range(20))
+            status, body = await call("POST", "/api/books/bulk?format=ndjson", rows, "application/x-ndjson")
+            self.assertEqual(json.loads(body)["imported"], 20)
+            await call("POST", "/api/members", {"member_id": "m1", "name": "Ann"})
+            status, body = await call("POST", "/api/issue", {"member_id": "m1", "isbn": "a1"})
+            self.assertTrue(json.loads(body)["ok"])
+            status, body = await call("POST", "/api/holds", {"member_id": "m1", "isbn": "a1"})
+            self.assertFalse(json.loads(body)["ok"])
+            status, body = await call("GET", "/api/holds?isbn=a1")
+            self.assertEqual((status, json.loads(body)["total"]), (200, 0))
+            status, body = await call("GET", "/api/books?limit=5&sort=isbn")
+            page = json.loads(body)
+            self.assertEqual((page["total"], page["items"][0]["copies"]), (21, 1))
+            status, body = await call("GET", "/api/books/export?format=ndjson")
+            self.assertEqual(len(body.splitlines()), 21)
+            # cached listings carry the same date-dependent ETags as webapp.py
+            etag = f'"{queries.listing_etag(app._etag_prefix, queries.listing_version(library))}"'
+            writer.write(f"GET /api/loans?overdue=true HTTP/1.1\r\nHost: x\r\nCookie: {cookie}\r\n"
+                         f"If-None-Match: {etag}\r\n\r\n".encode())
+            self.assertIn(b" 304 ", await reader.readuntil(b"\r\n\r\n"))
+
+            class Tomorrow(date):
+                @classmethod
+                def today(cls):
+                    return date.today() + timedelta(days=1)
+
+            with mock.patch.object(queries, "date", Tomorrow):
+                writer.write(f"GET /api/loans?overdue=true HTTP/1.1\r\nHost: x\r\nCookie: {cookie}\r\n"
+                             f"If-None-Match: {etag}\r\n\r\n".encode())
+                head = await reader.readuntil(b"\r\n\r\n")
+            self.assertIn(b" 200 ", head)
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            await reader.readexactly(length)
+            status, _ = await call("GET", "/api/nope")
+            self.assertEqual(status, 404)
+
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            app.saver.stop()
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.json")
+            asyncio.run(scenario(path))
+            library, _ = storage.load_state(path)
+            self.assertEqual(len(library.books), 21)
+            self.assertEqual(library.get_book("a1").copies, 1)
+
+    def test_batch_issue_is_all_or_nothing_by_default(self):
+        library = Library()
+        library.max_books_per_member = 3
+        for isbn, copies in (("k1", 1), ("k2", 1), ("k3", 1), ("k4", 1)):
+            library.add_book(Book(isbn, isbn, "X", copies))
+        library.add_member(Member("km", "Desk"))
+        stack = [("km", "k1"), ("km", "k2"), ("km", "k3"), ("km", "k4")]
+
+        # the limit is checked for the batch as a whole, so the fourth item sinks it
+        ok, results = issue_books(library, stack)
+        self.assertFalse(ok)
+        self.assertEqual([r[0] for r in results], [False] * 4)
+        self.assertIn("limit", results[3][1])
+        self.assertEqual(len(library.loans), 0)
+        self.assertEqual(library.get_book("k1").copies, 1)
+
+        ok, results = issue_books(library, stack + [("nobody", "k1")], atomic=False)
+        self.assertFalse(ok)
+        self.assertEqual([r[0] for r in results], [True, True, True, False, False])
+        self.assertEqual(sorted(library.get_member("km").borrowed_books), ["k1", "k2", "k3"])
+        self.assertEqual(library.get_book("k1").copies, 0)
+
+        ok, results = return_books(library, [("km", "k1"), ("km", "k2"), ("km", "k2")])
+        self.assertFalse(ok)
+        self.assertEqual(len(library.loans.active), 3)
+        ok, results = return_books(library, [("km", "k1"), ("km", "k2")])
+        self.assertTrue(ok)
+        self.assertEqual(library.get_member("km").borrowed_books, ["k3"])
+        self.assertEqual(library.get_book("k2").copies, 1)
+
+    def test_overdue_loans_come_from_due_date_heap(self):
+        library = Library()
+        library.add_book(Book("o1", "Overdue", "X", 10))
+        member = Member("om", "Late")
+        library.add_member(member)
+        loans = [library.create_loan("om", "o1", days=d) for d in (5, 1, 3, 20, 2)]
+        today = date.today()
+
+        later = today + timedelta(days=4)
+        self.assertEqual([l.loan_id for l in library.overdue_loans(later)],
+                         [loans[1].loan_id, loans[4].loan_id, loans[2].loan_id])
+        # entries are put back, so asking twice gives the same answer
+        self.assertEqual(len(library.overdue_loans(later)), 3)
+        self.assertEqual(len(library.overdue_loans(later, limit=2)), 2)
+
+        library.close_loan(loans[1].loan_id)
+        library.update_loan(loans[3].loan_id, due_date=today - timedelta(days=1))
+        library.update_loan(loans[2].loan_id, due_date=today + timedelta(days=30))
+        self.assertEqual([l.loan_id for l in library.overdue_loans(later)], [loans[3].loan_id, loans[4].loan_id])
+        library.update_loan(loans[1].loan_id, returned=False)
+        self.assertIn(loans[1].loan_id, [l.loan_id for l in library.overdue_loans(later)])
+
+        # many returns leave dead entries; the heap is rebuilt before they pile up
+        for _ in range(200):
+            library.close_loan(library.create_loan("om", "o1").loan_id)
+        self.assertLess(len(library._due_heap), 200)
+        lib2 = Library.from_dict(library.to_dict())
+        self.assertEqual([l.loan_id for l in lib2.overdue_loans(later)],
+                         [l.loan_id for l in library.overdue_loans(later)])
+
+    def test_passwords_are_hashed_and_migrated(self):
+        # loading does not hash; the first successful login migrates the password
+        auth = AuthSystem.from_dict({"users": {"legacy": "secret"}})
+        self.assertEqual((auth.users["legacy"], auth.has_changes()), ("secret", False))
+        self.assertFalse(auth.authenticate("legacy", "wrong"))
+        self.assertFalse(auth.has_changes())
+        self.assertTrue(auth.authenticate("legacy", "secret"))
+        self.assertTrue(is_hashed(auth.users["legacy"]))
+        self.assertNotIn("secret", auth.users["legacy"])
+        self.assertEqual(auth.drain_changes(), {"legacy"})
+        self.assertTrue(auth.authenticate("legacy", "secret"))
+        self.assertFalse(auth.authenticate("legacy", "wrong"))
+
+        auth.register_user("new", "pw")
+        restored = AuthSystem.from_dict(auth.to_dict())
+        self.assertEqual(restored.users, auth.users)
+        self.assertEqual(restored.drain_changes(), set())
+        self.assertTrue(restored.authenticate("new", "pw"))
+        # a cached verification does not outlive a changed hash
+        restored.users["new"] = hash_password("other")
+        self.assertFalse(restored.authenticate("new", "pw"))
+
+        # the startup migration hashes users who never log in, once
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.json")
+            storage.save_state(path, Library(), AuthSystem.from_dict({"users": {"idle": "pw", "new": auth.users["new"]}}))
+            _, stored = storage.load_state(path)
+            self.assertEqual(stored.migrate_passwords(), 1)
+            self.assertTrue(stored.has_changes())
+            storage.commit(path, Library(), stored)
+            _, reloaded = storage.load_state(path)
+            self.assertTrue(is_hashed(reloaded.users["idle"]))
+            self.assertEqual(reloaded.migrate_passwords(), 0)
+            self.assertTrue(reloaded.authenticate("idle", "pw"))
+
+    def test_login_attempts_are_rate_limited(self):
+        auth = AuthSystem()
+        auth.register_user("u", "pw")
+        auth.login_limiter = RateLimiter(burst=3, rate_per_min=1)
+        results = [auth.attempt_login("u", "bad", client="1.2.3.4") for _ in range(4)]
+        self.assertEqual([r[1] > 0 for r in results], [False, False, False, True])
+        # a different client is still limited by the user's bucket, and vice versa
+        self.assertGreater(auth.attempt_login("u", "pw", client="5.6.7.8")[1], 0)
+        self.assertGreater(auth.attempt_login("other", "pw", client="1.2.3.4")[1], 0)
+        self.assertEqual(auth.attempt_login("other", "pw", client="9.9.9.9"), (False, 0.0))
+
+    def test_snapshot_serializes_without_the_library_lock(self):
+        library = Library()
+        member = Member("sm", "Snap")
+        library.add_member(member)
+        library.add_book(Book("n1", "Snap", "X", 2))
+        issue_book(library, "n1", member)
+        return_book(library, "n1", member)
+        free = []
+
+        class Probe(Book):
+            def to_dict(self):
+                # another thread must be able to take the lock while books serialize
+                if free:
+                    return super().to_dict()
+                t = threading.Thread(target=lambda: free.append(library.lock.acquire(timeout=2) and library.lock.release() is None))
+                t.start()
+                t.join()
+                return super().to_dict()
+
+        library.add_book(Probe("n2", "Probe", "X", 1))
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.json")
+            storage.save_state(path, library, AuthSystem())
+            self.assertEqual(free, [True])
+            self.assertEqual(storage.load_state(path)[0].to_dict(), library.to_dict())
+
+        # a change made after the capture is serialized in either state but stays dirty
+        serialize = library.capture()
+        library.drain_changes()
+        library.update_book("n1", copies=5)
+        self.assertIn(serialize()["books"]["n1"]["copies"], (2, 5))
+        self.assertEqual(library.drain_changes()["books"], {"n1"})
+
+    def test_lazy_load_matches_eager_load(self):
+        library = Library()
+        for i in range(6):
+            library.add_book(Book(f"z{i}", f"Lazy River {i}", "Writer", 3))
+            library.add_member(Member(f"zm{i}", f"Z{i}"))
+        for i in range(30):
+            loan = library.create_loan(f"zm{i % 6}", f"z{i % 4}")
+            if i % 3:
+                library.close_loan(loan.loan_id)
+        data = library.to_dict()
+
+        eager, lazy = Library.from_dict(data), Library.from_dict(data, lazy=True)
+        self.assertEqual(len(lazy.loans.active), 10)
+        self.assertEqual(len(lazy.loans), 30)
+        self.assertTrue(lazy.loans["2"].returned)
+        self.assertEqual(lazy.to_dict(), eager.to_dict())
+        self.assertEqual(lazy.search_index.search("river"), eager.search_index.search("river"))
+        self.assertEqual([l.loan_id for l in lazy.loans_for_member("zm1")],
+                         [l.loan_id for l in eager.loans_for_member("zm1")])
+        self.assertEqual(lazy.circulation_counts(), eager.circulation_counts())
+
+        # reopening a loan that was never parsed, before and after the history is built
+        lazy = Library.from_dict(data, lazy=True)
+        self.assertFalse(lazy.update_loan("2", returned=False).returned)
+        lazy.create_loan("zm0", "z5")
+        self.assertEqual([l.loan_id for l in lazy.loans_for_book("z5")], ["31"])
+        self.assertEqual(lazy.circulation_counts()["z1"], eager.circulation_counts()["z1"])
+
+    def test_metrics_render_prometheus_text_and_profile_slow_calls(self):
+        registry = metrics.Registry()
+        latency = registry.histogram("t_seconds", "Latency.", ("route",), buckets=(0.01, 0.1))
+        hits = registry.counter("t_hits_total", "Hits.", ("result",))
+        latency.observe(0.005, route="/api/books")
+        latency.observe(0.05, route="/api/books")
+        with latency.time(route='/odd"route'):
+            pass
+        hits.inc(result="hit")
+        hits.inc(2, result="hit")
+        text = registry.render()
+        self.assertIn("# TYPE t_seconds histogram", text)
+        self.assertIn('t_seconds_bucket{route="/api/books",le="0.01"} 1', text)
+        self.assertIn('t_seconds_bucket{route="/api/books",le="+Inf"} 2', text)
+        self.assertIn('t_seconds_count{route="/api/books"} 2', text)
+        self.assertIn('t_seconds_count{route="/odd\\"route"} 1', text)
+        self.assertIn('t_hits_total{result="hit"} 3', text)
+        with self.assertRaises(ValueError):
+            registry.counter("t_hits_total", "Again.")
+
+        with tempfile.TemporaryDirectory() as d:
+            profiler = metrics.SlowRequestProfiler(threshold_ms=50, out_dir=d)
+            fast = profiler.start()
+            self.assertIsNone(profiler.finish(fast, 0.001, "GET /api/books"))
+            slow = profiler.start()
+            sum(range(1000))
+            path = profiler.finish(slow, 0.2, "GET /api/books")
+            self.assertEqual(os.listdir(d), [os.path.basename(path)])
+
+    def test_virtual_list_renders_only_visible_rows(self):
+        try:
+            import tkinter as tk
+            root = tk.Tk()
+        except Exception:
+            self.skipTest("Tk display not available")
+        from gui import VirtualList
+        try:
+            root.withdraw()
+            formatted = []
+            view = VirtualList(root, lambda key: formatted.append(key) or f"row {key}")
+            view.listbox.config(height=10)
+            view.set_keys([str(i) for i in range(100_000)])
+            self.assertEqual((view.listbox.size(), len(formatted)), (10, 10))
+            view.scroll(1, "pages")
+            self.assertEqual(view.listbox.get(0), "row 10")
+            formatted.clear()
+            view.refresh_rows("15", "99999")
+            self.assertEqual(formatted, ["15"])
+        finally:
+            root.destroy()
+
+    def test_gui_task_executor_delivers_on_poll_and_drops_stale_searches(self):
+        try:
+            from gui import TaskExecutor
+        except ImportError:
+            self.skipTest("tkinter not available")
+
+        class FakeWidget:
+            def __init__(self):
+                self.scheduled = []
+
+            def after(self, ms, fn):
+                self.scheduled.append(fn)
+
+        widget = FakeWidget()
+        executor = TaskExecutor(widget)
+        gate = threading.Event()
+        results, progress = [], []
+
+        def slow_search(task):
+            gate.wait(5)
+            return "stale"
+
+        executor.submit(slow_search, on_done=results.append, channel="search")
+        executor.submit(lambda task: "fresh", on_done=results.append, channel="search")
+
+        def save(task):
+            task.progress("saving")
+            return "saved"
+
+        executor.submit(save, on_done=results.append, on_progress=progress.append)
+        executor.submit(lambda task: 1 / 0, on_error=lambda e: results.append(type(e).__name__))
+        gate.set()
+        time.sleep(0.05)
+        # nothing reaches the callbacks until the Tk loop polls
+        self.assertEqual(results, [])
+        while widget.scheduled:
+            time.sleep(0.01)
+            widget.scheduled.pop(0)()
+        executor.shutdown()
+        self.assertEqual(sorted(results), ["ZeroDivisionError", "fresh", "saved"])
+        self.assertEqual(progress, ["saving"])
+
+    def test_incremental_backups_restore_and_retention(self):
+        library = Library()
+        for i in range(300):
+            library.add_book(Book(f"k{i}", f"Backup {i}", "X", 1))
+        member = Member("km", "Keeper")
+        library.add_member(member)
+        auth = AuthSystem()
+        auth.register_user("admin", "admin")
+        t0 = datetime(2026, 1, 1, 9, 0)
+        with tempfile.TemporaryDirectory() as d:
+            store = os.path.join(d, "backups")
+            first = backup.create_backup(store, library, auth, now=t0)
+            self.assertEqual(first.new_chunks, first.chunks)
+
+            self.assertTrue(issue_book(library, "k7", member)[0])
+            second = backup.create_backup(store, library, auth, now=t0 + timedelta(hours=1))
+            # only the buckets holding k7, km and the new loan changed
+            self.assertEqual(second.new_chunks, 3)
+            self.assertLess(second.bytes_written, first.bytes_written)
+
+            # point-in-time restore into a database that load_state reads
+            db = os.path.join(d, "db.json")
+            restored = backup.restore(store, db, at=t0 + timedelta(minutes=30))
+            self.assertEqual(restored, first.backup_id)
+            lib2, auth2 = storage.load_state(db)
+            self.assertEqual(lib2.books["k7"].copies, 1)
+            self.assertEqual(len(lib2.loans), 0)
+            self.assertTrue(auth2.authenticate("admin", "admin"))
+            self.assertEqual(backup.load_backup(store)[0].to_dict(), library.to_dict())
+            with self.assertRaises(ValueError):
+                backup.read_backup(store, at=t0 - timedelta(days=1))
+
+            # keep only the newest backup; chunks used only by the first one go away
+            removed = backup.prune(store, keep_last=1, keep_daily=0, keep_weekly=0)
+            self.assertEqual(removed, [first.backup_id])
+            objects = sum(len(files) for _, _, files in os.walk(os.path.join(store, "objects")))
+            self.assertEqual(objects, second.chunks)
+            self.assertEqual(backup.load_backup(store)[0].to_dict(), library.to_dict())
+
+    def test_backups_rewrite_only_the_newest_loan_chunks(self):
+        library = Library()
+        for i in range(5000):
+            library.create_loan(f"m{i % 50}", f"b{i % 70}")
+        auth = AuthSystem()
+        t0 = datetime(2026, 1, 1, 9, 0)
+        with tempfile.TemporaryDirectory() as d:
+            store = os.path.join(d, "backups")
+            backup.create_backup(store, library, auth, now=t0)
+            # a busy hour: recent loans returned, new ones issued
+            for loan_id in range(4900, 4990):
+                library.update_loan(str(loan_id), returned=True)
+            for i in range(500):
+                library.create_loan("m1", "b1")
+            second = backup.create_backup(store, library, auth, now=t0 + timedelta(hours=1))
+            with open(os.path.join(store, "manifests", f"{second.backup_id}.json"), encoding="utf-8") as fh:
+                loan_chunks = json.load(fh)["collections"]["loans"]
+            self.assertEqual(len(loan_chunks), 6)
+            # loans 4000-4999 and 5000-5499; the four older chunks are reused
+            self.assertEqual(second.new_chunks, 2)
+            self.assertEqual(backup.load_backup(store)[0].to_dict(), library.to_dict())
+
+    def test_removing_members_while_holds_are_placed(self):
+        library = Library()
+        isbns = [f"h{i}" for i in range(40)]
+        for isbn in isbns:
+            library.add_book(Book(isbn, isbn, "X", 0))
+        members = [Member(f"hm{i}", "Holder") for i in range(20)]
+        for member in members:
+            library.add_member(member)
+
+        def place():
+            rng = random.Random()
+            for _ in range(400):
+                place_hold(library, rng.choice(isbns), rng.choice(members))
+
+        def remove():
+            for member in members:
+                place_hold(library, isbns[0], member)
+                time.sleep(0.001)
+                with library.lock_member(member.member_id):
+                    library.remove_member(member.member_id)
+
+        threads = [threading.Thread(target=place) for _ in range(3)] + [threading.Thread(target=remove)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+            self.assertFalse(t.is_alive(), "deadlock")
+        self.assertEqual(library.members, {})
+        self.assertEqual(sum(len(queue.holds()) for queue in library.holds.values()), 0)
+        self.assertEqual(library._holds_by_member, {})
+
+    def test_hold_queue_allocates_returned_copies_in_order(self):
+        library = Library()
+        library.add_book(Book("h1", "Held", "X", 1))
+        ann, bob, cat = Member("a", "Ann"), Member("b", "Bob"), Member("c", "Cat")
+        for m in (ann, bob, cat):
+            library.add_member(m)
+        self.assertTrue(issue_book(library, "h1", ann)[0])
+        self.assertFalse(issue_book(library, "h1", bob)[0])
+        self.assertFalse(place_hold(library, "h1", ann)[0])
+        self.assertTrue(place_hold(library, "h1", bob)[0])
+        self.assertTrue(place_hold(library, "h1", cat)[0])
+        self.assertFalse(place_hold(library, "h1", cat)[0])
+        self.assertEqual(library.hold_position("c", "h1"), 2)
+
+        # the returned copy is set aside for Bob, not put back on the shelf
+        ok, msg = return_book(library, "h1", ann)
+        self.assertIn("Reserved for member b", msg)
+        self.assertEqual(library.books["h1"].copies, 0)
+        self.assertTrue(library.get_hold("b", "h1").ready)
+        self.assertFalse(issue_book(library, "h1", cat)[0])
+        self.assertEqual(library.hold_position("c", "h1"), 1)
+
+        # cancelling a ready hold passes the copy to the next in line
+        self.assertTrue(cancel_hold(library, "h1", bob)[0])
+        self.assertTrue(library.get_hold("c", "h1").ready)
+        ok, results = issue_books(library, [("c", "h1")])
+        self.assertTrue(ok, results)
+        self.assertEqual((library.books["h1"].copies, library.holds), (0, {}))
+
+        # adding copies serves the queue first
+        self.assertTrue(place_hold(library, "h1", ann)[0])
+        library.update_book("h1", copies=2)
+        self.assertTrue(library.get_hold("a", "h1").ready)
+        self.assertEqual(library.books["h1"].copies, 1)
+
+    def test_holds_survive_journal_sqlite_and_member_removal(self):
+        library = Library()
+        library.add_book(Book("h2", "Held", "X", 0))
+        for mid in ("a", "b"):
+            library.add_member(Member(mid, mid.upper()))
+        auth = AuthSystem()
+        with tempfile.TemporaryDirectory() as d:
+            for name in ("db.json", "db.sqlite"):
+                path = os.path.join(d, name)
+                storage.save_state(path, library, auth)
+                place_hold(library, "h2", library.get_member("a"))
+                place_hold(library, "h2", library.get_member("b"))
+                library.update_book("h2", copies=1)
+                storage.commit(path, library, auth)
+                loaded = storage.load_state(path)[0]
+                self.assertEqual(loaded.to_dict()["holds"], library.to_dict()["holds"])
+                self.assertTrue(loaded.get_hold("a", "h2").ready)
+                self.assertEqual(loaded.hold_position("b", "h2"), 1)
+
+                # removing the member with the ready hold hands the copy on
+                library.remove_member("a")
+                self.assertTrue(library.get_hold("b", "h2").ready)
+                storage.commit(path, library, auth)
+                self.assertEqual(storage.load_state(path)[0].to_dict()["holds"], library.to_dict()["holds"])
+                library.add_member(Member("a", "A"))
+                cancel_hold(library, "h2", library.get_member("b"))
+                library.update_book("h2", copies=0)
+                storage.commit(path, library, auth)
+
+    def test_circulation_stats_stay_in_step_with_batch_recompute(self):
+        day = date(2026, 3, 2)
+        loans = {}
+        for i in range(12):
+            issued = day + timedelta(days=i % 3)
+            loans[str(i + 1)] = {"loan_id": str(i + 1), "member_id": f"m{i % 2}", "isbn": f"s{i % 4}",
+                                 "issue_date": issued.isoformat(), "due_date": (issued + timedelta(days=14)).isoformat(),
+                                 "returned": True, "return_date": (issued + timedelta(days=i % 5)).isoformat()}
+        # returned before return dates were recorded: counted, but not in durations
+        loans["13"] = {**loans["1"], "loan_id": "13", "isbn": "s0", "return_date": None}
+        data = {"books": {f"s{i}": {"isbn": f"s{i}", "title": f"Stat {i}", "author": "X", "copies": 3} for i in range(4)},
+                "members": {f"m{i}": {"member_id": f"m{i}", "name": f"M{i}", "borrowed_books": []} for i in range(3)},
+                "loans": loans, "next_loan_id": 14}
+        for lazy in (False, True):
+            library = Library.from_dict(data, lazy=lazy)
+            report = analytics.circulation_report(library, top=2, days=3, today=day + timedelta(days=2))
+            self.assertEqual(report["total_loans"], 13)
+            self.assertEqual(report["top_books"][0], {"isbn": "s0", "title": "Stat 0", "loans": 4})
+            self.assertEqual([d["issued"] for d in report["daily"]], [5, 4, 4])
+            self.assertAlmostEqual(report["average_loan_days"], sum(i % 5 for i in range(12)) / 12, places=2)
+
+            # incremental updates must match a fresh batch recompute
+            member = library.get_member("m2")
+            for _ in range(3):
+                issue_book(library, "s3", member)
+            return_book(library, "s3", member)
+            library.update_loan("2", returned=False)
+            stats, batch = library.stats, analytics.CirculationStats.from_loans(library.loans)
+            for name in ("by_isbn", "by_member", "issued_by_day", "returned_by_day", "loan_days",
+                         "timed_returns", "total", "active"):
+                self.assertEqual(getattr(stats, name), getattr(batch, name), name)
+            self.assertEqual(stats.top_books(4), batch.top_books(4))
+            self.assertEqual(stats.top_members(3), [("m0", 7), ("m1", 6), ("m2", 3)])
+
+        self.assertEqual(analytics.parse_report_args({"top": "0", "today": "x"})[1].keys(), {"top", "today"})
+
+    def test_incremental_top_lists_break_ties_like_a_recompute(self):
+        from unittest import mock
+        rng = random.Random(7)
+        with mock.patch.object(analytics, "MAX_TOP", 3):
+            library = Library()
+            library.stats
+            # few ranked slots and many equal counts, so entries keep tying with the last one
+            for _ in range(200):
+                library.create_loan(f"m{rng.randrange(6)}", f"b{rng.randrange(8)}")
+                batch = analytics.CirculationStats.from_loans(library.loans)
+                self.assertEqual(library.stats.top_books(3), batch.top_books(3))
+                self.assertEqual(library.stats.top_members(3), batch.top_members(3))
+
+    def test_loan_return_dates_persist_in_sqlite_and_migrate(self):
+        import sqlite3
+        library = Library()
+        library.add_book(Book("r1", "Ret", "X", 1))
+        member = Member("rm", "R")
+        library.add_member(member)
+        issue_book(library, "r1", member)
+        return_book(library, "r1", member)
+        self.assertEqual(library.loans["1"].return_date, date.today())
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.sqlite")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE loans (loan_id TEXT PRIMARY KEY, member_id TEXT NOT NULL, isbn TEXT NOT NULL,"
+                         " issue_date TEXT NOT NULL, due_date TEXT NOT NULL, returned INTEGER NOT NULL)")
+            conn.commit()
+            conn.close()
+            storage.save_state(path, library, AuthSystem())
+            loaded = storage.load_state(path)[0]
+            self.assertEqual(loaded.loans["1"].return_date, date.today())
+            self.assertEqual(loaded.stats.average_loan_days(), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,21 +1,196 @@
-from flask import Flask, request, jsonify, render_template, session
+import atexit
+import functools
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+
+import io
+
+from flask import Flask, request, jsonify, render_template, session, g, Response
 import storage
+from shared import SharedState
 from book import Book
 from member import Member
 from library import Library
-from issue_return import issue_book, return_book
+from issue_return import issue_book, return_book, issue_books, return_books, parse_batch_items, place_hold, cancel_hold
+import queries
+import bulk
+import metrics
+import analytics
 from auth_system import AuthSystem
 
-DB_PATH = "library_db.json"
+# a .db/.sqlite/.sqlite3 path selects the SQLite backend
+DB_PATH = os.environ.get("LMS_DB_PATH", "library_db.json")
+# When set (e.g. 500), changes are written by a background thread at most once
+# per interval instead of before each response is sent.
+SAVE_INTERVAL_MS = int(os.environ.get("LMS_SAVE_INTERVAL_MS", "0") or 0)
+# Set LMS_SHARED=1 when several worker processes serve the same database
+# (e.g. `gunicorn -w 4 webapp:app`); see shared.py.
+SHARED = os.environ.get("LMS_SHARED", "") not in ("", "0")
+# Defer search postings and loan history parsing until first use (LMS_LAZY_LOAD=0 disables)
+LAZY_LOAD = os.environ.get("LMS_LAZY_LOAD", "1") != "0"
+# Profile sampled requests and keep cProfile dumps of those slower than this (0 disables)
+PROFILE_SLOW_MS = float(os.environ.get("LMS_PROFILE_SLOW_MS", "0") or 0)
+PROFILE_SAMPLE = float(os.environ.get("LMS_PROFILE_SAMPLE", "0.1") or 0)
+PROFILE_DIR = os.environ.get("LMS_PROFILE_DIR", "profiles")
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 # WARNING: change this in production — use env var or config
 app.secret_key = "dev-secret-change-me"
 
 # Load application state
-library, auth = storage.load_state(DB_PATH)
-if not getattr(auth, "users", {}):
-    auth.register_user("admin", "admin")
+library, auth = storage.load_state(DB_PATH, lazy=LAZY_LOAD)
+shared = SharedState(DB_PATH, library, auth) if SHARED else None
+if shared is not None:
+    # other workers only see the admin account and migrated passwords once they are committed
+    with shared.write():
+        if not auth.users:
+            auth.register_user("admin", "admin")
+        if auth.migrate_passwords() or auth.has_changes():
+            storage.commit(DB_PATH, library, auth)
+else:
+    if not getattr(auth, "users", {}):
+        auth.register_user("admin", "admin")
+    # hash plaintext passwords left by older versions once, not on every load
+    if auth.migrate_passwords():
+        storage.commit(DB_PATH, library, auth)
+
+# Library and AuthSystem lock internally (per-book/per-member stripes plus a
+# short library-wide lock), so requests run concurrently without a global lock.
+saver = None
+# in shared mode each write must be committed before the lock file is released
+if SAVE_INTERVAL_MS > 0 and shared is None:
+    saver = storage.BackgroundSaver(DB_PATH, library, auth, interval_ms=SAVE_INTERVAL_MS,
+                                    save=storage.commit).start()
+    atexit.register(saver.stop)
+
+
+# Served in Prometheus text format by /api/metrics
+registry = metrics.Registry()
+REQUEST_LATENCY = registry.histogram("lms_request_duration_seconds", "Request latency by route.",
+                                     ("method", "route"))
+REQUESTS = registry.counter("lms_requests_total", "Requests by route and status.", ("method", "route", "status"))
+SECTION_LATENCY = registry.histogram(
+    "lms_section_duration_seconds",
+    "Time spent in query, serialize, issue_return, persist and save_state sections.", ("section",))
+MUTATIONS = registry.counter("lms_mutations_total", "Persisted mutations by route.", ("route",))
+RESPONSE_CACHE = registry.counter("lms_response_cache_total", "GET response cache lookups by result.", ("result",))
+profiler = metrics.SlowRequestProfiler(PROFILE_SLOW_MS, PROFILE_DIR, PROFILE_SAMPLE) if PROFILE_SLOW_MS > 0 else None
+
+
+def _route_label() -> str:
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def persist() -> None:
+    """Persist the changes made by the current request."""
+    MUTATIONS.inc(route=_route_label())
+    with SECTION_LATENCY.time(section="persist"):
+        if saver is not None:
+            saver.notify()
+        else:
+            storage.commit(DB_PATH, library, auth)
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profile = profiler.start() if profiler is not None else None
+
+
+@app.after_request
+def _record_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_start
+    route = _route_label()
+    REQUEST_LATENCY.observe(elapsed, method=request.method, route=route)
+    REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def _finish_request_profile(exc=None):
+    # teardown runs even when a view raises and after_request is skipped,
+    # so the profiler is always released for the next request
+    profile = g.pop("profile", None)
+    if profile is not None:
+        elapsed = time.perf_counter() - g.request_start
+        profiler.finish(profile, elapsed, f"{request.method} {_route_label()}")
+
+
+# POST routes that do not change stored state, so they skip the cross-process
+# write lock; a login takes it only to commit a migrated password
+_NO_WRITE_LOCK = {"api_login", "api_logout"}
+
+
+@app.before_request
+def _sync_shared_state():
+    if shared is None:
+        return
+    if request.method == "GET" or request.endpoint in _NO_WRITE_LOCK:
+        shared.refresh()
+    else:
+        g.shared_token = shared.acquire()
+
+
+@app.teardown_request
+def _release_shared_state(exc=None):
+    token = g.pop("shared_token", None)
+    if token is not None:
+        shared.release(token)
+
+
+# Serialized GET responses keyed by URL; each entry records the library version it was built at.
+RESPONSE_CACHE_SIZE = 256
+_response_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+# distinguishes ETags of this process from those handed out before a restart
+_etag_prefix = uuid.uuid4().hex[:12]
+
+
+def cached_get(view):
+    """Serve GET requests from a per-version cache and honour If-None-Match.
+
+    The ETag is derived from `library.version` and today's date (overdue
+    filters depend on it), so a client that already has the current version
+    gets a 304 without any serialization, and repeated requests between
+    mutations reuse the cached JSON bytes.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET":
+            return view(*args, **kwargs)
+        version = queries.listing_version(library)
+        etag = queries.listing_etag(_etag_prefix, version)
+        if request.if_none_match.contains(etag):
+            RESPONSE_CACHE.inc(result="not_modified")
+            resp = app.response_class(status=304)
+            resp.set_etag(etag)
+            return resp
+        key = request.full_path
+        with _response_cache_lock:
+            entry = _response_cache.get(key)
+            if entry is not None:
+                _response_cache.move_to_end(key)
+        RESPONSE_CACHE.inc(result="hit" if entry is not None and entry[0] == version else "miss")
+        if entry is None or entry[0] != version:
+            resp = app.make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+            entry = (version, resp.get_data(), resp.mimetype)
+            with _response_cache_lock:
+                _response_cache[key] = entry
+                _response_cache.move_to_end(key)
+                while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                    _response_cache.popitem(last=False)
+        resp = app.response_class(entry[1], mimetype=entry[2])
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+    return wrapper
 
 
 def book_to_dict(book: Book) -> dict:
@@ -26,6 +201,44 @@ def member_to_dict(m: Member) -> dict:
     return m.to_dict()
 
 
+def loan_to_dict(loan: Library.Loan) -> dict:
+    return loan.to_dict()
+
+
+def _bool_arg(name: str):
+    """Parse an optional boolean query parameter; None when absent."""
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def _list_response(query, to_dict, **filters):
+    """Run a `queries` listing with the request's limit/cursor/sort and jsonify the page."""
+    args = request.args
+    try:
+        limit = int(args.get("limit", queries.DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"ok": False, "errors": {"limit": "limit must be a number"}}), 400
+    if "sort" in args:
+        filters["sort"] = args["sort"]
+    try:
+        # a consistent view of the collections while the page is built
+        with library.lock:
+            with SECTION_LATENCY.time(section="query"):
+                page = query(library, limit=limit, cursor=args.get("cursor") or None, **filters)
+            with SECTION_LATENCY.time(section="serialize"):
+                items = [to_dict(item) for item in page.items]
+    except ValueError as e:
+        return jsonify({"ok": False, "msg": str(e)}), 400
+    with SECTION_LATENCY.time(section="serialize"):
+        return jsonify({
+            "items": items,
+            "next_cursor": page.next_cursor,
+            "total": page.total,
+        })
+
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -71,38 +284,23 @@ def api_me():
 
 
 @app.route("/api/books", methods=["GET", "POST"])
+@cached_get
 def api_books():
     if request.method == "GET":
-        return jsonify([book_to_dict(b) for b in library.list_books()])
+        args = request.args
+        return _list_response(queries.query_books, book_to_dict, q=args.get("q"), title=args.get("title"),
+                              author=args.get("author"), isbn=args.get("isbn") or None, available=_bool_arg("available"))
     # protect admin action
     if not _is_logged_in():
         return jsonify({"ok": False, "msg": "Authentication required"}), 401
     data = request.get_json() or {}
     # server-side validation
-    errors = {}
-    isbn = (data.get('isbn') or '').strip()
-    title = (data.get('title') or '').strip()
-    author = (data.get('author') or '').strip()
-    copies_raw = data.get('copies', 0)
-    if not isbn:
-        errors['isbn'] = 'ISBN is required.'
-    if not title:
-        errors['title'] = 'Title is required.'
-    if copies_raw is None:
-        copies_raw = 0
-    try:
-        copies = int(copies_raw)
-        if copies < 0:
-            errors['copies'] = 'Copies must be >= 0.'
-    except Exception:
-        errors['copies'] = 'Copies must be a number.'
-
+    book, errors = bulk.validate_book(data)
     if errors:
         return jsonify({'ok': False, 'errors': errors}), 400
 
-    book = Book(isbn, title, author, copies)
     library.add_book(book)
-    storage.save_state(DB_PATH, library, auth)
+    persist()
     return jsonify({"ok": True, "msg": "Book added"})
 
 
@@ -114,7 +312,7 @@ def api_book_modify(isbn: str):
     if request.method == 'DELETE':
         removed = library.remove_book(isbn)
         if removed:
-            storage.save_state(DB_PATH, library, auth)
+            persist()
             return jsonify({"ok": True, "msg": "Book removed"})
         return jsonify({"ok": False, "msg": "Book not found"}), 404
 
@@ -127,40 +325,64 @@ def api_book_modify(isbn: str):
     title = data.get('title')
     author = data.get('author')
     copies = data.get('copies')
-    if title is not None:
-        book.title = title
-    if author is not None:
-        book.author = author
+    c = None
     if copies is not None:
         try:
             c = int(copies)
-            if c < 0:
-                return jsonify({"ok": False, 'errors': {'copies': 'Copies must be >= 0'}}), 400
-            book.copies = c
         except Exception:
             return jsonify({"ok": False, 'errors': {'copies': 'Invalid number'}}), 400
-    storage.save_state(DB_PATH, library, auth)
+        if c < 0:
+            return jsonify({"ok": False, 'errors': {'copies': 'Copies must be >= 0'}}), 400
+    library.update_book(isbn, title=title, author=author, copies=c)
+    persist()
     return jsonify({"ok": True, "msg": "Book updated"})
 
 
+def _bulk_format() -> str:
+    fmt = request.args.get("format")
+    if fmt:
+        return fmt.lower()
+    mimetype = request.mimetype or ""
+    return "csv" if mimetype in ("text/csv", "application/csv") else "ndjson"
+
+
+@app.route("/api/books/bulk", methods=["POST"])
+def api_books_bulk():
+    """Import books from a CSV or NDJSON request body, streamed row by row."""
+    if not _is_logged_in():
+        return jsonify({"ok": False, "msg": "Authentication required"}), 401
+    fmt = _bulk_format()
+    if fmt not in bulk.FORMATS:
+        return jsonify({"ok": False, "msg": f"Unsupported format '{fmt}'"}), 400
+    stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    report = bulk.import_books(library, bulk.read_rows(stream, fmt), commit=persist)
+    return jsonify({"ok": report.failed == 0, **report.to_dict()})
+
+
+@app.route("/api/books/export", methods=["GET"])
+def api_books_export():
+    """Stream the catalogue as CSV or NDJSON without building it in memory."""
+    fmt = (request.args.get("format") or "ndjson").lower()
+    if fmt not in bulk.FORMATS:
+        return jsonify({"ok": False, "msg": f"Unsupported format '{fmt}'"}), 400
+
+    chunks = bulk.encode_rows(bulk.iter_books(library), fmt, bulk.BOOK_FIELDS)
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(chunks, mimetype=mimetype)
+
+
 @app.route("/api/members", methods=["GET", "POST"])
+@cached_get
 def api_members():
     if request.method == "GET":
-        return jsonify([member_to_dict(m) for m in library.list_members()])
+        return _list_response(queries.query_members, member_to_dict, q=request.args.get("q"))
     # allow member registration without login, but could be protected
     data = request.get_json() or {}
-    errors = {}
-    member_id = (data.get('member_id') or '').strip()
-    name = (data.get('name') or '').strip()
-    if not member_id:
-        errors['member_id'] = 'Member ID is required.'
-    if not name:
-        errors['name'] = 'Name is required.'
+    m, errors = bulk.validate_member(data)
     if errors:
         return jsonify({'ok': False, 'errors': errors}), 400
-    m = Member(member_id, name)
     library.add_member(m)
-    storage.save_state(DB_PATH, library, auth)
+    persist()
     return jsonify({"ok": True, "msg": "Member added"})
 
 
@@ -174,15 +396,18 @@ def api_member_modify(member_id: str):
         return jsonify({"ok": False, "msg": "Member not found"}), 404
 
     if request.method == 'DELETE':
-        # prevent deletion if member has borrowed books
-        if member.borrowed_books:
-            return jsonify({"ok": False, "msg": "Member has borrowed books"}), 400
-        try:
-            del library.members[member_id]
-            storage.save_state(DB_PATH, library, auth)
+        # prevent deletion if member has borrowed books; the member lock keeps
+        # an issue from slipping in between the check and the removal. The
+        # books the member has holds on are locked too, since removing the
+        # member cancels those holds.
+        with library.lock_member(member_id):
+            if member.borrowed_books:
+                return jsonify({"ok": False, "msg": "Member has borrowed books"}), 400
+            removed = library.remove_member(member_id)
+        if removed:
+            persist()
             return jsonify({"ok": True, "msg": "Member removed"})
-        except KeyError:
-            return jsonify({"ok": False, "msg": "Member not found"}), 404
+        return jsonify({"ok": False, "msg": "Member not found"}), 404
 
     # PUT -> update name
     data = request.get_json() or {}
@@ -191,8 +416,8 @@ def api_member_modify(member_id: str):
         name = (name or '').strip()
         if not name:
             return jsonify({'ok': False, 'errors': {'name': 'Name is required.'}}), 400
-        member.name = name
-        storage.save_state(DB_PATH, library, auth)
+        library.rename_member(member_id, name)
+        persist()
         return jsonify({"ok": True, "msg": "Member updated"})
     return jsonify({"ok": False, "msg": "Nothing to update"}), 400
 
@@ -207,29 +432,72 @@ def api_issue():
     member = library.get_member(member_id)
     if member is None:
         return jsonify({"ok": False, "msg": "Member not found"}), 404
-    ok, msg = issue_book(library, isbn, member)
-    storage.save_state(DB_PATH, library, auth)
+    with SECTION_LATENCY.time(section="issue_return"):
+        ok, msg = issue_book(library, isbn, member)
+    persist()
     return jsonify({"ok": ok, "msg": msg})
 
 
+def _batch_response(action):
+    """Apply a batch of (member_id, isbn) items and persist once for the whole batch."""
+    data = request.get_json() or {}
+    items, errors = parse_batch_items(data)
+    if errors:
+        return jsonify({"ok": False, "errors": errors}), 400
+    with SECTION_LATENCY.time(section="issue_return"):
+        ok, results = action(library, items, atomic=bool(data.get("atomic", True)))
+    if any(success for success, _ in results):
+        persist()
+    return jsonify({"ok": ok, "results": [
+        {"member_id": m, "isbn": i, "ok": success, "msg": msg}
+        for (m, i), (success, msg) in zip(items, results)
+    ]})
+
+
+@app.route("/api/issue/batch", methods=["POST"])
+def api_issue_batch():
+    return _batch_response(issue_books)
+
+
+@app.route("/api/return/batch", methods=["POST"])
+def api_return_batch():
+    return _batch_response(return_books)
+
+
 @app.route('/api/loans', methods=['GET'])
+@cached_get
 def api_loans():
-    # return list of loans
-    loans = []
-    for lid, loan in library.loans.items():
-        loans.append({
-            'loan_id': loan.loan_id,
-            'member_id': loan.member_id,
-            'isbn': loan.isbn,
-            'issue_date': loan.issue_date.isoformat(),
-            'due_date': loan.due_date.isoformat(),
-            'returned': bool(loan.returned),
-        })
-    return jsonify(loans)
+    args = request.args
+    return _list_response(queries.query_loans, loan_to_dict, member_id=args.get("member_id") or None,
+                          isbn=args.get("isbn") or None, returned=_bool_arg("returned"),
+                          overdue=_bool_arg("overdue"))
 
 
-@app.route('/api/loans/<loan_id>', methods=['PUT'])
+@app.route('/api/loans/overdue', methods=['GET'])
+def api_loans_overdue():
+    """Active loans past their due date, most overdue first (read from the due-date heap)."""
+    args = request.args
+    try:
+        today = date.fromisoformat(args["today"]) if args.get("today") else date.today()
+        limit = int(args["limit"]) if args.get("limit") else None
+    except ValueError:
+        return jsonify({"ok": False, "msg": "today must be YYYY-MM-DD and limit a number"}), 400
+    loans = library.overdue_loans(today, limit=limit)
+    return jsonify({
+        "today": today.isoformat(),
+        "items": [{**loan_to_dict(loan), "days_overdue": (today - loan.due_date).days} for loan in loans],
+        "total": len(loans),
+    })
+
+
+@app.route('/api/loans/<loan_id>', methods=['GET', 'PUT'])
+@cached_get
 def api_loan_update(loan_id: str):
+    if request.method == 'GET':
+        loan = library.loans.get(loan_id)
+        if not loan:
+            return jsonify({"ok": False, "msg": "Loan not found"}), 404
+        return jsonify(loan_to_dict(loan))
     if not _is_logged_in():
         return jsonify({"ok": False, "msg": "Authentication required"}), 401
     loan = library.loans.get(loan_id)
@@ -238,15 +506,14 @@ def api_loan_update(loan_id: str):
     data = request.get_json() or {}
     due_date = data.get('due_date')
     returned = data.get('returned')
+    due = None
     if due_date is not None:
         try:
-            from datetime import datetime
-            loan.due_date = datetime.fromisoformat(due_date).date()
+            due = datetime.fromisoformat(due_date).date()
         except Exception:
             return jsonify({"ok": False, "errors": {'due_date': 'Invalid date format, expected YYYY-MM-DD'}}), 400
-    if returned is not None:
-        loan.returned = bool(returned)
-    storage.save_state(DB_PATH, library, auth)
+    library.update_loan(loan_id, due_date=due, returned=returned)
+    persist()
     return jsonify({"ok": True, "msg": "Loan updated"})
 
 
@@ -260,11 +527,73 @@ def api_return():
     member = library.get_member(member_id)
     if member is None:
         return jsonify({"ok": False, "msg": "Member not found"}), 404
-    ok, msg = return_book(library, isbn, member)
-    storage.save_state(DB_PATH, library, auth)
+    with SECTION_LATENCY.time(section="issue_return"):
+        ok, msg = return_book(library, isbn, member)
+    persist()
     return jsonify({"ok": ok, "msg": msg})
 
 
+@app.route("/api/stats", methods=["GET"])
+def api_stats():
+    """Circulation statistics, read from the aggregates `Library.stats` keeps up to date."""
+    kwargs, errors = analytics.parse_report_args(request.args)
+    if errors:
+        return jsonify({"ok": False, "errors": errors}), 400
+    with SECTION_LATENCY.time(section="query"):
+        return jsonify(analytics.circulation_report(library, **kwargs))
+
+
+def hold_to_dict(hold) -> dict:
+    return {
+        "member_id": hold.member_id,
+        "isbn": hold.isbn,
+        "placed": hold.placed.isoformat(),
+        "ready": hold.ready,
+        "position": library.hold_position(hold.member_id, hold.isbn),
+    }
+
+
+@app.route("/api/holds", methods=["GET", "POST"])
+def api_holds():
+    if request.method == "GET":
+        member_id = request.args.get("member_id")
+        isbn = request.args.get("isbn")
+        if member_id:
+            holds = [h for h in library.holds_for_member(member_id) if not isbn or h.isbn == isbn]
+        elif isbn:
+            holds = library.hold_queue(isbn)
+        else:
+            return jsonify({"ok": False, "msg": "member_id or isbn required"}), 400
+        return jsonify({"items": [hold_to_dict(h) for h in holds], "total": len(holds)})
+
+    data = request.get_json() or {}
+    member_id = data.get("member_id")
+    isbn = data.get("isbn")
+    if not member_id or not isbn:
+        return jsonify({"ok": False, "msg": "member_id and isbn required"}), 400
+    member = library.get_member(member_id)
+    if member is None:
+        return jsonify({"ok": False, "msg": "Member not found"}), 404
+    with SECTION_LATENCY.time(section="issue_return"):
+        ok, msg = place_hold(library, isbn, member)
+    if ok:
+        persist()
+    return jsonify({"ok": ok, "msg": msg})
+
+
+@app.route("/api/holds/<isbn>/<member_id>", methods=["DELETE"])
+def api_hold_cancel(isbn: str, member_id: str):
+    member = library.get_member(member_id)
+    if member is None:
+        return jsonify({"ok": False, "msg": "Member not found"}), 404
+    with SECTION_LATENCY.time(section="issue_return"):
+        ok, msg = cancel_hold(library, isbn, member)
+    if not ok:
+        return jsonify({"ok": False, "msg": msg}), 404
+    persist()
+    return jsonify({"ok": True, "msg": msg})
+
+
 @app.route("/api/login", methods=["POST"])
 def api_login():
     data = request.get_json() or {}
@@ -272,8 +601,19 @@ def api_login():
     p = data.get("password")
     if not u or not p:
         return jsonify({"ok": False, "msg": "username/password required"}), 400
-    ok = auth.authenticate(u, p)
+    ok, retry_after = auth.attempt_login(u, p, client=request.remote_addr or "")
+    if retry_after:
+        resp = jsonify({"ok": False, "msg": "Too many login attempts; try again later"})
+        resp.headers["Retry-After"] = str(math.ceil(retry_after))
+        return resp, 429
     if ok:
+        if auth.has_changes():
+            # a legacy plaintext password was just hashed
+            if shared is not None:
+                with shared.write():
+                    persist()
+            else:
+                persist()
         session["user"] = u
     return jsonify({"ok": ok})
 
@@ -293,14 +633,22 @@ def api_register():
         return jsonify({"ok": False, "msg": "username/password required"}), 400
     ok = auth.register_user(u, p)
     if ok:
+        # commit before the shared-state lock is released, or other workers never see the user
+        persist()
         session["user"] = u
     return jsonify({"ok": ok})
 
 
+@app.route("/api/metrics")
+def api_metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/save", methods=["POST"])
 def api_save():
     try:
-        storage.save_state(DB_PATH, library, auth)
+        with SECTION_LATENCY.time(section="save_state"):
+            storage.compact(DB_PATH, library, auth)
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"ok": False, "msg": str(e)}), 500
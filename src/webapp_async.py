@@ -0,0 +1,709 @@
+"""
+Asyncio web API
+
+An asyncio-native variant of webapp.py that serves the same /api/* routes
+with the same JSON shapes, using only the standard library. Every
+connection is a coroutine rather than a thread, so thousands of idle
+keep-alive dashboard connections cost little more than their sockets.
+
+Nothing that can block runs on the event loop: every handler that takes
+the library lock or a lock stripe, scans a collection or hashes a password
+does so in the default executor (`AsyncApp._run`), so one held lock (a
+snapshot, a bulk import) stalls only the requests that need it.
+Persistence notifies a `storage.BackgroundSaver`, which commits from its
+own thread; bulk imports are spooled to a temporary file first.
+
+Usage:
+    python webapp_async.py [--host HOST] [--port PORT]
+
+The HTML pages and static files are still served by webapp.py.
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import functools
+import io
+import json
+import math
+import os
+import re
+import secrets
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Pattern, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import storage
+import queries
+import bulk
+import analytics
+from library import Library
+from auth_system import AuthSystem
+from issue_return import issue_book, return_book, issue_books, return_books, parse_batch_items, place_hold, cancel_hold
+
+
+DB_PATH = os.environ.get("LMS_DB_PATH", "library_db.json")
+# 0 commits as soon as the saver thread wakes up; larger values coalesce writes
+SAVE_INTERVAL_MS = int(os.environ.get("LMS_SAVE_INTERVAL_MS", "0") or 0)
+LAZY_LOAD = os.environ.get("LMS_LAZY_LOAD", "1") != "0"
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_JSON_BODY = 1024 * 1024
+# bulk bodies are spooled to disk past this size
+SPOOL_MAX_MEMORY = 1024 * 1024
+KEEPALIVE_TIMEOUT = 75.0
+SESSION_COOKIE = "lms_session"
+# sessions expire after this long unused; past MAX_SESSIONS the least recently used go first
+SESSION_TTL = 8 * 60 * 60
+MAX_SESSIONS = 10_000
+# streamed responses are produced in the executor this many characters at a time
+STREAM_CHUNK_CHARS = 64 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, msg: str) -> None:
+        super().__init__(msg)
+        self.status = status
+        self.msg = msg
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    args: Dict[str, str]
+    headers: Dict[str, str]
+    reader: asyncio.StreamReader
+    params: Dict[str, str] = field(default_factory=dict)
+    user: Optional[str] = None
+    client: str = ""
+    _body_read: bool = False
+
+    @property
+    def mimetype(self) -> str:
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Yields the request body as it arrives (Content-Length or chunked)."""
+        self._body_read = True
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # skip trailers up to the blank line
+                    while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                yield await self.reader.readexactly(size)
+                await self.reader.readline()
+        remaining = int(self.headers.get("content-length") or 0)
+        while remaining > 0:
+            data = await self.reader.read(min(remaining, 64 * 1024))
+            if not data:
+                raise HTTPError(400, "Incomplete request body")
+            remaining -= len(data)
+            yield data
+
+    async def json(self) -> Dict[str, Any]:
+        """The request body parsed as a JSON object; {} when empty or not an object."""
+        parts: List[bytes] = []
+        size = 0
+        async for chunk in self.chunks():
+            size += len(chunk)
+            if size > MAX_JSON_BODY:
+                raise HTTPError(413, "Request body too large")
+            parts.append(chunk)
+        try:
+            data = json.loads(b"".join(parts) or b"null")
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    async def discard_body(self) -> None:
+        if not self._body_read:
+            async for _ in self.chunks():
+                pass
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "application/json"
+    headers: Dict[str, str] = field(default_factory=dict)
+    # when set, sent with chunked encoding instead of `body`
+    stream: Optional[Iterable[str]] = None
+
+
+def json_response(payload: Any, status: int = 200) -> Response:
+    return Response(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+def _bool_arg(args: Dict[str, str], name: str) -> Optional[bool]:
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def _take(rows: Iterator[str], limit: int) -> str:
+    """Joins texts from `rows` until about `limit` characters; "" once exhausted."""
+    parts: List[str] = []
+    size = 0
+    for text in rows:
+        parts.append(text)
+        size += len(text)
+        if size >= limit:
+            break
+    return "".join(parts)
+
+
+class AsyncApp:
+    """
+    The /api/* routes of webapp.py on top of asyncio streams.
+
+    Attributes:
+        library (Library): Shared library state.
+        auth (AuthSystem): User database.
+        saver (storage.BackgroundSaver): Commits changes off the event loop.
+        sessions (OrderedDict[str, Tuple[str, float]]): Session token ->
+            (username, expiry time), least recently used first.
+    """
+
+    def __init__(self, library: Library, auth: AuthSystem, db_path: str = DB_PATH,
+                 save_interval_ms: int = SAVE_INTERVAL_MS) -> None:
+        self.library = library
+        self.auth = auth
+        self.db_path = db_path
+        self.saver = storage.BackgroundSaver(db_path, library, auth, interval_ms=save_interval_ms,
+                                             save=storage.commit)
+        self.sessions: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._etag_prefix = uuid.uuid4().hex[:12]
+        self.routes: List[Tuple[Pattern[str], Dict[str, Handler], bool]] = []
+        self._route(r"/api/me", GET=self.api_me)
+        self._route(r"/api/books", cached=True, GET=self.list_books, POST=self.add_book)
+        self._route(r"/api/books/bulk", POST=self.books_bulk)
+        self._route(r"/api/books/export", GET=self.books_export)
+        self._route(r"/api/books/(?P<isbn>[^/]+)", PUT=self.update_book, DELETE=self.remove_book)
+        self._route(r"/api/members", cached=True, GET=self.list_members, POST=self.add_member)
+        self._route(r"/api/members/(?P<member_id>[^/]+)", PUT=self.update_member, DELETE=self.remove_member)
+        self._route(r"/api/issue", POST=self.issue)
+        self._route(r"/api/return", POST=self.return_)
+        self._route(r"/api/issue/batch", POST=self.issue_batch)
+        self._route(r"/api/return/batch", POST=self.return_batch)
+        self._route(r"/api/holds", GET=self.list_holds, POST=self.place_hold)
+        self._route(r"/api/holds/(?P<isbn>[^/]+)/(?P<member_id>[^/]+)", DELETE=self.cancel_hold)
+        self._route(r"/api/stats", GET=self.stats)
+        self._route(r"/api/loans", cached=True, GET=self.list_loans)
+        self._route(r"/api/loans/overdue", GET=self.overdue_loans)
+        self._route(r"/api/loans/(?P<loan_id>[^/]+)", cached=True, GET=self.get_loan, PUT=self.update_loan)
+        self._route(r"/api/login", POST=self.login)
+        self._route(r"/api/logout", POST=self.logout)
+        self._route(r"/api/register", POST=self.register)
+        self._route(r"/api/save", POST=self.save)
+
+    def _route(self, pattern: str, cached: bool = False, **handlers: Handler) -> None:
+        """Registers handlers per method; `cached` GETs get version ETags like webapp.cached_get."""
+        self.routes.append((re.compile(pattern + r"/?\Z"), handlers, cached))
+
+    def persist(self) -> None:
+        self.saver.notify()
+
+    async def _run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs blocking work (locks, scans, password hashes) in the default executor."""
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    # --- Server ---
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 5001) -> asyncio.AbstractServer:
+        """Starts the saver thread and listens; the caller keeps the loop running."""
+        self.saver.start()
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, json_response({"ok": False, "msg": "Headers too large"}, 431), False)
+                    return
+                request, keep_alive = self._parse_head(head, reader)
+                if request is None:
+                    await self._write(writer, json_response({"ok": False, "msg": "Bad request"}, 400), False)
+                    return
+                request.client = str((writer.get_extra_info("peername") or ("",))[0])
+                response = await self.dispatch(request)
+                try:
+                    await request.discard_body()
+                except (HTTPError, asyncio.IncompleteReadError, ValueError):
+                    keep_alive = False
+                await self._write(writer, response, keep_alive)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _parse_head(self, head: bytes, reader: asyncio.StreamReader) -> Tuple[Optional[Request], bool]:
+        try:
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            return None, False
+        headers: Dict[str, str] = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        url = urlsplit(target)
+        request = Request(method.upper(), unquote(url.path), dict(parse_qsl(url.query)), headers, reader)
+        request.user = self._session_user(self._cookie(headers, SESSION_COOKIE))
+        return request, keep_alive
+
+    def _session_user(self, token: Optional[str]) -> Optional[str]:
+        entry = self.sessions.get(token or "")
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[1] <= now:
+            del self.sessions[token]
+            return None
+        self.sessions[token] = (entry[0], now + SESSION_TTL)
+        self.sessions.move_to_end(token)
+        return entry[0]
+
+    @staticmethod
+    def _cookie(headers: Dict[str, str], name: str) -> Optional[str]:
+        for part in headers.get("cookie", "").split(";"):
+            key, _, value = part.strip().partition("=")
+            if key == name:
+                return value
+        return None
+
+    async def dispatch(self, request: Request) -> Response:
+        for pattern, handlers, cached in self.routes:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            handler = handlers.get(request.method)
+            if handler is None:
+                return json_response({"ok": False, "msg": "Method not allowed"}, 405)
+            request.params = {k: v for k, v in match.groupdict().items()}
+            try:
+                if cached and request.method == "GET":
+                    return await self._cached_get(request, handler)
+                return await handler(request)
+            except HTTPError as e:
+                return json_response({"ok": False, "msg": e.msg}, e.status)
+            except Exception as e:
+                return json_response({"ok": False, "msg": str(e)}, 500)
+        return json_response({"ok": False, "msg": "Not found"}, 404)
+
+    async def _cached_get(self, request: Request, handler: Handler) -> Response:
+        """Answers If-None-Match with 304 the way webapp.cached_get does."""
+        etag = f'"{queries.listing_etag(self._etag_prefix, queries.listing_version(self.library))}"'
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(304, headers={"ETag": etag})
+        response = await handler(request)
+        if response.status == 200:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    async def _write(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        reason = HTTPStatus(response.status).phrase
+        head = [f"HTTP/1.1 {response.status} {reason}", f"Content-Type: {response.content_type}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{k}: {v}" for k, v in response.headers.items()]
+        if response.stream is None:
+            head.append(f"Content-Length: {len(response.body)}")
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + response.body)
+        else:
+            head.append("Transfer-Encoding: chunked")
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+            rows = iter(response.stream)
+            # the rows are read under the library lock, so produce them in the executor
+            while True:
+                data = (await self._run(_take, rows, STREAM_CHUNK_CHARS)).encode("utf-8")
+                if not data:
+                    break
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                # yields to other connections while the client catches up
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    # --- Helpers ---
+
+    def _require_login(self, request: Request) -> None:
+        if not request.user:
+            raise HTTPError(401, "Authentication required")
+
+    async def _list(self, query: Callable, to_dict: Callable, request: Request, **filters: Any) -> Response:
+        args = request.args
+        try:
+            limit = int(args.get("limit", queries.DEFAULT_LIMIT))
+        except ValueError:
+            return json_response({"ok": False, "errors": {"limit": "limit must be a number"}}, 400)
+        if "sort" in args:
+            filters["sort"] = args["sort"]
+
+        def run() -> Response:
+            try:
+                with self.library.lock:
+                    page = query(self.library, limit=limit, cursor=args.get("cursor") or None, **filters)
+                    items = [to_dict(item) for item in page.items]
+            except ValueError as e:
+                return json_response({"ok": False, "msg": str(e)}, 400)
+            return json_response({"items": items, "next_cursor": page.next_cursor, "total": page.total})
+
+        return await self._run(run)
+
+    def _login(self, username: str) -> Response:
+        token = secrets.token_urlsafe(32)
+        self.sessions[token] = (username, time.monotonic() + SESSION_TTL)
+        while len(self.sessions) > MAX_SESSIONS:
+            self.sessions.popitem(last=False)
+        response = json_response({"ok": True})
+        response.headers["Set-Cookie"] = f"{SESSION_COOKIE}={token}; HttpOnly; Path=/; SameSite=Lax"
+        return response
+
+    # --- Routes ---
+
+    async def api_me(self, request: Request) -> Response:
+        return json_response({"user": request.user})
+
+    async def list_books(self, request: Request) -> Response:
+        a = request.args
+        return await self._list(queries.query_books, lambda b: b.to_dict(), request, q=a.get("q"), title=a.get("title"),
+                          author=a.get("author"), isbn=a.get("isbn") or None, available=_bool_arg(a, "available"))
+
+    async def add_book(self, request: Request) -> Response:
+        self._require_login(request)
+        book, errors = bulk.validate_book(await request.json())
+        if errors:
+            return json_response({"ok": False, "errors": errors}, 400)
+        await self._run(self.library.add_book, book)
+        self.persist()
+        return json_response({"ok": True, "msg": "Book added"})
+
+    async def update_book(self, request: Request) -> Response:
+        self._require_login(request)
+        isbn = request.params["isbn"]
+        data = await request.json()
+        if self.library.get_book(isbn) is None:
+            return json_response({"ok": False, "msg": "Book not found"}, 404)
+        copies = data.get("copies")
+        c = None
+        if copies is not None:
+            try:
+                c = int(copies)
+            except Exception:
+                return json_response({"ok": False, "errors": {"copies": "Invalid number"}}, 400)
+            if c < 0:
+                return json_response({"ok": False, "errors": {"copies": "Copies must be >= 0"}}, 400)
+        await self._run(self.library.update_book, isbn, title=data.get("title"), author=data.get("author"), copies=c)
+        self.persist()
+        return json_response({"ok": True, "msg": "Book updated"})
+
+    async def remove_book(self, request: Request) -> Response:
+        self._require_login(request)
+        if await self._run(self.library.remove_book, request.params["isbn"]):
+            self.persist()
+            return json_response({"ok": True, "msg": "Book removed"})
+        return json_response({"ok": False, "msg": "Book not found"}, 404)
+
+    async def books_bulk(self, request: Request) -> Response:
+        """Spools the body to a temporary file, then imports it in an executor thread."""
+        self._require_login(request)
+        fmt = (request.args.get("format") or "").lower()
+        if not fmt:
+            fmt = "csv" if request.mimetype in ("text/csv", "application/csv") else "ndjson"
+        if fmt not in bulk.FORMATS:
+            return json_response({"ok": False, "msg": f"Unsupported format '{fmt}'"}, 400)
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+            async for chunk in request.chunks():
+                spool.write(chunk)
+            spool.seek(0)
+
+            def run() -> bulk.ImportReport:
+                stream = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+                try:
+                    return bulk.import_books(self.library, bulk.read_rows(stream, fmt), commit=self.persist)
+                finally:
+                    stream.detach()
+
+            report = await self._run(run)
+        return json_response({"ok": report.failed == 0, **report.to_dict()})
+
+    async def books_export(self, request: Request) -> Response:
+        fmt = (request.args.get("format") or "ndjson").lower()
+        if fmt not in bulk.FORMATS:
+            return json_response({"ok": False, "msg": f"Unsupported format '{fmt}'"}, 400)
+        chunks = bulk.encode_rows(bulk.iter_books(self.library), fmt, bulk.BOOK_FIELDS)
+        return Response(content_type="text/csv" if fmt == "csv" else "application/x-ndjson", stream=chunks)
+
+    async def list_members(self, request: Request) -> Response:
+        return await self._list(queries.query_members, lambda m: m.to_dict(), request, q=request.args.get("q"))
+
+    async def add_member(self, request: Request) -> Response:
+        member, errors = bulk.validate_member(await request.json())
+        if errors:
+            return json_response({"ok": False, "errors": errors}, 400)
+        await self._run(self.library.add_member, member)
+        self.persist()
+        return json_response({"ok": True, "msg": "Member added"})
+
+    async def update_member(self, request: Request) -> Response:
+        self._require_login(request)
+        member_id = request.params["member_id"]
+        data = await request.json()
+        if self.library.get_member(member_id) is None:
+            return json_response({"ok": False, "msg": "Member not found"}, 404)
+        name = data.get("name")
+        if name is None:
+            return json_response({"ok": False, "msg": "Nothing to update"}, 400)
+        name = (name or "").strip()
+        if not name:
+            return json_response({"ok": False, "errors": {"name": "Name is required."}}, 400)
+        await self._run(self.library.rename_member, member_id, name)
+        self.persist()
+        return json_response({"ok": True, "msg": "Member updated"})
+
+    async def remove_member(self, request: Request) -> Response:
+        self._require_login(request)
+        member_id = request.params["member_id"]
+        member = self.library.get_member(member_id)
+        if member is None:
+            return json_response({"ok": False, "msg": "Member not found"}, 404)
+
+        def remove() -> Optional[bool]:
+            # removing the member cancels their holds, so their books are locked too
+            with self.library.lock_member(member_id):
+                if member.borrowed_books:
+                    return None
+                return self.library.remove_member(member_id)
+
+        removed = await self._run(remove)
+        if removed is None:
+            return json_response({"ok": False, "msg": "Member has borrowed books"}, 400)
+        if not removed:
+            return json_response({"ok": False, "msg": "Member not found"}, 404)
+        self.persist()
+        return json_response({"ok": True, "msg": "Member removed"})
+
+    async def _circulate(self, request: Request, action: Callable) -> Response:
+        data = await request.json()
+        member_id, isbn = data.get("member_id"), data.get("isbn")
+        if not member_id or not isbn:
+            return json_response({"ok": False, "msg": "member_id and isbn required"}, 400)
+        member = self.library.get_member(member_id)
+        if member is None:
+            return json_response({"ok": False, "msg": "Member not found"}, 404)
+        ok, msg = await self._run(action, self.library, isbn, member)
+        self.persist()
+        return json_response({"ok": ok, "msg": msg})
+
+    async def issue(self, request: Request) -> Response:
+        return await self._circulate(request, issue_book)
+
+    async def return_(self, request: Request) -> Response:
+        return await self._circulate(request, return_book)
+
+    async def _batch(self, request: Request, action: Callable) -> Response:
+        data = await request.json()
+        items, errors = parse_batch_items(data)
+        if errors:
+            return json_response({"ok": False, "errors": errors}, 400)
+        ok, results = await self._run(action, self.library, items, atomic=bool(data.get("atomic", True)))
+        if any(success for success, _ in results):
+            self.persist()
+        return json_response({"ok": ok, "results": [
+            {"member_id": m, "isbn": i, "ok": success, "msg": msg}
+            for (m, i), (success, msg) in zip(items, results)
+        ]})
+
+    async def issue_batch(self, request: Request) -> Response:
+        return await self._batch(request, issue_books)
+
+    async def return_batch(self, request: Request) -> Response:
+        return await self._batch(request, return_books)
+
+    async def stats(self, request: Request) -> Response:
+        kwargs, errors = analytics.parse_report_args(request.args)
+        if errors:
+            return json_response({"ok": False, "errors": errors}, 400)
+        return json_response(await self._run(analytics.circulation_report, self.library, **kwargs))
+
+    def _hold_to_dict(self, hold) -> Dict[str, Any]:
+        return {**hold.to_dict(), "isbn": hold.isbn,
+                "position": self.library.hold_position(hold.member_id, hold.isbn)}
+
+    async def list_holds(self, request: Request) -> Response:
+        member_id, isbn = request.args.get("member_id"), request.args.get("isbn")
+        if not member_id and not isbn:
+            return json_response({"ok": False, "msg": "member_id or isbn required"}, 400)
+
+        def run() -> Response:
+            if member_id:
+                holds = [h for h in self.library.holds_for_member(member_id) if not isbn or h.isbn == isbn]
+            else:
+                holds = self.library.hold_queue(isbn)
+            return json_response({"items": [self._hold_to_dict(h) for h in holds], "total": len(holds)})
+
+        return await self._run(run)
+
+    async def place_hold(self, request: Request) -> Response:
+        data = await request.json()
+        member_id, isbn = data.get("member_id"), data.get("isbn")
+        if not member_id or not isbn:
+            return json_response({"ok": False, "msg": "member_id and isbn required"}, 400)
+        member = self.library.get_member(member_id)
+        if member is None:
+            return json_response({"ok": False, "msg": "Member not found"}, 404)
+        ok, msg = await self._run(place_hold, self.library, isbn, member)
+        if ok:
+            self.persist()
+        return json_response({"ok": ok, "msg": msg})
+
+    async def cancel_hold(self, request: Request) -> Response:
+        member = self.library.get_member(request.params["member_id"])
+        if member is None:
+            return json_response({"ok": False, "msg": "Member not found"}, 404)
+        ok, msg = await self._run(cancel_hold, self.library, request.params["isbn"], member)
+        if not ok:
+            return json_response({"ok": False, "msg": msg}, 404)
+        self.persist()
+        return json_response({"ok": True, "msg": msg})
+
+    async def list_loans(self, request: Request) -> Response:
+        a = request.args
+        return await self._list(queries.query_loans, lambda l: l.to_dict(), request, member_id=a.get("member_id") or None,
+                          isbn=a.get("isbn") or None, returned=_bool_arg(a, "returned"),
+                          overdue=_bool_arg(a, "overdue"))
+
+    async def overdue_loans(self, request: Request) -> Response:
+        args = request.args
+        try:
+            today = date.fromisoformat(args["today"]) if args.get("today") else date.today()
+            limit = int(args["limit"]) if args.get("limit") else None
+        except ValueError:
+            return json_response({"ok": False, "msg": "today must be YYYY-MM-DD and limit a number"}, 400)
+
+        def run() -> Response:
+            loans = self.library.overdue_loans(today, limit=limit)
+            return json_response({
+                "today": today.isoformat(),
+                "items": [{**loan.to_dict(), "days_overdue": (today - loan.due_date).days} for loan in loans],
+                "total": len(loans),
+            })
+
+        return await self._run(run)
+
+    async def get_loan(self, request: Request) -> Response:
+        loan = self.library.loans.get(request.params["loan_id"])
+        if not loan:
+            return json_response({"ok": False, "msg": "Loan not found"}, 404)
+        return json_response(loan.to_dict())
+
+    async def update_loan(self, request: Request) -> Response:
+        self._require_login(request)
+        loan_id = request.params["loan_id"]
+        data = await request.json()
+        if not self.library.loans.get(loan_id):
+            return json_response({"ok": False, "msg": "Loan not found"}, 404)
+        due = None
+        if data.get("due_date") is not None:
+            try:
+                due = datetime.fromisoformat(data["due_date"]).date()
+            except Exception:
+                return json_response({"ok": False, "errors": {"due_date": "Invalid date format, expected YYYY-MM-DD"}}, 400)
+        await self._run(self.library.update_loan, loan_id, due_date=due, returned=data.get("returned"))
+        self.persist()
+        return json_response({"ok": True, "msg": "Loan updated"})
+
+    async def login(self, request: Request) -> Response:
+        data = await request.json()
+        u, p = data.get("username"), data.get("password")
+        if not u or not p:
+            return json_response({"ok": False, "msg": "username/password required"}, 400)
+        # the password hash takes tens of milliseconds; keep it off the event loop
+        ok, retry_after = await self._run(self.auth.attempt_login, u, p, client=request.client)
+        if retry_after:
+            response = json_response({"ok": False, "msg": "Too many login attempts; try again later"}, 429)
+            response.headers["Retry-After"] = str(math.ceil(retry_after))
+            return response
+        if not ok:
+            return json_response({"ok": False})
+        if self.auth.has_changes():
+            # a legacy plaintext password was just hashed
+            self.persist()
+        return self._login(u)
+
+    async def logout(self, request: Request) -> Response:
+        token = self._cookie(request.headers, SESSION_COOKIE)
+        if token:
+            self.sessions.pop(token, None)
+        response = json_response({"ok": True})
+        response.headers["Set-Cookie"] = f"{SESSION_COOKIE}=; Max-Age=0; Path=/"
+        return response
+
+    async def register(self, request: Request) -> Response:
+        data = await request.json()
+        u, p = data.get("username"), data.get("password")
+        if not u or not p:
+            return json_response({"ok": False, "msg": "username/password required"}, 400)
+        if not await self._run(self.auth.register_user, u, p):
+            return json_response({"ok": False})
+        self.persist()
+        return self._login(u)
+
+    async def save(self, request: Request) -> Response:
+        try:
+            await self._run(storage.compact, self.db_path, self.library, self.auth)
+            return json_response({"ok": True})
+        except Exception as e:
+            return json_response({"ok": False, "msg": str(e)}, 500)
+
+
+async def main(host: str, port: int) -> None:
+    library, auth = storage.load_state(DB_PATH, lazy=LAZY_LOAD)
+    if not auth.users:
+        auth.register_user("admin", "admin")
+    # hash plaintext passwords left by older versions once, not on every load
+    if auth.migrate_passwords():
+        storage.commit(DB_PATH, library, auth)
+    app = AsyncApp(library, auth)
+    server = await app.serve(host, port)
+    print(f"Serving /api on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        app.saver.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Asyncio server for the library web API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.host, args.port))
+    except KeyboardInterrupt:
+        pass